@@ -0,0 +1,156 @@
+"""In-memory index of free beds for placing prisoners
+
+CellAllocator loads the Cell table once and keeps, per block_number, a
+max-heap of cells keyed by free beds, plus one heap over all blocks.
+Entries are never updated in place: a change pushes a fresh entry and
+stale ones are skipped when they reach the top, so every placement and
+lookup is O(log n) instead of a scan of all cells.
+
+The index is advisory. Beds are only taken by the guarded UPDATE in
+occupancy.py, so a suggestion that has gone stale fails there with
+CellFullError rather than overfilling a cell.
+"""
+import heapq
+import threading
+
+import occupancy
+
+
+class CellAllocator:
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.RLock()
+        self.cells = None
+
+    def load(self):
+        """(Re)build the index from the Cell table"""
+        rows = self.db.fetchall("SELECT cell_id, block_number, capacity, current_occupancy FROM Cell")
+        with self.lock:
+            # cell_id -> [block_number, capacity, current_occupancy]
+            self.cells = {}
+            self.heaps = {}
+            self.all_cells = []
+            for cell_id, block, capacity, occupied in rows:
+                self._set(cell_id, block, capacity or 0, occupied or 0)
+
+    def invalidate(self):
+        """Drop the index; it is rebuilt on the next lookup"""
+        with self.lock:
+            self.cells = None
+
+    def sync_rows(self, rows):
+        """Record the state of cells after a write, given as rows of the Cells tab"""
+        with self.lock:
+            if self.cells is None:
+                return
+            for cell_id, cell_number, capacity, occupied, block in rows:
+                self._set(cell_id, block, capacity or 0, occupied or 0)
+
+    def remove(self, cell_id):
+        with self.lock:
+            if self.cells is not None:
+                self.cells.pop(cell_id, None)
+
+    def block_of(self, cell_id):
+        with self.lock:
+            self._ensure_loaded()
+            state = self.cells.get(cell_id)
+            return state[0] if state else None
+
+    def free_beds(self, block=None):
+        """Total free beds, in one block or across the prison"""
+        with self.lock:
+            self._ensure_loaded()
+            return sum(max(capacity - occupied, 0) for cell_block, capacity, occupied in self.cells.values()
+                       if block is None or cell_block == block)
+
+    def best_cell(self, block=None):
+        """The cell with the most free beds, in block if given; None if all are full"""
+        with self.lock:
+            self._ensure_loaded()
+            top = self._top(self._heap(block))
+            return top[1] if top else None
+
+    def allocate(self, count, block=None):
+        """Reserve beds for count new prisoners and return their cell ids
+
+        Emptiest cells are filled first, so a bulk intake touches as few cells
+        as possible. Raises CellFullError, reserving nothing, if there are not
+        enough free beds.
+        """
+        with self.lock:
+            self._ensure_loaded()
+            taken = []
+            assignment = []
+            try:
+                while len(assignment) < count:
+                    # Taking beds can compact the heaps, so look the heap up each time
+                    top = self._top(self._heap(block))
+                    if top is None:
+                        where = f" in block {block}" if block is not None else ""
+                        raise occupancy.CellFullError(f"Only {len(assignment)} free beds{where}, "
+                                                      f"{count} needed")
+                    free, cell_id = -top[0], top[1]
+                    beds = min(free, count - len(assignment))
+                    self._take(cell_id, beds)
+                    taken.append((cell_id, beds))
+                    assignment.extend([cell_id] * beds)
+            except occupancy.CellFullError:
+                for cell_id, beds in taken:
+                    self._take(cell_id, -beds)
+                raise
+            return assignment
+
+    def release(self, cell_ids):
+        """Give back beds reserved by allocate() that were not used"""
+        with self.lock:
+            if self.cells is None:
+                return
+            for cell_id in cell_ids:
+                if cell_id in self.cells:
+                    self._take(cell_id, -1)
+
+    def _ensure_loaded(self):
+        if self.cells is None:
+            self.load()
+
+    def _heap(self, block):
+        if block is None:
+            return self.all_cells
+        return self.heaps.get(block, [])
+
+    def _top(self, heap):
+        # Skip entries left behind by later changes to the same cell
+        while heap:
+            negative_free, cell_id, block = heap[0]
+            state = self.cells.get(cell_id)
+            if state is not None and state[0] == block and state[1] - state[2] == -negative_free:
+                if negative_free < 0:
+                    return heap[0]
+                return None
+            heapq.heappop(heap)
+        return None
+
+    def _take(self, cell_id, beds):
+        block, capacity, occupied = self.cells[cell_id]
+        self._set(cell_id, block, capacity, occupied + beds)
+
+    def _set(self, cell_id, block, capacity, occupied):
+        self.cells[cell_id] = [block, capacity, occupied]
+        entry = (-(capacity - occupied), cell_id, block)
+        heapq.heappush(self.heaps.setdefault(block, []), entry)
+        heapq.heappush(self.all_cells, entry)
+        if len(self.all_cells) > 4 * len(self.cells) + 64:
+            self._compact()
+
+    def _compact(self):
+        # Rebuild the heaps without their stale entries
+        self.heaps = {}
+        self.all_cells = []
+        for cell_id, (block, capacity, occupied) in self.cells.items():
+            entry = (-(capacity - occupied), cell_id, block)
+            self.heaps.setdefault(block, []).append(entry)
+            self.all_cells.append(entry)
+        for heap in self.heaps.values():
+            heapq.heapify(heap)
+        heapq.heapify(self.all_cells)
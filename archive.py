@@ -0,0 +1,127 @@
+"""Move cold prisoners and visits out of the hot tables
+
+Deleting a prisoner or a visit in the app only sets its deleted_at, and
+the lists and lookups read live rows only. This job then moves cold rows
+into PrisonerArchive and VisitorArchive (migration 8), one bounded batch
+per transaction so no lock is held for long:
+
+- visits older than the cutoff, and deleted visits;
+- prisoners released before the cutoff, and deleted prisoners, together
+  with their visits. Prisoners with incident reports or medical records
+  stay, since those still refer to them.
+
+Every row moved gets an ARCHIVE entry in the audit log in the same
+transaction. The archive stays queryable through find_archived() and the
+PrisonerHistory and VisitorHistory views.
+
+Usage: python archive.py [--days N] [--batch-size N] [--url URL]
+       python archive.py --find NAME [--url URL]
+"""
+import argparse
+from datetime import date, datetime, timedelta
+
+import audit
+import database
+import releases
+import search
+
+ARCHIVE_AFTER_DAYS = 2 * 365
+BATCH_SIZE = 1000
+
+PRISONER_COLUMNS = ["prisoner_id"] + audit.TABLES['Prisoner'][1] + ["row_version", "deleted_at"]
+VISITOR_COLUMNS = ["visitor_id"] + audit.TABLES['Visitor'][1] + ["deleted_at"]
+
+
+def archive_visits(db, cutoff, batch_size=BATCH_SIZE, user=None):
+    """Move visits before cutoff, and deleted visits, to VisitorArchive; returns how many"""
+    return _archive(db, "Visitor", "visitor_id", "(visit_date < %s OR deleted_at IS NOT NULL)",
+                    [cutoff], batch_size, user)
+
+
+def archive_prisoners(db, cutoff, batch_size=BATCH_SIZE, user=None):
+    """Move prisoners released before cutoff, and deleted prisoners, to PrisonerArchive
+
+    Their visits go along in the same transaction. Returns how many prisoners moved.
+    """
+    condition = """((status=%s AND date_of_release < %s) OR deleted_at IS NOT NULL)
+                   AND NOT EXISTS (SELECT 1 FROM IncidentReport i WHERE i.prisoner_id = Prisoner.prisoner_id)
+                   AND NOT EXISTS (SELECT 1 FROM MedicalRecord m WHERE m.prisoner_id = Prisoner.prisoner_id)"""
+    return _archive(db, "Prisoner", "prisoner_id", condition, [releases.RELEASED_STATUS, cutoff],
+                    batch_size, user)
+
+
+def run(db, cutoff, batch_size=BATCH_SIZE, user=None):
+    """Archive visits, then prisoners; returns (visits moved, prisoners moved)
+
+    The audit entries are made as user, the login name by default.
+    """
+    return archive_visits(db, cutoff, batch_size, user), archive_prisoners(db, cutoff, batch_size, user)
+
+
+def find_archived(db, name, limit=200):
+    """Archived prisoners whose first or last name starts with name, with when they were archived"""
+    pattern = search.escape_like(name) + '%'
+    return db.fetchall(f"""SELECT {', '.join(PRISONER_COLUMNS[:10])}, archived_at FROM PrisonerArchive
+                           WHERE last_name LIKE %s ESCAPE '!' OR first_name LIKE %s ESCAPE '!'
+                           ORDER BY last_name, first_name LIMIT %s""", (pattern, pattern, limit))
+
+
+def _archive(db, table, primary_key, condition, params, batch_size, user):
+    moved = 0
+    last_id = None
+    while True:
+        with db.cursor() as cursor:
+            # Keyset over the primary key, so rows that must stay are not read again
+            after = f" AND {primary_key} > %s" if last_id is not None else ""
+            cursor.execute(f"""SELECT {primary_key} FROM {table} WHERE {condition}{after}
+                               ORDER BY {primary_key} LIMIT %s""" + db.for_update,
+                           params + ([last_id] if last_id is not None else []) + [batch_size])
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                break
+
+            archived_at = datetime.now().replace(microsecond=0)
+            in_ids = f"IN ({', '.join(['%s'] * len(ids))})"
+            if table == "Prisoner":
+                _move(cursor, "Visitor", VISITOR_COLUMNS, f"prisoner_id {in_ids}", ids, archived_at, user)
+                _move(cursor, "Prisoner", PRISONER_COLUMNS, f"prisoner_id {in_ids}", ids, archived_at, user)
+            else:
+                _move(cursor, "Visitor", VISITOR_COLUMNS, f"visitor_id {in_ids}", ids, archived_at, user)
+        moved += len(ids)
+        last_id = ids[-1]
+        if len(ids) < batch_size:
+            break
+    return moved
+
+
+def _move(cursor, table, columns, where, params, archived_at, user):
+    names = ", ".join(columns)
+    audit.record_archived(cursor, table, where, params, archived_at, user)
+    cursor.execute(f"""INSERT INTO {table}Archive ({names}, archived_at)
+                       SELECT {names}, %s FROM {table} WHERE {where}""", [archived_at] + params)
+    cursor.execute(f"DELETE FROM {table} WHERE {where}", params)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old visits and released prisoners")
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                        help="archive visits and releases older than this many days")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--find', metavar='NAME', help="list archived prisoners by name instead")
+    parser.add_argument('--url', default=database.DATABASE_URL, help="database url, MySQL by default")
+    args = parser.parse_args()
+
+    db = database.connect(args.url)
+    try:
+        if args.find:
+            for row in find_archived(db, args.find):
+                print("\t".join("" if value is None else str(value) for value in row))
+        else:
+            visits, prisoners = run(db, date.today() - timedelta(days=args.days), args.batch_size)
+            print(f"Archived {visits} visits and {prisoners} prisoners")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
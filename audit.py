@@ -0,0 +1,207 @@
+"""Append-only audit log of the writes made through the app
+
+Every add, update and delete is recorded in AuditLog (migration 6) with
+who made it and before and after images of the columns it changed, as
+JSON. Bulk writes are recorded in their own transaction instead: an
+import as one IMPORT entry per batch, the archive job as one ARCHIVE
+entry per row moved. The form's write only queues the entry: AuditWriter's own thread
+inserts queued entries in batches, so auditing adds no round trip to a
+submit. The queue is bounded; when the database falls behind, writes
+wait for room rather than drop entries. Entries still queued when the
+process dies are lost, so the app closes the writer on exit.
+
+Usage: python audit.py TABLE ID [--url URL]
+"""
+import argparse
+import getpass
+import json
+import queue
+import sys
+import threading
+import time
+from datetime import date, datetime, time as time_of_day, timedelta
+from decimal import Decimal
+
+import database
+
+MAX_QUEUED = 10000
+BATCH_SIZE = 500
+RETRY_SECONDS = 5
+
+# table -> (primary key, audited columns)
+TABLES = {
+    'Prisoner': ("prisoner_id", ["first_name", "last_name", "gender", "date_of_birth",
+                                 "date_of_incarceration", "date_of_release", "crime_committed",
+                                 "status", "cell_id"]),
+    'Cell': ("cell_id", ["cell_number", "capacity", "current_occupancy", "block_number"]),
+    'Visitor': ("visitor_id", ["prisoner_id", "first_name", "last_name", "relationship",
+                               "visit_date", "visit_time"]),
+    'Staff': ("staff_id", ["first_name", "last_name", "gender", "date_of_birth", "role", "salary",
+                           "hire_date"]),
+    'IncidentReport': ("report_id", ["prisoner_id", "staff_id", "incident_date", "incident_description"]),
+    'MedicalRecord': ("medical_id", ["prisoner_id", "doctor_id", "date_of_examination", "diagnosis",
+                                     "treatment"]),
+}
+# Tables whose deletes only set deleted_at, see archive.py
+SOFT_DELETED_TABLES = ("Prisoner", "Visitor")
+
+
+def image(table, values):
+    """{column: value} for values given in the order of the table's audited columns"""
+    return dict(zip(TABLES[table][1], values))
+
+
+def read_row(db, cursor, table, key):
+    """The audited columns of a row as {column: value}, locked on MySQL; None if it is gone or deleted"""
+    primary_key, columns = TABLES[table]
+    live = " AND deleted_at IS NULL" if table in SOFT_DELETED_TABLES else ""
+    cursor.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE {primary_key}=%s" + live + db.for_update,
+                   (key,))
+    row = cursor.fetchone()
+    return dict(zip(columns, row)) if row is not None else None
+
+
+def changes(before, after):
+    """(before image, after image) of the columns that differ; either row may be None
+
+    An update compares only the columns present in after.
+    """
+    before = {column: _plain(value) for column, value in (before or {}).items()}
+    after = {column: _plain(value) for column, value in (after or {}).items()}
+    if not before or not after:
+        return ({column: value for column, value in before.items() if value is not None},
+                {column: value for column, value in after.items() if value is not None})
+    changed = [column for column in after if before.get(column) != after[column]]
+    return ({column: before.get(column) for column in changed},
+            {column: after[column] for column in changed})
+
+
+def record_bulk(cursor, table, key, after, user=None):
+    """Write one IMPORT entry for a batch of rows inserted in cursor's transaction"""
+    cursor.execute("""INSERT INTO AuditLog (changed_at, changed_by, table_name, row_id, action,
+                      before_image, after_image) VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+                   (datetime.now().replace(microsecond=0), user or getpass.getuser(), table,
+                    str(key)[:64], "IMPORT", None, json.dumps(after)))
+
+
+def record_archived(cursor, table, where, params, archived_at, user=None):
+    """Write an ARCHIVE entry for every row of table matching where, before they are moved"""
+    primary_key = TABLES[table][0]
+    cursor.execute(f"""INSERT INTO AuditLog (changed_at, changed_by, table_name, row_id, action)
+                       SELECT %s, %s, %s, CAST({primary_key} AS CHAR), %s FROM {table} WHERE {where}""",
+                   [archived_at, user or getpass.getuser(), table, "ARCHIVE"] + list(params))
+
+
+def history(db, table, key):
+    """(changed_at, changed_by, action, before, after) for a row, oldest first"""
+    rows = db.fetchall("""SELECT changed_at, changed_by, action, before_image, after_image
+                          FROM AuditLog WHERE table_name=%s AND row_id=%s ORDER BY audit_id""",
+                       (table, str(key)))
+    return [(changed_at, changed_by, action, json.loads(before or "{}"), json.loads(after or "{}"))
+            for changed_at, changed_by, action, before, after in rows]
+
+
+class AuditWriter:
+    """Queues audit entries and inserts them in batches from a thread of its own"""
+    def __init__(self, db, user=None, max_queued=MAX_QUEUED, batch_size=BATCH_SIZE):
+        self.db = db
+        self.user = user or getpass.getuser()
+        self.batch_size = batch_size
+        self.queue = queue.Queue(max_queued)
+        self.last_error = None
+        self.thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self.thread.start()
+
+    def record(self, table, key, before, after):
+        """Queue the change of one row from before to after, as {column: value} or None
+
+        Call it once the write has committed. Updates that changed nothing
+        are not recorded.
+        """
+        if before is None:
+            action = "INSERT"
+        elif after is None:
+            action = "DELETE"
+        else:
+            action = "UPDATE"
+        old, new = changes(before, after)
+        if action == "UPDATE" and not new:
+            return
+        self.queue.put((datetime.now().replace(microsecond=0), self.user, table, str(key), action,
+                        json.dumps(old) if old else None, json.dumps(new) if new else None))
+
+    def flush(self):
+        """Wait until every queued entry has been written"""
+        self.queue.join()
+
+    def close(self, timeout=10):
+        """Write what is queued and stop the thread"""
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            entries = [entry for entry in batch if entry is not None]
+
+            while entries:
+                try:
+                    with self.db.cursor() as cursor:
+                        cursor.executemany("""INSERT INTO AuditLog (changed_at, changed_by, table_name,
+                                              row_id, action, before_image, after_image)
+                                              VALUES (%s, %s, %s, %s, %s, %s, %s)""", entries)
+                    break
+                except Exception as e:
+                    # Keep the entries and try again; the queue fills up meanwhile
+                    self.last_error = e
+                    print(f"Error writing audit log, retrying: {e}", file=sys.stderr)
+                    time.sleep(RETRY_SECONDS)
+
+            for entry in batch:
+                self.queue.task_done()
+            if batch[-1] is None:
+                return
+
+
+def _plain(value):
+    # The same value as read back from MySQL or SQLite, or typed in a form, compares equal
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float, Decimal)):
+        return float(value) if value != int(value) else int(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        seconds = int(value.total_seconds())
+        return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}"
+    if isinstance(value, time_of_day):
+        return value.strftime('%H:%M')
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the audit history of a row")
+    parser.add_argument('table', choices=sorted(TABLES))
+    parser.add_argument('id')
+    parser.add_argument('--url', default=database.DATABASE_URL, help="database url, MySQL by default")
+    args = parser.parse_args()
+
+    db = database.connect(args.url)
+    try:
+        for changed_at, changed_by, action, before, after in history(db, args.table, args.id):
+            print(f"{changed_at}\t{changed_by}\t{action}")
+            for column in sorted(set(before) | set(after)):
+                print(f"\t{column}: {before.get(column)} -> {after.get(column)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""Headless benchmarks of the app's list and CRUD hot paths
+
+Each scenario makes the services.py call one action of the app makes
+(first page of a list, scrolling, searching, adding a prisoner, deleting
+a staff member, ...), the same call the window runs on its worker
+threads, so the numbers cover the queries, the row formatting and the
+cache upkeep but no widgets. Scenarios run against a copy of a
+datagen.py dataset for every scale asked for, so runs are repeatable;
+the pristine dataset is generated once and kept in --data-dir.
+
+For each scenario the report gives p50 and p99 latency and rows handled
+per second. --baseline compares against a stored report and flags any
+scenario whose p50 or p99 grew by more than --tolerance; the exit status
+is then 1. --save-baseline writes this run's report to the baseline file.
+test_benchmark.py runs the same scenarios under pytest-benchmark.
+
+Usage: python benchmark.py [--scale small] [--scale medium] [--seed N] [--repeat N]
+                           [--baseline FILE] [--save-baseline] [--tolerance X]
+                           [--data-dir DIR] [--url URL]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+import database
+import datagen
+import migrations
+import occupancy
+import records
+import scheduling
+import search
+from services import PAGE_SIZE, Services
+
+REPEAT = 50
+TOLERANCE = 0.25
+DATA_DIR = os.path.join(tempfile.gettempdir(), "pms-benchmark")
+
+Scenario = namedtuple('Scenario', 'name setup run')
+SCENARIOS = []
+
+
+def scenario(name, setup=None):
+    """Register run(context, argument) -> rows handled; setup(context, repeat) gives the arguments"""
+    def register(run):
+        SCENARIOS.append(Scenario(name, setup, run))
+        return run
+    return register
+
+
+class Context:
+    """The services a window would hold, plus what the scenarios draw their arguments from"""
+    def __init__(self, db, seed):
+        self.db = db
+        self.rng = random.Random(seed)
+        self.services = Services(db, user="benchmark")
+        self.max_ids = {table: next_id - 1 for table, next_id in datagen.next_ids(db).items()}
+
+    def random_id(self, table):
+        return self.rng.randint(1, max(self.max_ids[table], 1))
+
+    def close(self):
+        self.services.close()
+
+
+# Lists
+
+@scenario("prisoner_list_first_page")
+def _(context, argument):
+    return len(context.services.prisoners.page(limit=PAGE_SIZE))
+
+
+@scenario("prisoner_list_scroll", lambda context, repeat: [context.random_id('Prisoner') for i in range(repeat)])
+def _(context, after):
+    return len(context.services.prisoners.page(after=after))
+
+
+@scenario("prisoner_search", lambda context, repeat: [context.rng.choice(datagen.LAST_NAMES)[:3]
+                                                      for i in range(repeat)])
+def _(context, name):
+    conditions, params = search.prisoner_filter(name=name, status="Incarcerated")
+    return len(context.services.prisoners.page(conditions=conditions, params=params))
+
+
+@scenario("visitor_list_first_page")
+def _(context, argument):
+    return len(context.services.visitors.page())
+
+
+@scenario("visitor_list_scroll", lambda context, repeat: [context.random_id('Visitor') for i in range(repeat)])
+def _(context, after):
+    return len(context.services.visitors.page(after=after))
+
+
+@scenario("incident_list_first_page")
+def _(context, argument):
+    return len(context.services.incidents.page())
+
+
+@scenario("medical_list_first_page")
+def _(context, argument):
+    return len(context.services.medical.page())
+
+
+@scenario("cell_list")
+def _(context, argument):
+    return len(context.services.cells.list())
+
+
+@scenario("cell_list_uncached")
+def _(context, argument):
+    context.services.cell_cache.invalidate()
+    return len(context.services.cells.list())
+
+
+@scenario("staff_list")
+def _(context, argument):
+    return len(context.services.staff.list())
+
+
+# Writes
+
+@scenario("add_prisoner")
+def _(context, argument):
+    cell_id = context.services.prisoners.suggest_cell()
+    written = context.services.prisoners.add({
+        "first_name": "Bench", "last_name": "Mark", "gender": "Male", "date_of_birth": "1990-01-01",
+        "date_of_incarceration": "2025-01-01", "date_of_release": "2030-01-01", "crime_committed": "Theft",
+        "status": occupancy.OCCUPYING_STATUS, "cell_id": cell_id})
+    return len(written.rows)
+
+
+def _live_prisoners(context, repeat):
+    # (prisoner_id, record as the form would submit it, row_version)
+    ids = context.db.fetchall("""SELECT prisoner_id FROM Prisoner
+                                 WHERE status=%s AND deleted_at IS NULL""", (occupancy.OCCUPYING_STATUS,))
+    arguments = []
+    for (prisoner_id,) in context.rng.sample(ids, min(repeat, len(ids))):
+        row = context.services.prisoners.get(prisoner_id)[0]
+        arguments.append((prisoner_id, dict(zip(records.PRISONER_COLUMNS, row[1:10])), row[11]))
+    return arguments
+
+
+@scenario("update_prisoner", _live_prisoners)
+def _(context, argument):
+    prisoner_id, record, version = argument
+    record["crime_committed"] = "Updated by benchmark"
+    return len(context.services.prisoners.update(prisoner_id, record, version).rows)
+
+
+@scenario("delete_prisoner", _live_prisoners)
+def _(context, argument):
+    context.services.prisoners.delete(argument[0])
+    return 1
+
+
+def _new_staff(context, repeat):
+    # Staff without incidents or exams, so every delete goes through
+    record = {"first_name": "Bench", "last_name": "Mark", "gender": "Male", "date_of_birth": "1980-01-01",
+              "role": "Guard", "salary": 40000, "hire_date": "2020-01-01"}
+    return [context.services.staff.add(record).key for i in range(repeat)]
+
+
+@scenario("delete_staff", _new_staff)
+def _(context, staff_id):
+    context.services.staff.delete(staff_id)
+    return 1
+
+
+@scenario("add_visitor", lambda context, repeat: [
+    (context.random_id('Prisoner'), datagen.AS_OF + timedelta(days=context.rng.randint(1, 365)),
+     context.rng.choice(scheduling.SLOTS)[0]) for i in range(repeat)])
+def _(context, argument):
+    prisoner_id, visit_date, visit_time = argument
+    try:
+        written = context.services.visitors.add({
+            "prisoner_id": prisoner_id, "first_name": "Bench", "last_name": "Mark", "relationship": "Friend",
+            "visit_date": visit_date, "visit_time": visit_time})
+    except (scheduling.SlotFullError, ValueError):
+        # A full room or a prisoner without a cell is a normal outcome
+        return 0
+    return len(written.rows)
+
+
+# Reports
+
+@scenario("prisoner_profile", lambda context, repeat: [context.random_id('Prisoner') for i in range(repeat)])
+def _(context, prisoner_id):
+    profile = context.services.prisoners.profile(prisoner_id)
+    if profile is None:
+        return 0
+    return 1 + len(profile.visits) + len(profile.incidents) + len(profile.medical)
+
+
+@scenario("free_slots_week")
+def _(context, argument):
+    context.services.visit_index.clear()
+    return len(context.services.visitors.free_slots(datagen.AS_OF))
+
+
+@scenario("release_forecast")
+def _(context, argument):
+    due, forecast = context.services.prisoners.due_releases(datagen.AS_OF)
+    return len(due) + len(forecast)
+
+
+@scenario("dashboard_rebuild")
+def _(context, argument):
+    snapshot, doctors = context.services.dashboard_snapshot(rebuild=True)
+    return len(snapshot['occupancy']) + len(snapshot['exams'])
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list"""
+    return sorted_values[max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)]
+
+
+def run_scenarios(db, seed=0, repeat=REPEAT, names=None):
+    """{scenario: {p50_ms, p99_ms, rows_per_sec, runs}} for the registered scenarios"""
+    context = Context(db, seed)
+    results = {}
+    try:
+        for name, setup, run in SCENARIOS:
+            if names and name not in names:
+                continue
+            arguments = setup(context, repeat + 1) if setup else [None] * (repeat + 1)
+            # The first run warms caches and connections and is not counted
+            run(context, arguments[0])
+            timings = []
+            rows = 0
+            for argument in arguments[1:]:
+                start = time.perf_counter()
+                rows += run(context, argument)
+                timings.append(time.perf_counter() - start)
+            if not timings:
+                continue
+            timings.sort()
+            results[name] = {
+                'p50_ms': round(percentile(timings, 50) * 1000, 3),
+                'p99_ms': round(percentile(timings, 99) * 1000, 3),
+                'rows_per_sec': round(rows / sum(timings), 1) if sum(timings) else 0.0,
+                'runs': len(timings),
+            }
+    finally:
+        context.close()
+    return results
+
+
+def prepare_dataset(scale_name, seed, data_dir=DATA_DIR):
+    """Path of a fresh copy of the datagen dataset for a scale, generating it the first time"""
+    os.makedirs(data_dir, exist_ok=True)
+    pristine = os.path.join(data_dir, f"pms-{scale_name}-{seed}.db")
+    if not os.path.exists(pristine):
+        building = pristine + ".part"
+        if os.path.exists(building):
+            os.remove(building)
+        db = database.connect(f"sqlite:///{building}")
+        try:
+            migrations.migrate(db)
+            datagen.generate(db, datagen.SCALES[scale_name], seed)
+        finally:
+            db.close()
+        os.replace(building, pristine)
+
+    handle, path = tempfile.mkstemp(suffix=".db", prefix=f"pms-{scale_name}-")
+    os.close(handle)
+    shutil.copyfile(pristine, path)
+    return path
+
+
+def regressions(report, baseline, tolerance=TOLERANCE):
+    """(scale, scenario, metric, baseline value, value) for every latency that grew beyond tolerance"""
+    found = []
+    for scale_name, results in report.items():
+        for name, result in results.items():
+            expected = baseline.get(scale_name, {}).get(name)
+            if not expected:
+                continue
+            for metric in ('p50_ms', 'p99_ms'):
+                if expected.get(metric) and result[metric] > expected[metric] * (1 + tolerance):
+                    found.append((scale_name, name, metric, expected[metric], result[metric]))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app's list and CRUD hot paths")
+    parser.add_argument('--scale', action='append', choices=sorted(datagen.SCALES),
+                        help="dataset scale; repeat for several (default small)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=REPEAT, help="timed runs per scenario")
+    parser.add_argument('--scenario', action='append', help="run only this scenario; may be repeated")
+    parser.add_argument('--baseline', help="JSON report to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="write this run's report to --baseline")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help="allowed latency growth over the baseline, 0.25 = 25%%")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="where generated datasets are kept")
+    parser.add_argument('--url', help="benchmark this already seeded database instead, e.g. MySQL")
+    args = parser.parse_args()
+
+    report = {}
+    if args.url:
+        targets = [("url", args.url, None)]
+    else:
+        targets = []
+        for scale_name in args.scale or ['small']:
+            path = prepare_dataset(scale_name, args.seed, args.data_dir)
+            targets.append((scale_name, f"sqlite:///{path}", path))
+
+    for scale_name, url, path in targets:
+        db = database.connect(url)
+        try:
+            report[scale_name] = run_scenarios(db, args.seed, args.repeat, args.scenario)
+        finally:
+            db.close()
+            if path:
+                os.remove(path)
+
+        print(f"\n{scale_name}")
+        print(f"{'scenario':28s} {'p50 ms':>10s} {'p99 ms':>10s} {'rows/s':>12s}")
+        for name, result in report[scale_name].items():
+            print(f"{name:28s} {result['p50_ms']:10.3f} {result['p99_ms']:10.3f} {result['rows_per_sec']:12.1f}")
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        found = regressions(report, baseline, args.tolerance)
+        if found:
+            print("\nRegressions:")
+            for scale_name, name, metric, expected, value in found:
+                print(f"{scale_name} {name} {metric}: {expected} -> {value}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
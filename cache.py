@@ -0,0 +1,163 @@
+"""Read-through cache for small lookup tables such as Cell and Staff
+
+TableCache holds rows keyed by primary key. Entries expire after a TTL
+and the least recently used ones are dropped beyond max_entries. The
+app's own writes call invalidate() for the keys they touched; all() then
+re-reads only those keys instead of the whole table.
+
+LoaderCache does the same for values built by a function, such as the
+prisoner profiles in prisoner_profile.py.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+TTL = 300
+MAX_ENTRIES = 10000
+
+
+class TableCache:
+    def __init__(self, db, table, primary_key, columns, ttl=TTL, max_entries=MAX_ENTRIES):
+        self.db = db
+        self.primary_key = primary_key
+        self.query = f"SELECT {', '.join(columns)} FROM {table}"
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        # primary key -> (row, expires at), least recently used first
+        self.rows = OrderedDict()
+        # all() may answer from self.rows until this time
+        self.complete_until = 0
+        # Keys written since they were cached; all() re-reads them
+        self.dirty = set()
+        # Bumped by every invalidate() so a read that raced a write is not cached
+        self.version = 0
+
+    def get(self, key):
+        """The row with this primary key, or None"""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """Rows for several primary keys in at most one query, as {key: row}"""
+        keys = set(keys)
+        found = {}
+        with self.lock:
+            now = time.monotonic()
+            for key in keys:
+                entry = self.rows.get(key)
+                if entry is not None and entry[1] > now and key not in self.dirty:
+                    self.rows.move_to_end(key)
+                    found[key] = entry[0]
+            missing = [key for key in keys if key not in found and key is not None]
+            version = self.version
+
+        if missing:
+            rows = self._select_keys(missing)
+            found.update((row[0], row) for row in rows)
+            with self.lock:
+                if version == self.version:
+                    self._refresh(missing, rows)
+        return found
+
+    def all(self):
+        """Every row, ordered by primary key"""
+        with self.lock:
+            now = time.monotonic()
+            complete = self.complete_until > now
+            dirty = list(self.dirty)
+            version = self.version
+
+        if not complete:
+            rows = self._select(f" ORDER BY {self.primary_key}")
+            with self.lock:
+                if version == self.version:
+                    self.rows.clear()
+                    self.dirty.clear()
+                    for row in rows:
+                        self._store(row)
+                    # A table larger than the cache is read in full every time
+                    if len(rows) <= self.max_entries:
+                        self.complete_until = time.monotonic() + self.ttl
+            return rows
+
+        fresh = self._select_keys(dirty) if dirty else []
+        with self.lock:
+            if version == self.version:
+                self._refresh(dirty, fresh)
+            rows = {key: entry[0] for key, entry in self.rows.items()}
+        for key in dirty:
+            rows.pop(key, None)
+        rows.update((row[0], row) for row in fresh)
+        return [rows[key] for key in sorted(rows)]
+
+    def invalidate(self, *keys):
+        """Forget the given primary keys after a write, or everything if none are given"""
+        with self.lock:
+            self.version += 1
+            if keys:
+                self.dirty.update(keys)
+            else:
+                self.rows.clear()
+                self.dirty.clear()
+                self.complete_until = 0
+
+    def _select(self, clause, params=()):
+        return self.db.fetchall(self.query + clause, params)
+
+    def _select_keys(self, keys):
+        return self._select(f" WHERE {self.primary_key} IN ({', '.join(['%s'] * len(keys))})", keys)
+
+    def _refresh(self, keys, rows):
+        # Replace the cached rows for keys with rows just read; keys without a row were deleted
+        for key in keys:
+            self.rows.pop(key, None)
+            self.dirty.discard(key)
+        for row in rows:
+            self._store(row)
+
+    def _store(self, row):
+        self.rows[row[0]] = (row, time.monotonic() + self.ttl)
+        self.rows.move_to_end(row[0])
+        self.dirty.discard(row[0])
+        while len(self.rows) > self.max_entries:
+            self.rows.popitem(last=False)
+            self.complete_until = 0
+
+
+class LoaderCache:
+    """Values computed by load(key), kept for a TTL with an LRU bound"""
+    def __init__(self, load, ttl=TTL, max_entries=MAX_ENTRIES):
+        self.load = load
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        # key -> (value, expires at), least recently used first
+        self.values = OrderedDict()
+        self.version = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.values.move_to_end(key)
+                return entry[0]
+            version = self.version
+
+        value = self.load(key)
+        with self.lock:
+            if version == self.version:
+                self.values[key] = (value, time.monotonic() + self.ttl)
+                self.values.move_to_end(key)
+                while len(self.values) > self.max_entries:
+                    self.values.popitem(last=False)
+        return value
+
+    def invalidate(self, *keys):
+        """Forget the given keys after a write, or everything if none are given"""
+        with self.lock:
+            self.version += 1
+            if keys:
+                for key in keys:
+                    self.values.pop(key, None)
+            else:
+                self.values.clear()
@@ -1,9 +1,200 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-import mysql.connector
+from tkinter import ttk, messagebox, simpledialog, filedialog
 from datetime import datetime, date
 from tkcalendar import DateEntry
 import re
+import time
+import concurrency
+import database
+import migrations
+import records
+import search
+import typeahead
+from executor import QueryExecutor
+from services import PAGE_SIZE, Services, format_row
+
+# Keyset paging for large lists
+PREFETCH_ROWS = 50
+MAX_WINDOW_ROWS = 1000
+
+# Seconds before a tab's list is reloaded when it is shown again
+TAB_STALE_AFTER = 300
+
+# Milliseconds between full rebuilds of the dashboard metrics
+DASHBOARD_REBUILD_MS = 10 * 60 * 1000
+
+# Milliseconds between runs of the due release batch
+RELEASE_CHECK_MS = 60 * 60 * 1000
+
+def patch_tree_row(tree, key, rows, append=True):
+    """Apply a single written row to a Treeview instead of reloading the list"""
+    iid = str(key)
+    if not rows:
+        if tree.exists(iid):
+            tree.delete(iid)
+    elif tree.exists(iid):
+        tree.item(iid, values=rows[0])
+    elif append:
+        tree.insert('', 'end', iid=iid, values=rows[0])
+
+class KeysetPager:
+    """Keep a bounded window of rows in a Treeview, paged on the primary key"""
+    def __init__(self, tree, fetch_page, run, scrollbar=None, page_size=PAGE_SIZE,
+                 prefetch_rows=PREFETCH_ROWS, max_rows=MAX_WINDOW_ROWS):
+        # fetch_page(after=None, before=None, limit=n) returns rows in key order,
+        # with the primary key in the first column. run(work, on_success, on_failure,
+        # cancellable) calls it off the Tk thread; on_failure(error) runs if it raises.
+        self.tree = tree
+        self.fetch_page = fetch_page
+        self.run = run
+        self.scrollbar = scrollbar
+        self.page_size = page_size
+        self.prefetch_rows = prefetch_rows
+        self.max_rows = max_rows
+        self.has_before = False
+        self.has_after = False
+        self._pending = False
+        self._generation = 0
+
+        self.tree.configure(yscrollcommand=self.on_scroll)
+
+    def reset(self):
+        """Drop the current window and load the first page"""
+        self._generation += 1
+        generation = self._generation
+        self._pending = False
+
+        def show(rows):
+            self.tree.delete(*self.tree.get_children())
+            self.has_before = False
+            self.has_after = len(rows) > self.page_size
+            for row in rows[:self.page_size]:
+                self.tree.insert('', 'end', iid=str(row[0]), values=row)
+
+        self.run(lambda: self.fetch_page(limit=self.page_size + 1),
+                 self._current(generation, show), self._failed(generation), True)
+
+    def patch(self, key, rows):
+        """Apply a written row; new rows only show up once the window reaches the end"""
+        patch_tree_row(self.tree, key, rows, append=not self.has_after)
+
+    def on_scroll(self, first, last):
+        if self.scrollbar is not None:
+            self.scrollbar.set(first, last)
+        if self._pending:
+            return
+
+        children = self.tree.get_children()
+        count = len(children)
+        top = float(first) * count
+        bottom = float(last) * count
+
+        if self.has_after and count - bottom <= self.prefetch_rows:
+            self._pending = True
+            self.load_after(int(children[-1]))
+        elif self.has_before and top <= self.prefetch_rows:
+            self._pending = True
+            self.load_before(int(children[0]))
+
+    def _failed(self, generation):
+        """Error callback that lets scrolling fetch again after a failed page load"""
+        def clear(error):
+            if generation == self._generation:
+                self._pending = False
+        return clear
+
+    def _current(self, generation, callback):
+        """Wrap callback so it is skipped if the window was reset meanwhile"""
+        def apply(rows):
+            if generation == self._generation:
+                self._pending = False
+                callback(rows)
+        return apply
+
+    def load_after(self, last_key):
+        def show(rows):
+            self.has_after = len(rows) > self.page_size
+            for row in rows[:self.page_size]:
+                self.tree.insert('', 'end', iid=str(row[0]), values=row)
+
+            # Trim from the top, keeping the visible rows where they were
+            children = self.tree.get_children()
+            excess = len(children) - self.max_rows
+            if excess > 0:
+                top = self.tree.yview()[0] * len(children)
+                self.tree.delete(*children[:excess])
+                self.has_before = True
+                self.tree.yview_moveto(max(top - excess, 0) / self.max_rows)
+
+        self.run(lambda: self.fetch_page(after=last_key, limit=self.page_size + 1),
+                 self._current(self._generation, show), self._failed(self._generation), False)
+
+    def load_before(self, first_key):
+        def show(rows):
+            self.has_before = len(rows) > self.page_size
+            rows = rows[-self.page_size:]
+            children = self.tree.get_children()
+            top = self.tree.yview()[0] * len(children)
+            for index, row in enumerate(rows):
+                self.tree.insert('', index, iid=str(row[0]), values=row)
+
+            # Trim from the bottom, keeping the visible rows where they were
+            children = self.tree.get_children()
+            excess = len(children) - self.max_rows
+            if excess > 0:
+                self.tree.delete(*children[-excess:])
+                self.has_after = True
+            self.tree.yview_moveto((top + len(rows)) / len(self.tree.get_children()))
+
+        self.run(lambda: self.fetch_page(before=first_key, limit=self.page_size + 1),
+                 self._current(self._generation, show), self._failed(self._generation), False)
+
+class LookupCombobox(ttk.Combobox):
+    """Foreign key field that suggests "id - name" matches from a typeahead.PrefixIndex
+    as the user types; get() returns just the id"""
+    def __init__(self, parent, index, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.index = index
+        self.bind('<KeyRelease>', self.on_key)
+        # Set while the dropdown is opened by typing rather than by the arrow button
+        self.typing = False
+
+    def on_key(self, event):
+        if event.keysym in ('Up', 'Down', 'Return', 'Escape', 'Tab'):
+            return
+        matches = [label for key, label in self.index.search(super().get())]
+        self['values'] = matches
+        if matches:
+            self.post()
+
+    def post(self):
+        """Drop down the matches, leaving the typing cursor in the field"""
+        # Tk focuses the listbox when the dropdown is mapped; a tag after its class
+        # bindings hands the focus back so the next keystroke still goes to the field
+        popdown = self.tk.call('ttk::combobox::PopdownWindow', self._w)
+        if self.tk.call('winfo', 'ismapped', popdown):
+            return
+        listbox = f"{popdown}.f.l"
+        focus_tag = f"Lookup{self._w}"
+        tags = self.tk.splitlist(self.tk.call('bindtags', listbox))
+        if focus_tag not in tags:
+            self.tk.call('bindtags', listbox, (tags[0], tags[1], focus_tag) + tags[2:])
+            self.tk.call('bind', focus_tag, '<Map>', self.register(self.on_dropdown_mapped))
+        self.typing = True
+        self.tk.call('ttk::combobox::Post', self._w)
+
+    def on_dropdown_mapped(self):
+        if self.typing:
+            self.typing = False
+            self.focus_force()
+            self.icursor('end')
+
+    def get(self):
+        return super().get().split(" - ", 1)[0].strip()
+
+    def set_key(self, key):
+        """Show the record with this id, by name if it is in the index"""
+        self.set(self.index.label(key) or key)
 
 class PrisonerManagementSystem:
     def __init__(self, root):
@@ -12,24 +203,38 @@ class PrisonerManagementSystem:
         self.root.geometry("1200x800")
         self.root.configure(bg='#f0f0f0')
         
-        # Database connection
-        self.connection = None
+        # Database connection pool and the services over it; None if the connection failed
+        self.db = None
+        self.services = None
+        self.reported_not_connected = False
+        
+        # Name indexes for the type-ahead id fields, filled in the background
+        self.lookups = {kind: typeahead.PrefixIndex() for kind in typeahead.LOOKUPS}
+        
         self.connect_to_database()
         
+        # Database work runs on worker threads so the window never blocks
+        self.executor = QueryExecutor(self.root, on_busy=self.show_tab_loading)
+        
+        # Closing the window drains the audit queue before the process exits
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        
         # Create main interface
         self.create_main_interface()
         
     def connect_to_database(self):
-        """Connect to MySQL database"""
+        """Open the pooled connection to the database"""
         try:
-            self.connection = mysql.connector.connect(
-                host='localhost',
-                database='pms',
-                user='root',  # Change as needed
-                password='Ali@1234'   # Change as needed
-            )
-            if self.connection.is_connected():
-                print("Successfully connected to MySQL database")
+            self.db = database.connect()
+            print(f"Successfully connected to {self.db.dialect} database")
+            
+            # Bring the schema (indexes etc.) up to date
+            applied = migrations.migrate(self.db)
+            if applied:
+                print(f"Applied schema migrations: {applied}")
+            
+            # Every read and write behind the tabs, shared with the command line tools
+            self.services = Services(self.db)
         except Exception as e:
             messagebox.showerror("Database Error", f"Error connecting to database: {str(e)}")
             
@@ -43,6 +248,15 @@ class PrisonerManagementSystem:
         # Create notebook for tabs
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill='both', expand=True, padx=10, pady=10)
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+        
+        # Tab key -> (frame, title), and when each tab's list was last loaded.
+        # Lists are only loaded once their tab is shown.
+        self.tabs = {}
+        self.tab_loaded_at = {}
+        
+        # Form kind -> (id, row_version) of the record loaded into the form
+        self.form_versions = {}
         
         # Create tabs for each table
         self.create_prisoner_tab()
@@ -51,11 +265,164 @@ class PrisonerManagementSystem:
         self.create_staff_tab()
         self.create_incident_tab()
         self.create_medical_tab()
+        self.create_search_tab()
+        self.create_dashboard_tab()
+        
+        # Load the tab shown at startup
+        self.on_tab_changed(None)
+        if self.services is None:
+            # The connection error has been shown; leave the background jobs off
+            return
+        self.load_lookups()
+        self.root.after(DASHBOARD_REBUILD_MS, self.rebuild_dashboard_periodically)
+        self.release_due_periodically()
+        
+    def load_lookups(self, *kinds):
+        """Build the type-ahead name indexes in the background"""
+        for kind in kinds or typeahead.LOOKUPS:
+            self.run_query(f"{kind}_lookup", lambda kind=kind: self.lookups[kind].load(self.db, kind),
+                           lambda result: None, "Error loading names", cancellable=False)
+    
+    def update_lookup(self, kind, key, rows):
+        """Keep a type-ahead index in step with a written row, or [] after a delete"""
+        if rows:
+            self.lookups[kind].add(*typeahead.LOOKUPS[kind][1](rows[0]))
+        else:
+            self.lookups[kind].remove(key)
+    
+    def dashboard_changed(self):
+        """The services applied a write to the dashboard metrics; redraw the tab when next shown"""
+        self.tab_loaded_at.pop('dashboard', None)
+    
+    def rebuild_dashboard_periodically(self):
+        """Rebuild the dashboard from the tables, catching writes made outside this window"""
+        def rebuilt(result):
+            self.tab_loaded_at.pop('dashboard', None)
+            if self.notebook.select() == str(self.tabs['dashboard'][0]):
+                self.on_tab_changed(None)
+        
+        self.run_query('dashboard', lambda: self.services.dashboard.rebuild(), rebuilt,
+                       "Error rebuilding dashboard", cancellable=False)
+        self.root.after(DASHBOARD_REBUILD_MS, self.rebuild_dashboard_periodically)
+    
+    def form_version(self, kind, key, listed_version):
+        """Row version the form's contents were loaded at, or the listed one if another row was loaded"""
+        loaded = self.form_versions.get(kind)
+        return loaded[1] if loaded and loaded[0] == key else listed_version
+    
+    def show_conflict(self, error):
+        """Show what another officer saved while this one edited, and let them choose which to keep"""
+        kind = error.table.lower()
+        if error.current is None:
+            messagebox.showerror("Error", str(error))
+            if kind == 'prisoner':
+                self.prisoner_pager.patch(error.key, [])
+            else:
+                patch_tree_row(self.staff_tree, error.key, [])
+            getattr(self, f"clear_{kind}_form")()
+            return
+        
+        window = tk.Toplevel(self.root)
+        window.title("Edit Conflict")
+        window.geometry("600x350")
+        window.transient(self.root)
+        window.grab_set()
+        
+        ttk.Label(window, text=f"{error}. These fields differ:").pack(anchor='w', padx=10, pady=5)
+        
+        def save_mine():
+            window.destroy()
+            self.form_versions[kind] = (error.key, error.version)
+            getattr(self, f"update_{kind}")()
+        
+        def load_theirs():
+            window.destroy()
+            self.reload_record(kind, error.key)
+        
+        button_frame = ttk.Frame(window)
+        button_frame.pack(side='bottom', pady=5)
+        ttk.Button(button_frame, text="Save Mine", command=save_mine).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Load Theirs", command=load_theirs).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Cancel", command=window.destroy).pack(side='left', padx=5)
+        
+        columns = ("Field", "Saved by Another User", "Your Value")
+        tree = ttk.Treeview(window, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=180)
+        for column, theirs, yours in error.differences():
+            tree.insert('', 'end', values=(column, "" if theirs is None else theirs,
+                                           "" if yours is None else yours))
+        tree.pack(fill='both', expand=True, padx=10)
+    
+    def reload_record(self, kind, key):
+        """Show the saved version of a prisoner or staff member in its list and form"""
+        def work():
+            if kind == 'prisoner':
+                return self.fetch_prisoner_row(key)
+            return self.services.staff.get(key, fresh=True)
+        
+        def show(rows):
+            if kind == 'prisoner':
+                self.prisoner_pager.patch(key, rows)
+            else:
+                patch_tree_row(self.staff_tree, key, rows, append=False)
+            if rows:
+                getattr(self, f"load_{kind}_data")(None)
+            else:
+                getattr(self, f"clear_{kind}_form")()
+        
+        self.run_query(kind, work, show, f"Error loading {kind}", cancellable=False)
+    
+    def add_tab(self, key, frame, text):
+        """Add a notebook tab and remember it for loading state and cancellation"""
+        self.notebook.add(frame, text=text)
+        self.tabs[key] = (frame, text)
+    
+    def on_tab_changed(self, event):
+        """Load the shown tab on first use or once stale, and cancel loads of the others"""
+        selected = self.notebook.select()
+        for key, (frame, text) in self.tabs.items():
+            if str(frame) == selected:
+                loaded_at = self.tab_loaded_at.get(key)
+                if loaded_at is None or time.monotonic() - loaded_at > TAB_STALE_AFTER:
+                    self.tab_loaded_at[key] = time.monotonic()
+                    getattr(self, f"refresh_{key}_list")()
+            elif self.executor.cancel(key):
+                # Its load never finished, so load it again next time
+                self.tab_loaded_at.pop(key, None)
+    
+    def show_tab_loading(self, key, busy):
+        if key in self.tabs:
+            frame, text = self.tabs[key]
+            self.notebook.tab(frame, text=f"{text} (loading...)" if busy else text)
+    
+    def run_query(self, key, work, on_success, error_message, cancellable=True, on_failure=None):
+        """Run work() off the Tk thread for the given tab and pass its result to on_success
+
+        on_failure(error) is called before the error is shown, to undo any pending state.
+        """
+        if self.services is None:
+            # Report the missing connection once rather than failing every load
+            if not self.reported_not_connected:
+                self.reported_not_connected = True
+                messagebox.showerror("Database Error", "Not connected to the database")
+            return
+        
+        def on_error(e):
+            if on_failure is not None:
+                on_failure(e)
+            if isinstance(e, concurrency.StaleRecordError):
+                self.show_conflict(e)
+                return
+            messagebox.showerror("Error", f"{error_message}: {str(e)}")
+        
+        self.executor.submit(key, work, on_success, on_error, cancellable)
         
     def create_prisoner_tab(self):
         """Create Prisoner management tab"""
         prisoner_frame = ttk.Frame(self.notebook)
-        self.notebook.add(prisoner_frame, text="Prisoners")
+        self.add_tab('prisoner', prisoner_frame, "Prisoners")
         
         # Create form frame
         form_frame = ttk.LabelFrame(prisoner_frame, text="Prisoner Information", padding=10)
@@ -83,14 +450,16 @@ class PrisonerManagementSystem:
             ttk.Label(form_frame, text=label).grid(row=row, column=col, sticky='w', padx=5, pady=5)
             
             if field == "gender":
-                entry = ttk.Combobox(form_frame, values=["Male", "Female", "Other"], state="readonly")
+                entry = ttk.Combobox(form_frame, values=records.GENDERS, state="readonly")
             elif field == "status":
-                entry = ttk.Combobox(form_frame, values=["Incarcerated", "Released", "Paroled"], state="readonly")
+                entry = ttk.Combobox(form_frame, values=records.PRISONER_STATUSES, state="readonly")
             elif "date" in field:
                 entry = DateEntry(form_frame, width=12, background='darkblue',
                                 foreground='white', borderwidth=2, date_pattern='yyyy-mm-dd')
             elif field == "crime":
                 entry = tk.Text(form_frame, height=3, width=20)
+            elif field == "cell_id":
+                entry = LookupCombobox(form_frame, self.lookups['cell'], width=20)
             else:
                 entry = ttk.Entry(form_frame, width=20)
                 
@@ -109,15 +478,65 @@ class PrisonerManagementSystem:
                   command=self.delete_prisoner).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Clear Form", 
                   command=self.clear_prisoner_form).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Suggest Cell", 
+                  command=self.suggest_cell).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="View Profile", 
+                  command=self.show_prisoner_profile).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Releases...", 
+                  command=self.show_releases).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Archive...", 
+                  command=self.show_archived_prisoners).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Import File...", 
+                  command=lambda: self.import_records('prisoners')).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Export...", 
+                  command=lambda: self.export_records('prisoner')).pack(side='left', padx=5)
+        
+        # Search bar; filters are applied by the database, not the Treeview
+        search_frame = ttk.LabelFrame(prisoner_frame, text="Search Prisoners", padding=10)
+        search_frame.pack(fill='x', padx=10, pady=5)
+        
+        search_fields = [
+            ("Name starts with:", "name"),
+            ("Status:", "status"),
+            ("Cell ID:", "cell_id"),
+            ("Incarcerated from:", "incarcerated_from"),
+            ("to:", "incarcerated_to"),
+            ("Crime keyword:", "crime")
+        ]
+        
+        self.prisoner_search_entries = {}
+        self.prisoner_filter = ([], [])
+        
+        for i, (label, field) in enumerate(search_fields):
+            ttk.Label(search_frame, text=label).grid(row=0, column=i*2, sticky='w', padx=5, pady=5)
+            if field == "status":
+                entry = ttk.Combobox(search_frame, values=[""] + records.PRISONER_STATUSES,
+                                     state="readonly", width=12)
+            else:
+                # Dates are typed as yyyy-mm-dd so they can be left empty
+                entry = ttk.Entry(search_frame, width=12)
+            entry.grid(row=0, column=i*2+1, padx=5, pady=5)
+            entry.bind('<Return>', lambda event: self.search_prisoners())
+            self.prisoner_search_entries[field] = entry
+        
+        search_buttons = ttk.Frame(search_frame)
+        search_buttons.grid(row=1, column=0, columnspan=12, pady=5)
+        
+        ttk.Button(search_buttons, text="Search", 
+                  command=self.search_prisoners).pack(side='left', padx=5)
+        ttk.Button(search_buttons, text="Show All", 
+                  command=self.clear_prisoner_search).pack(side='left', padx=5)
         
         # Treeview for displaying prisoners
         tree_frame = ttk.LabelFrame(prisoner_frame, text="Prisoners List", padding=10)
         tree_frame.pack(fill='both', expand=True, padx=10, pady=5)
         
         columns = ("ID", "First Name", "Last Name", "Gender", "DOB", "Incarceration", 
-                  "Release", "Crime", "Status", "Cell ID")
+                  "Release", "Crime", "Status", "Cell ID", "Cell", "Version")
         
-        self.prisoner_tree = ttk.Treeview(tree_frame, columns=columns, show='headings')
+        # The row version is kept with each row for updates but not shown
+        self.prisoner_tree = ttk.Treeview(tree_frame, columns=columns, show='headings',
+                                          displaycolumns=columns[:-1])
         
         for col in columns:
             self.prisoner_tree.heading(col, text=col)
@@ -126,7 +545,14 @@ class PrisonerManagementSystem:
         # Scrollbars
         v_scrollbar = ttk.Scrollbar(tree_frame, orient='vertical', command=self.prisoner_tree.yview)
         h_scrollbar = ttk.Scrollbar(tree_frame, orient='horizontal', command=self.prisoner_tree.xview)
-        self.prisoner_tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
+        self.prisoner_tree.configure(xscrollcommand=h_scrollbar.set)
+        
+        # Only a window of rows is kept in the tree; more are fetched while scrolling
+        self.prisoner_pager = KeysetPager(
+            self.prisoner_tree, self.fetch_prisoner_page,
+            lambda work, show, failed, cancellable: self.run_query('prisoner', work, show,
+                                                                   "Error loading prisoners", cancellable, failed),
+            scrollbar=v_scrollbar)
         
         self.prisoner_tree.pack(fill='both', expand=True)
         v_scrollbar.pack(side='right', fill='y')
@@ -134,22 +560,20 @@ class PrisonerManagementSystem:
         
         # Bind double-click to load data
         self.prisoner_tree.bind('<Double-1>', self.load_prisoner_data)
-        
-        # Load initial data
-        self.refresh_prisoner_list()
     
     def create_cell_tab(self):
         """Create Cell management tab"""
         cell_frame = ttk.Frame(self.notebook)
-        self.notebook.add(cell_frame, text="Cells")
+        self.add_tab('cell', cell_frame, "Cells")
         
         # Form frame
         form_frame = ttk.LabelFrame(cell_frame, text="Cell Information", padding=10)
         form_frame.pack(fill='x', padx=10, pady=5)
         
         self.cell_entries = {}
+        # Occupancy is kept up to date by the prisoner operations, see occupancy.py
         fields = [("Cell Number:", "cell_number"), ("Capacity:", "capacity"), 
-                 ("Current Occupancy:", "current_occupancy"), ("Block Number:", "block_number")]
+                 ("Block Number:", "block_number")]
         
         for i, (label, field) in enumerate(fields):
             ttk.Label(form_frame, text=label).grid(row=0, column=i*2, sticky='w', padx=5, pady=5)
@@ -165,6 +589,10 @@ class PrisonerManagementSystem:
         ttk.Button(button_frame, text="Update Cell", command=self.update_cell).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Delete Cell", command=self.delete_cell).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Clear Form", command=self.clear_cell_form).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Recount Occupancy", 
+                  command=self.recount_occupancy).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Export...", 
+                  command=lambda: self.export_records('cell')).pack(side='left', padx=5)
         
         # Treeview
         tree_frame = ttk.LabelFrame(cell_frame, text="Cells List", padding=10)
@@ -184,12 +612,11 @@ class PrisonerManagementSystem:
         scrollbar_cell.pack(side='right', fill='y')
         
         self.cell_tree.bind('<Double-1>', self.load_cell_data)
-        self.refresh_cell_list()
     
     def create_visitor_tab(self):
         """Create Visitor management tab"""
         visitor_frame = ttk.Frame(self.notebook)
-        self.notebook.add(visitor_frame, text="Visitors")
+        self.add_tab('visitor', visitor_frame, "Visitors")
         
         # Form frame
         form_frame = ttk.LabelFrame(visitor_frame, text="Visitor Information", padding=10)
@@ -199,7 +626,7 @@ class PrisonerManagementSystem:
         
         # First row
         ttk.Label(form_frame, text="Prisoner ID:").grid(row=0, column=0, sticky='w', padx=5, pady=5)
-        self.visitor_entries["prisoner_id"] = ttk.Entry(form_frame, width=15)
+        self.visitor_entries["prisoner_id"] = LookupCombobox(form_frame, self.lookups['prisoner'], width=15)
         self.visitor_entries["prisoner_id"].grid(row=0, column=1, padx=5, pady=5)
         
         ttk.Label(form_frame, text="First Name:").grid(row=0, column=2, sticky='w', padx=5, pady=5)
@@ -232,12 +659,18 @@ class PrisonerManagementSystem:
         ttk.Button(button_frame, text="Update Visitor", command=self.update_visitor).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Delete Visitor", command=self.delete_visitor).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Clear Form", command=self.clear_visitor_form).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Free Slots", command=self.show_free_slots).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Import File...", 
+                  command=lambda: self.import_records('visitors')).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Export...", 
+                  command=lambda: self.export_records('visitor')).pack(side='left', padx=5)
         
         # Treeview
         tree_frame = ttk.LabelFrame(visitor_frame, text="Visitors List", padding=10)
         tree_frame.pack(fill='both', expand=True, padx=10, pady=5)
         
-        columns = ("ID", "Prisoner ID", "First Name", "Last Name", "Relationship", "Visit Date", "Visit Time")
+        columns = ("ID", "Prisoner ID", "Prisoner", "First Name", "Last Name", "Relationship", 
+                  "Visit Date", "Visit Time")
         self.visitor_tree = ttk.Treeview(tree_frame, columns=columns, show='headings')
         
         for col in columns:
@@ -245,18 +678,22 @@ class PrisonerManagementSystem:
             self.visitor_tree.column(col, width=100)
         
         scrollbar_visitor = ttk.Scrollbar(tree_frame, orient='vertical', command=self.visitor_tree.yview)
-        self.visitor_tree.configure(yscrollcommand=scrollbar_visitor.set)
+        
+        self.visitor_pager = KeysetPager(
+            self.visitor_tree, self.fetch_visitor_page,
+            lambda work, show, failed, cancellable: self.run_query('visitor', work, show,
+                                                                   "Error loading visitors", cancellable, failed),
+            scrollbar=scrollbar_visitor)
         
         self.visitor_tree.pack(fill='both', expand=True)
         scrollbar_visitor.pack(side='right', fill='y')
         
         self.visitor_tree.bind('<Double-1>', self.load_visitor_data)
-        self.refresh_visitor_list()
     
     def create_staff_tab(self):
         """Create Staff management tab"""
         staff_frame = ttk.Frame(self.notebook)
-        self.notebook.add(staff_frame, text="Staff")
+        self.add_tab('staff', staff_frame, "Staff")
         
         # Form frame
         form_frame = ttk.LabelFrame(staff_frame, text="Staff Information", padding=10)
@@ -274,7 +711,7 @@ class PrisonerManagementSystem:
         self.staff_entries["last_name"].grid(row=0, column=3, padx=5, pady=5)
         
         ttk.Label(form_frame, text="Gender:").grid(row=0, column=4, sticky='w', padx=5, pady=5)
-        self.staff_entries["gender"] = ttk.Combobox(form_frame, values=["Male", "Female", "Other"], 
+        self.staff_entries["gender"] = ttk.Combobox(form_frame, values=records.GENDERS, 
                                                    state="readonly", width=12)
         self.staff_entries["gender"].grid(row=0, column=5, padx=5, pady=5)
         
@@ -306,13 +743,16 @@ class PrisonerManagementSystem:
         ttk.Button(button_frame, text="Update Staff", command=self.update_staff).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Delete Staff", command=self.delete_staff).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Clear Form", command=self.clear_staff_form).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Export...", 
+                  command=lambda: self.export_records('staff')).pack(side='left', padx=5)
         
         # Treeview
         tree_frame = ttk.LabelFrame(staff_frame, text="Staff List", padding=10)
         tree_frame.pack(fill='both', expand=True, padx=10, pady=5)
         
-        columns = ("ID", "First Name", "Last Name", "Gender", "DOB", "Role", "Salary", "Hire Date")
-        self.staff_tree = ttk.Treeview(tree_frame, columns=columns, show='headings')
+        columns = ("ID", "First Name", "Last Name", "Gender", "DOB", "Role", "Salary", "Hire Date", "Version")
+        self.staff_tree = ttk.Treeview(tree_frame, columns=columns, show='headings',
+                                       displaycolumns=columns[:-1])
         
         for col in columns:
             self.staff_tree.heading(col, text=col)
@@ -325,12 +765,11 @@ class PrisonerManagementSystem:
         scrollbar_staff.pack(side='right', fill='y')
         
         self.staff_tree.bind('<Double-1>', self.load_staff_data)
-        self.refresh_staff_list()
     
     def create_incident_tab(self):
         """Create Incident Report management tab"""
         incident_frame = ttk.Frame(self.notebook)
-        self.notebook.add(incident_frame, text="Incident Reports")
+        self.add_tab('incident', incident_frame, "Incident Reports")
         
         # Form frame
         form_frame = ttk.LabelFrame(incident_frame, text="Incident Information", padding=10)
@@ -340,11 +779,11 @@ class PrisonerManagementSystem:
         
         # First row
         ttk.Label(form_frame, text="Prisoner ID:").grid(row=0, column=0, sticky='w', padx=5, pady=5)
-        self.incident_entries["prisoner_id"] = ttk.Entry(form_frame, width=15)
+        self.incident_entries["prisoner_id"] = LookupCombobox(form_frame, self.lookups['prisoner'], width=15)
         self.incident_entries["prisoner_id"].grid(row=0, column=1, padx=5, pady=5)
         
         ttk.Label(form_frame, text="Staff ID:").grid(row=0, column=2, sticky='w', padx=5, pady=5)
-        self.incident_entries["staff_id"] = ttk.Entry(form_frame, width=15)
+        self.incident_entries["staff_id"] = LookupCombobox(form_frame, self.lookups['staff'], width=15)
         self.incident_entries["staff_id"].grid(row=0, column=3, padx=5, pady=5)
         
         ttk.Label(form_frame, text="Incident Date:").grid(row=0, column=4, sticky='w', padx=5, pady=5)
@@ -365,12 +804,14 @@ class PrisonerManagementSystem:
         ttk.Button(button_frame, text="Update Incident", command=self.update_incident).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Delete Incident", command=self.delete_incident).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Clear Form", command=self.clear_incident_form).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Export...", 
+                  command=lambda: self.export_records('incident')).pack(side='left', padx=5)
         
         # Treeview
         tree_frame = ttk.LabelFrame(incident_frame, text="Incident Reports List", padding=10)
         tree_frame.pack(fill='both', expand=True, padx=10, pady=5)
         
-        columns = ("ID", "Prisoner ID", "Staff ID", "Description", "Date")
+        columns = ("ID", "Prisoner ID", "Prisoner", "Staff ID", "Staff", "Description", "Date")
         self.incident_tree = ttk.Treeview(tree_frame, columns=columns, show='headings')
         
         for col in columns:
@@ -381,18 +822,22 @@ class PrisonerManagementSystem:
                 self.incident_tree.column(col, width=100)
         
         scrollbar_incident = ttk.Scrollbar(tree_frame, orient='vertical', command=self.incident_tree.yview)
-        self.incident_tree.configure(yscrollcommand=scrollbar_incident.set)
+        
+        self.incident_pager = KeysetPager(
+            self.incident_tree, self.fetch_incident_page,
+            lambda work, show, failed, cancellable: self.run_query('incident', work, show,
+                                                                   "Error loading incidents", cancellable, failed),
+            scrollbar=scrollbar_incident)
         
         self.incident_tree.pack(fill='both', expand=True)
         scrollbar_incident.pack(side='right', fill='y')
         
         self.incident_tree.bind('<Double-1>', self.load_incident_data)
-        self.refresh_incident_list()
     
     def create_medical_tab(self):
         """Create Medical Record management tab"""
         medical_frame = ttk.Frame(self.notebook)
-        self.notebook.add(medical_frame, text="Medical Records")
+        self.add_tab('medical', medical_frame, "Medical Records")
         
         # Form frame
         form_frame = ttk.LabelFrame(medical_frame, text="Medical Record Information", padding=10)
@@ -402,11 +847,11 @@ class PrisonerManagementSystem:
         
         # First row
         ttk.Label(form_frame, text="Prisoner ID:").grid(row=0, column=0, sticky='w', padx=5, pady=5)
-        self.medical_entries["prisoner_id"] = ttk.Entry(form_frame, width=15)
+        self.medical_entries["prisoner_id"] = LookupCombobox(form_frame, self.lookups['prisoner'], width=15)
         self.medical_entries["prisoner_id"].grid(row=0, column=1, padx=5, pady=5)
         
         ttk.Label(form_frame, text="Doctor ID:").grid(row=0, column=2, sticky='w', padx=5, pady=5)
-        self.medical_entries["doctor_id"] = ttk.Entry(form_frame, width=15)
+        self.medical_entries["doctor_id"] = LookupCombobox(form_frame, self.lookups['staff'], width=15)
         self.medical_entries["doctor_id"].grid(row=0, column=3, padx=5, pady=5)
         
         ttk.Label(form_frame, text="Examination Date:").grid(row=0, column=4, sticky='w', padx=5, pady=5)
@@ -431,12 +876,15 @@ class PrisonerManagementSystem:
         ttk.Button(button_frame, text="Update Medical Record", command=self.update_medical).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Delete Medical Record", command=self.delete_medical).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Clear Form", command=self.clear_medical_form).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Export...", 
+                  command=lambda: self.export_records('medical')).pack(side='left', padx=5)
         
         # Treeview
         tree_frame = ttk.LabelFrame(medical_frame, text="Medical Records List", padding=10)
         tree_frame.pack(fill='both', expand=True, padx=10, pady=5)
         
-        columns = ("ID", "Prisoner ID", "Diagnosis", "Treatment", "Exam Date", "Doctor ID")
+        columns = ("ID", "Prisoner ID", "Prisoner", "Diagnosis", "Treatment", "Exam Date", 
+                  "Doctor ID", "Doctor")
         self.medical_tree = ttk.Treeview(tree_frame, columns=columns, show='headings')
         
         for col in columns:
@@ -447,48 +895,125 @@ class PrisonerManagementSystem:
                 self.medical_tree.column(col, width=100)
         
         scrollbar_medical = ttk.Scrollbar(tree_frame, orient='vertical', command=self.medical_tree.yview)
-        self.medical_tree.configure(yscrollcommand=scrollbar_medical.set)
+        
+        self.medical_pager = KeysetPager(
+            self.medical_tree, self.fetch_medical_page,
+            lambda work, show, failed, cancellable: self.run_query('medical', work, show,
+                                                                   "Error loading medical records",
+                                                                   cancellable, failed),
+            scrollbar=scrollbar_medical)
         
         self.medical_tree.pack(fill='both', expand=True)
         scrollbar_medical.pack(side='right', fill='y')
         
         self.medical_tree.bind('<Double-1>', self.load_medical_data)
-        self.refresh_medical_list()
+    
+    def create_dashboard_tab(self):
+        """Create the facility KPI dashboard tab"""
+        dashboard_frame = ttk.Frame(self.notebook)
+        self.add_tab('dashboard', dashboard_frame, "Dashboard")
+        
+        top_frame = ttk.Frame(dashboard_frame)
+        top_frame.pack(fill='x', padx=10, pady=5)
+        
+        self.dashboard_status_label = ttk.Label(top_frame, text="")
+        self.dashboard_status_label.pack(side='left', padx=5)
+        ttk.Button(top_frame, text="Rebuild Now", 
+                  command=lambda: self.refresh_dashboard_list(rebuild=True)).pack(side='right', padx=5)
+        
+        grid_frame = ttk.Frame(dashboard_frame)
+        grid_frame.pack(fill='both', expand=True, padx=10, pady=5)
+        grid_frame.columnconfigure(0, weight=1)
+        grid_frame.columnconfigure(1, weight=1)
+        grid_frame.rowconfigure(0, weight=1)
+        grid_frame.rowconfigure(1, weight=1)
+        
+        panels = [
+            ('headcount', "Headcount by Status", ("Status", "Prisoners")),
+            ('occupancy', "Occupancy by Block", ("Block", "Occupied", "Capacity", "% Full")),
+            ('incidents', "Incidents per Week", ("Week", "Incidents")),
+            ('exams', "Medical Exams per Doctor", ("Doctor", "Exams")),
+        ]
+        
+        self.dashboard_trees = {}
+        for i, (key, title, columns) in enumerate(panels):
+            panel = ttk.LabelFrame(grid_frame, text=title, padding=10)
+            panel.grid(row=i // 2, column=i % 2, sticky='nsew', padx=5, pady=5)
+            
+            tree = ttk.Treeview(panel, columns=columns, show='headings', height=8)
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=120)
+            tree.pack(fill='both', expand=True)
+            self.dashboard_trees[key] = tree
+    
+    def create_search_tab(self):
+        """Create full-text search tab over crimes, incidents and medical records"""
+        search_frame = ttk.Frame(self.notebook)
+        self.add_tab('search', search_frame, "Search Records")
+        
+        # Query frame
+        query_frame = ttk.LabelFrame(search_frame, text="Search", padding=10)
+        query_frame.pack(fill='x', padx=10, pady=5)
+        
+        ttk.Label(query_frame, text="Words:").grid(row=0, column=0, sticky='w', padx=5, pady=5)
+        self.search_query_entry = ttk.Entry(query_frame, width=50)
+        self.search_query_entry.grid(row=0, column=1, padx=5, pady=5)
+        self.search_query_entry.bind('<Return>', lambda event: self.search_records())
+        
+        ttk.Button(query_frame, text="Search", command=self.search_records).grid(row=0, column=2, padx=5)
+        ttk.Button(query_frame, text="Previous", 
+                  command=lambda: self.change_search_page(-1)).grid(row=0, column=3, padx=5)
+        ttk.Button(query_frame, text="Next", 
+                  command=lambda: self.change_search_page(1)).grid(row=0, column=4, padx=5)
+        
+        self.search_page_label = ttk.Label(query_frame, text="")
+        self.search_page_label.grid(row=0, column=5, padx=5)
+        
+        self.search_text = ""
+        self.search_page = 0
+        
+        # Treeview
+        tree_frame = ttk.LabelFrame(search_frame, text="Matches", padding=10)
+        tree_frame.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        columns = ("Source", "Record ID", "Prisoner ID", "Score", "Text")
+        self.search_tree = ttk.Treeview(tree_frame, columns=columns, show='headings')
+        
+        for col in columns:
+            self.search_tree.heading(col, text=col)
+            if col == "Text":
+                self.search_tree.column(col, width=500)
+            else:
+                self.search_tree.column(col, width=100)
+        
+        scrollbar_search = ttk.Scrollbar(tree_frame, orient='vertical', command=self.search_tree.yview)
+        self.search_tree.configure(yscrollcommand=scrollbar_search.set)
+        
+        self.search_tree.pack(fill='both', expand=True)
+        scrollbar_search.pack(side='right', fill='y')
     
     # Prisoner CRUD Operations
     def add_prisoner(self):
         try:
-            cursor = self.connection.cursor()
-            
             # Get values from form
-            values = []
-            for field in ["first_name", "last_name", "gender", "dob", "incarceration_date", 
-                         "release_date", "crime", "status", "cell_id"]:
-                if field == "crime":
-                    value = self.prisoner_entries[field].get("1.0", tk.END).strip()
-                elif "date" in field:
-                    value = self.prisoner_entries[field].get_date()
-                else:
-                    value = self.prisoner_entries[field].get()
-                
-                if field == "cell_id" and value == "":
-                    value = None
-                elif field == "release_date" and value == "":
-                    value = None
-                    
-                values.append(value)
+            record = self.get_prisoner_form()
             
-            query = """INSERT INTO Prisoner (first_name, last_name, gender, date_of_birth, 
-                      date_of_incarceration, date_of_release, crime_committed, status, cell_id) 
-                      VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"""
+            def work():
+                result = self.services.prisoners.add(record)
+                return result, self.fetch_prisoner_row(result.key)
             
-            cursor.execute(query, values)
-            self.connection.commit()
-            
-            messagebox.showinfo("Success", "Prisoner added successfully!")
-            self.clear_prisoner_form()
-            self.refresh_prisoner_list()
+            def written(written):
+                result, listed = written
+                messagebox.showinfo("Success", "Prisoner added successfully!")
+                self.clear_prisoner_form()
+                self.prisoner_pager.patch(result.key, listed)
+                self.update_lookup('prisoner', result.key, result.rows)
+                self.patch_cells(result.cells)
+                self.dashboard_changed()
             
+            self.run_query('prisoner', work, written, "Error adding prisoner", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error adding prisoner: {str(e)}")
     
@@ -499,37 +1024,30 @@ class PrisonerManagementSystem:
             return
         
         try:
-            cursor = self.connection.cursor()
             prisoner_id = self.prisoner_tree.item(selected_item)['values'][0]
+            version = self.form_version('prisoner', prisoner_id,
+                                        self.prisoner_tree.item(selected_item)['values'][11])
             
-            values = []
-            for field in ["first_name", "last_name", "gender", "dob", "incarceration_date", 
-                         "release_date", "crime", "status", "cell_id"]:
-                if field == "crime":
-                    value = self.prisoner_entries[field].get("1.0", tk.END).strip()
-                elif "date" in field:
-                    value = self.prisoner_entries[field].get_date()
-                else:
-                    value = self.prisoner_entries[field].get()
-                
-                if field == "cell_id" and value == "":
-                    value = None
-                elif field == "release_date" and value == "":
-                    value = None
-                    
-                values.append(value)
-            
-            values.append(prisoner_id)
-            query = """UPDATE Prisoner SET first_name=%s, last_name=%s, gender=%s, date_of_birth=%s, 
-                      date_of_incarceration=%s, date_of_release=%s, crime_committed=%s, 
-                      status=%s, cell_id=%s WHERE prisoner_id=%s"""
+            # Get values from form
+            record = self.get_prisoner_form()
             
-            cursor.execute(query, values)
-            self.connection.commit()
+            def work():
+                result = self.services.prisoners.update(prisoner_id, record, version)
+                return result, self.fetch_prisoner_row(prisoner_id)
             
-            messagebox.showinfo("Success", "Prisoner updated successfully!")
-            self.refresh_prisoner_list()
+            def written(written):
+                result, listed = written
+                messagebox.showinfo("Success", "Prisoner updated successfully!")
+                # Dropped from the list if it no longer matches the search
+                self.prisoner_pager.patch(prisoner_id, listed)
+                if result.rows:
+                    self.form_versions['prisoner'] = (prisoner_id, result.rows[0][11])
+                self.update_lookup('prisoner', prisoner_id, result.rows)
+                self.patch_cells(result.cells)
+                self.dashboard_changed()
             
+            self.run_query('prisoner', work, written, "Error updating prisoner", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error updating prisoner: {str(e)}")
     
@@ -543,20 +1061,36 @@ class PrisonerManagementSystem:
             return
         
         try:
-            cursor = self.connection.cursor()
             prisoner_id = self.prisoner_tree.item(selected_item)['values'][0]
             
-            query = "DELETE FROM Prisoner WHERE prisoner_id=%s"
-            cursor.execute(query, (prisoner_id,))
-            self.connection.commit()
-            
-            messagebox.showinfo("Success", "Prisoner deleted successfully!")
-            self.clear_prisoner_form()
-            self.refresh_prisoner_list()
+            def written(result):
+                messagebox.showinfo("Success", "Prisoner deleted successfully!")
+                self.clear_prisoner_form()
+                self.prisoner_pager.patch(prisoner_id, [])
+                self.update_lookup('prisoner', prisoner_id, [])
+                self.patch_cells(result.cells)
+                self.dashboard_changed()
             
+            self.run_query('prisoner', lambda: self.services.prisoners.delete(prisoner_id), written,
+                           "Error deleting prisoner", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error deleting prisoner: {str(e)}")
     
+    def get_prisoner_form(self):
+        """Read the prisoner form into a dict keyed by column name"""
+        return {
+            "first_name": self.prisoner_entries["first_name"].get(),
+            "last_name": self.prisoner_entries["last_name"].get(),
+            "gender": self.prisoner_entries["gender"].get(),
+            "date_of_birth": self.prisoner_entries["dob"].get_date(),
+            "date_of_incarceration": self.prisoner_entries["incarceration_date"].get_date(),
+            "date_of_release": self.prisoner_entries["release_date"].get_date(),
+            "crime_committed": self.prisoner_entries["crime"].get("1.0", tk.END).strip(),
+            "status": self.prisoner_entries["status"].get(),
+            "cell_id": self.prisoner_entries["cell_id"].get()
+        }
+    
     def load_prisoner_data(self, event):
         selected_item = self.prisoner_tree.selection()
         if not selected_item:
@@ -584,7 +1118,9 @@ class PrisonerManagementSystem:
         self.prisoner_entries["status"].set(prisoner_data[8])
         
         if prisoner_data[9]:
-            self.prisoner_entries["cell_id"].insert(0, prisoner_data[9])
+            self.prisoner_entries["cell_id"].set_key(prisoner_data[9])
+        
+        self.form_versions['prisoner'] = (prisoner_data[0], prisoner_data[11])
     
     def clear_prisoner_form(self):
         for field, entry in self.prisoner_entries.items():
@@ -597,52 +1133,233 @@ class PrisonerManagementSystem:
             else:
                 entry.delete(0, tk.END)
     
+    def suggest_cell(self):
+        """Fill in the cell with the most free beds, keeping the block of the cell entered"""
+        current = self.prisoner_entries["cell_id"].get().strip()
+        near_cell_id = int(current) if current.isdigit() else None
+        
+        def suggested(cell_id):
+            if cell_id is None:
+                messagebox.showwarning("Warning", "There are no free beds in any cell")
+                return
+            self.prisoner_entries["cell_id"].set_key(cell_id)
+        
+        self.run_query('prisoner', lambda: self.services.prisoners.suggest_cell(near_cell_id), suggested,
+                       "Error finding a free cell", cancellable=False)
+    
+    def show_prisoner_profile(self):
+        """Open a window with the selected prisoner's cell, visits, incidents and medical records"""
+        selected_item = self.prisoner_tree.selection()
+        if not selected_item:
+            messagebox.showwarning("Warning", "Please select a prisoner to view")
+            return
+        
+        prisoner_id = self.prisoner_tree.item(selected_item)['values'][0]
+        
+        def shown(profile):
+            if profile is None:
+                messagebox.showerror("Error", "This prisoner no longer exists")
+                return
+            self.open_profile_window(profile)
+        
+        self.run_query('prisoner', lambda: self.services.prisoners.profile(prisoner_id), shown,
+                       "Error loading profile", cancellable=False)
+    
+    def open_profile_window(self, profile):
+        prisoner_id, incarcerated, first_name, last_name, status, crime = profile.prisoner
+        
+        window = tk.Toplevel(self.root)
+        window.title(f"Prisoner Profile - {first_name} {last_name}")
+        window.geometry("900x600")
+        
+        # Summary
+        summary_frame = ttk.LabelFrame(window, text="Prisoner", padding=10)
+        summary_frame.pack(fill='x', padx=10, pady=5)
+        
+        if profile.cell:
+            cell = f"{profile.cell[2]} (Block {profile.cell[3]})"
+        else:
+            cell = "None"
+        summary = [("ID:", prisoner_id), ("Name:", f"{first_name} {last_name}"), ("Status:", status),
+                   ("Incarcerated:", incarcerated or ""), ("Cell:", cell), ("Crime:", crime or "")]
+        for i, (label, value) in enumerate(summary):
+            ttk.Label(summary_frame, text=label).grid(row=i // 3, column=(i % 3) * 2, sticky='w', padx=5, pady=2)
+            ttk.Label(summary_frame, text=str(value)).grid(row=i // 3, column=(i % 3) * 2 + 1, sticky='w', padx=5, pady=2)
+        
+        # History, one branch per table
+        tree_frame = ttk.LabelFrame(window, text="History", padding=10)
+        tree_frame.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        columns = ("Date", "Name", "Details")
+        tree = ttk.Treeview(tree_frame, columns=columns, show='tree headings')
+        tree.heading('#0', text="Record")
+        tree.column('#0', width=150)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=500 if col == "Details" else 120)
+        
+        sections = [
+            ("Visits", profile.visits, lambda r: f"{r[4]}, {r[5]}"),
+            ("Incidents", profile.incidents, lambda r: r[4]),
+            ("Medical Records", profile.medical, lambda r: f"{r[4]}: {r[5]}"),
+        ]
+        for title, rows, details in sections:
+            parent = tree.insert('', 'end', text=f"{title} ({len(rows)})", open=True)
+            for row in rows:
+                name = " ".join(part for part in row[2:4] if part)
+                tree.insert(parent, 'end', text=f"#{row[0]}", values=(row[1] or "", name, details(row)))
+        
+        scrollbar = ttk.Scrollbar(tree_frame, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side='left', fill='both', expand=True)
+        scrollbar.pack(side='right', fill='y')
+    
+    def fetch_prisoner_page(self, after=None, before=None, limit=PAGE_SIZE):
+        """Fetch one page of live prisoners matching the search, ordered by prisoner_id"""
+        conditions, params = self.prisoner_filter
+        return self.services.prisoners.page(after, before, limit, conditions, params)
+    
+    def fetch_prisoner_row(self, key):
+        """The prisoner's list row if they are live and match the search, else no rows"""
+        conditions, params = self.prisoner_filter
+        return self.services.prisoners.get(key, conditions, params)
+    
     def refresh_prisoner_list(self):
+        self.prisoner_pager.reset()
+    
+    def show_archived_prisoners(self):
+        """Look up archived prisoners by the start of their first or last name"""
+        name = simpledialog.askstring("Archive", "First or last name starts with:", parent=self.root)
+        if not name:
+            return
+        
+        def shown(rows):
+            window = tk.Toplevel(self.root)
+            window.title(f"Archived Prisoners: {name}")
+            window.geometry("900x400")
+            
+            columns = ("ID", "First Name", "Last Name", "Gender", "DOB", "Incarceration", 
+                      "Release", "Crime", "Status", "Cell ID", "Archived")
+            tree = ttk.Treeview(window, columns=columns, show='headings')
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=80)
+            for row in rows:
+                tree.insert('', 'end', values=format_row(row, (4, 5, 6)))
+            
+            scrollbar = ttk.Scrollbar(window, orient='vertical', command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            tree.pack(side='left', fill='both', expand=True)
+            scrollbar.pack(side='right', fill='y')
+        
+        self.run_query('prisoner', lambda: self.services.prisoners.find_archived(name), shown,
+                       "Error searching the archive", cancellable=False)
+    
+    def release_due(self, on_released=None):
+        """Release every prisoner whose release date has come, in the background"""
+        def written(result):
+            released, cell_rows = result
+            if released:
+                self.patch_cells(cell_rows)
+                self.dashboard_changed()
+                # Too many rows may have changed to patch; reload the list if it is shown
+                self.tab_loaded_at.pop('prisoner', None)
+                if self.notebook.select() == str(self.tabs['prisoner'][0]):
+                    self.on_tab_changed(None)
+            if on_released:
+                on_released(released)
+        
+        self.run_query('releases', lambda: self.services.prisoners.release_due(), written,
+                       "Error releasing prisoners", cancellable=False)
+    
+    def release_due_periodically(self):
+        """Run the due release batch now and then every RELEASE_CHECK_MS"""
+        self.release_due()
+        self.root.after(RELEASE_CHECK_MS, self.release_due_periodically)
+    
+    def show_releases(self):
+        """Show prisoners due for release and the 30/60/90-day release forecast"""
+        def shown(result):
+            due, forecast = result
+            window = tk.Toplevel(self.root)
+            window.title("Releases")
+            window.geometry("600x450")
+            
+            summary = ", ".join(f"next {days} days: {count}" for days, count in forecast)
+            ttk.Label(window, text=f"Due for release: {len(due)}    Forecast - {summary}").pack(
+                anchor='w', padx=10, pady=5)
+            
+            def release_now():
+                def released(rows):
+                    window.destroy()
+                    messagebox.showinfo("Success", f"{len(rows)} prisoners released")
+                self.release_due(released)
+            
+            button = ttk.Button(window, text="Release Now", command=release_now)
+            button.pack(side='bottom', pady=5)
+            if not due:
+                button.state(['disabled'])
+            
+            columns = ("ID", "First Name", "Last Name", "Release Date", "Cell ID")
+            tree = ttk.Treeview(window, columns=columns, show='headings')
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=100)
+            for row in due:
+                tree.insert('', 'end', values=format_row(row, (3,)))
+            
+            scrollbar = ttk.Scrollbar(window, orient='vertical', command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            tree.pack(side='left', fill='both', expand=True)
+            scrollbar.pack(side='right', fill='y')
+        
+        self.run_query('releases', lambda: self.services.prisoners.due_releases(), shown,
+                       "Error loading releases", cancellable=False)
+    
+    def search_prisoners(self):
+        """Apply the search bar filters to the prisoner list"""
         try:
-            cursor = self.connection.cursor()
-            query = """SELECT prisoner_id, first_name, last_name, gender, date_of_birth, 
-                      date_of_incarceration, date_of_release, crime_committed, status, cell_id 
-                      FROM Prisoner"""
-            cursor.execute(query)
+            values = {field: entry.get().strip() for field, entry in self.prisoner_search_entries.items()}
             
-            # Clear existing data
-            for row in self.prisoner_tree.get_children():
-                self.prisoner_tree.delete(row)
+            cell_id = int(values["cell_id"]) if values["cell_id"] else None
+            dates = {}
+            for field in ["incarcerated_from", "incarcerated_to"]:
+                if values[field]:
+                    dates[field] = datetime.strptime(values[field], '%Y-%m-%d').date()
             
-            # Add new data
-            for row in cursor.fetchall():
-                formatted_row = list(row)
-                # Format dates
-                for i in range(4, 7):
-                    if formatted_row[i]:
-                        formatted_row[i] = formatted_row[i].strftime('%Y-%m-%d')
-                self.prisoner_tree.insert('', 'end', values=formatted_row)
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Error loading prisoners: {str(e)}")
+            self.prisoner_filter = search.prisoner_filter(
+                name=values["name"], status=values["status"], cell_id=cell_id,
+                crime=values["crime"], dialect=self.db and self.db.dialect, **dates)
+            self.refresh_prisoner_list()
+            
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid search: {str(e)}")
+    
+    def clear_prisoner_search(self):
+        for field, entry in self.prisoner_search_entries.items():
+            if field == "status":
+                entry.set('')
+            else:
+                entry.delete(0, tk.END)
+        
+        self.prisoner_filter = ([], [])
+        self.refresh_prisoner_list()
 
     # Cell CRUD Operations
     def add_cell(self):
         try:
-            cursor = self.connection.cursor()
-            
-            values = []
-            for field in ["cell_number", "capacity", "current_occupancy", "block_number"]:
-                value = self.cell_entries[field].get()
-                if field in ["capacity", "current_occupancy"] and value:
-                    value = int(value)
-                values.append(value)
-            
-            query = """INSERT INTO Cell (cell_number, capacity, current_occupancy, block_number) 
-                      VALUES (%s, %s, %s, %s)"""
+            record = self.get_cell_form()
             
-            cursor.execute(query, values)
-            self.connection.commit()
-            
-            messagebox.showinfo("Success", "Cell added successfully!")
-            self.clear_cell_form()
-            self.refresh_cell_list()
+            def written(result):
+                messagebox.showinfo("Success", "Cell added successfully!")
+                self.clear_cell_form()
+                patch_tree_row(self.cell_tree, result.key, result.rows)
+                self.update_lookup('cell', result.key, result.rows)
+                self.dashboard_changed()
             
+            self.run_query('cell', lambda: self.services.cells.add(record), written,
+                           "Error adding cell", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error adding cell: {str(e)}")
     
@@ -653,27 +1370,18 @@ class PrisonerManagementSystem:
             return
         
         try:
-            cursor = self.connection.cursor()
             cell_id = self.cell_tree.item(selected_item)['values'][0]
+            record = self.get_cell_form()
             
-            values = []
-            for field in ["cell_number", "capacity", "current_occupancy", "block_number"]:
-                value = self.cell_entries[field].get()
-                if field in ["capacity", "current_occupancy"] and value:
-                    value = int(value)
-                values.append(value)
-            
-            values.append(cell_id)
-            
-            query = """UPDATE Cell SET cell_number=%s, capacity=%s, 
-                      current_occupancy=%s, block_number=%s WHERE cell_id=%s"""
-            
-            cursor.execute(query, values)
-            self.connection.commit()
-            
-            messagebox.showinfo("Success", "Cell updated successfully!")
-            self.refresh_cell_list()
+            def written(result):
+                messagebox.showinfo("Success", "Cell updated successfully!")
+                patch_tree_row(self.cell_tree, cell_id, result.rows)
+                self.update_lookup('cell', cell_id, result.rows)
+                self.dashboard_changed()
             
+            self.run_query('cell', lambda: self.services.cells.update(cell_id, record), written,
+                           "Error updating cell", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error updating cell: {str(e)}")
     
@@ -687,23 +1395,18 @@ class PrisonerManagementSystem:
             return
         
         try:
-            cursor = self.connection.cursor()
             cell_id = self.cell_tree.item(selected_item)['values'][0]
             
-            # Check if cell has prisoners
-            cursor.execute("SELECT COUNT(*) FROM Prisoner WHERE cell_id=%s", (cell_id,))
-            if cursor.fetchone()[0] > 0:
-                messagebox.showerror("Error", "Cannot delete cell with prisoners assigned!")
-                return
-            
-            query = "DELETE FROM Cell WHERE cell_id=%s"
-            cursor.execute(query, (cell_id,))
-            self.connection.commit()
-            
-            messagebox.showinfo("Success", "Cell deleted successfully!")
-            self.clear_cell_form()
-            self.refresh_cell_list()
+            def written(result):
+                messagebox.showinfo("Success", "Cell deleted successfully!")
+                self.clear_cell_form()
+                patch_tree_row(self.cell_tree, cell_id, [])
+                self.update_lookup('cell', cell_id, [])
+                self.dashboard_changed()
             
+            self.run_query('cell', lambda: self.services.cells.delete(cell_id), written,
+                           "Error deleting cell", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error deleting cell: {str(e)}")
     
@@ -720,58 +1423,62 @@ class PrisonerManagementSystem:
         # Set values in form
         self.cell_entries["cell_number"].insert(0, cell_data[1])
         self.cell_entries["capacity"].insert(0, cell_data[2])
-        self.cell_entries["current_occupancy"].insert(0, cell_data[3])
         self.cell_entries["block_number"].insert(0, cell_data[4])
     
     def clear_cell_form(self):
         for entry in self.cell_entries.values():
             entry.delete(0, tk.END)
     
+    def get_cell_form(self):
+        """Read the cell form into a dict keyed by column name"""
+        return {field: self.cell_entries[field].get() for field in ["cell_number", "capacity", "block_number"]}
+    
+    def patch_cells(self, cell_rows):
+        """Show cells whose occupancy a write changed"""
+        for cell_id, rows in cell_rows.items():
+            patch_tree_row(self.cell_tree, cell_id, rows, append=False)
+    
+    def recount_occupancy(self):
+        """Recompute every cell's occupancy from the prisoners assigned to it"""
+        def written(result):
+            over, rows = result
+            self.cell_tree.delete(*self.cell_tree.get_children())
+            for row in rows:
+                self.cell_tree.insert('', 'end', iid=str(row[0]), values=row)
+            if over:
+                cells = ", ".join(f"{cell_id} ({occupied}/{capacity})" for cell_id, capacity, occupied in over)
+                messagebox.showwarning("Warning", f"Cells over capacity: {cells}")
+            else:
+                messagebox.showinfo("Success", "Cell occupancy recounted")
+        
+        self.run_query('cell', lambda: self.services.cells.recount(), written,
+                       "Error recounting occupancy", cancellable=False)
+    
     def refresh_cell_list(self):
-        try:
-            cursor = self.connection.cursor()
-            query = "SELECT cell_id, cell_number, capacity, current_occupancy, block_number FROM Cell"
-            cursor.execute(query)
-            
+        def show(rows):
             # Clear existing data
-            for row in self.cell_tree.get_children():
-                self.cell_tree.delete(row)
+            self.cell_tree.delete(*self.cell_tree.get_children())
             
             # Add new data
-            for row in cursor.fetchall():
-                self.cell_tree.insert('', 'end', values=row)
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Error loading cells: {str(e)}")
+            for row in rows:
+                self.cell_tree.insert('', 'end', iid=str(row[0]), values=row)
+        
+        self.run_query('cell', lambda: self.services.cells.list(), show, "Error loading cells")
 
     # Visitor CRUD Operations
     def add_visitor(self):
         try:
-            cursor = self.connection.cursor()
-            
-            values = []
-            for field in ["prisoner_id", "first_name", "last_name", "relationship", "visit_date", "visit_time"]:
-                if field == "visit_date":
-                    value = self.visitor_entries[field].get_date()
-                else:
-                    value = self.visitor_entries[field].get()
-                
-                if field == "prisoner_id" and value:
-                    value = int(value)
-                    
-                values.append(value)
-            
-            query = """INSERT INTO Visitor (prisoner_id, first_name, last_name, 
-                      relationship, visit_date, visit_time) 
-                      VALUES (%s, %s, %s, %s, %s, %s)"""
-            
-            cursor.execute(query, values)
-            self.connection.commit()
+            # Get values from form
+            record = self.get_visitor_form()
             
-            messagebox.showinfo("Success", "Visitor added successfully!")
-            self.clear_visitor_form()
-            self.refresh_visitor_list()
+            def written(result):
+                messagebox.showinfo("Success", "Visitor added successfully!")
+                self.clear_visitor_form()
+                self.visitor_pager.patch(result.key, result.rows)
             
+            self.run_query('visitor', lambda: self.services.visitors.add(record), written,
+                           "Error adding visitor", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error adding visitor: {str(e)}")
     
@@ -782,32 +1489,18 @@ class PrisonerManagementSystem:
             return
         
         try:
-            cursor = self.connection.cursor()
             visitor_id = self.visitor_tree.item(selected_item)['values'][0]
             
-            values = []
-            for field in ["prisoner_id", "first_name", "last_name", "relationship", "visit_date", "visit_time"]:
-                if field == "visit_date":
-                    value = self.visitor_entries[field].get_date()
-                else:
-                    value = self.visitor_entries[field].get()
-                
-                if field == "prisoner_id" and value:
-                    value = int(value)
-                    
-                values.append(value)
-            
-            values.append(visitor_id)
-            
-            query = """UPDATE Visitor SET prisoner_id=%s, first_name=%s, last_name=%s, 
-                      relationship=%s, visit_date=%s, visit_time=%s WHERE visitor_id=%s"""
-            
-            cursor.execute(query, values)
-            self.connection.commit()
+            # Get values from form
+            record = self.get_visitor_form()
             
-            messagebox.showinfo("Success", "Visitor updated successfully!")
-            self.refresh_visitor_list()
+            def written(result):
+                messagebox.showinfo("Success", "Visitor updated successfully!")
+                self.visitor_pager.patch(visitor_id, result.rows)
             
+            self.run_query('visitor', lambda: self.services.visitors.update(visitor_id, record), written,
+                           "Error updating visitor", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error updating visitor: {str(e)}")
     
@@ -821,20 +1514,30 @@ class PrisonerManagementSystem:
             return
         
         try:
-            cursor = self.connection.cursor()
             visitor_id = self.visitor_tree.item(selected_item)['values'][0]
             
-            query = "DELETE FROM Visitor WHERE visitor_id=%s"
-            cursor.execute(query, (visitor_id,))
-            self.connection.commit()
-            
-            messagebox.showinfo("Success", "Visitor deleted successfully!")
-            self.clear_visitor_form()
-            self.refresh_visitor_list()
+            def written(result):
+                messagebox.showinfo("Success", "Visitor deleted successfully!")
+                self.clear_visitor_form()
+                self.visitor_pager.patch(visitor_id, [])
             
+            self.run_query('visitor', lambda: self.services.visitors.delete(visitor_id), written,
+                           "Error deleting visitor", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error deleting visitor: {str(e)}")
     
+    def get_visitor_form(self):
+        """Read the visitor form into a dict keyed by column name"""
+        return {
+            "prisoner_id": self.visitor_entries["prisoner_id"].get(),
+            "first_name": self.visitor_entries["first_name"].get(),
+            "last_name": self.visitor_entries["last_name"].get(),
+            "relationship": self.visitor_entries["relationship"].get(),
+            "visit_date": self.visitor_entries["visit_date"].get_date(),
+            "visit_time": self.visitor_entries["visit_time"].get()
+        }
+    
     def load_visitor_data(self, event):
         selected_item = self.visitor_tree.selection()
         if not selected_item:
@@ -846,15 +1549,15 @@ class PrisonerManagementSystem:
         self.clear_visitor_form()
         
         # Set values in form
-        self.visitor_entries["prisoner_id"].insert(0, visitor_data[1])
-        self.visitor_entries["first_name"].insert(0, visitor_data[2])
-        self.visitor_entries["last_name"].insert(0, visitor_data[3])
-        self.visitor_entries["relationship"].insert(0, visitor_data[4])
+        self.visitor_entries["prisoner_id"].set_key(visitor_data[1])
+        self.visitor_entries["first_name"].insert(0, visitor_data[3])
+        self.visitor_entries["last_name"].insert(0, visitor_data[4])
+        self.visitor_entries["relationship"].insert(0, visitor_data[5])
         
-        if visitor_data[5]:
-            self.visitor_entries["visit_date"].set_date(datetime.strptime(visitor_data[5], '%Y-%m-%d').date())
+        if visitor_data[6]:
+            self.visitor_entries["visit_date"].set_date(datetime.strptime(visitor_data[6], '%Y-%m-%d').date())
         
-        self.visitor_entries["visit_time"].insert(0, visitor_data[6])
+        self.visitor_entries["visit_time"].insert(0, visitor_data[7])
     
     def clear_visitor_form(self):
         for field, entry in self.visitor_entries.items():
@@ -863,54 +1566,58 @@ class PrisonerManagementSystem:
             else:
                 entry.delete(0, tk.END)
     
+    def show_free_slots(self):
+        """Show free visiting room places for the week from the visit date in the form,
+        in the block of the prisoner entered, or in every block"""
+        start_date = self.visitor_entries["visit_date"].get_date()
+        if start_date is None:
+            messagebox.showwarning("Warning", "Please choose a visit date")
+            return
+        prisoner_id = self.visitor_entries["prisoner_id"].get().strip()
+        prisoner_id = int(prisoner_id) if prisoner_id else None
+        
+        def shown(slots):
+            window = tk.Toplevel(self.root)
+            window.title(f"Free Visiting Slots from {start_date}")
+            window.geometry("600x500")
+            
+            columns = ("Date", "Block", "From", "To", "Free Places")
+            tree = ttk.Treeview(window, columns=columns, show='headings')
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=100)
+            for day, block, start, end, free in slots:
+                tree.insert('', 'end', values=(day.strftime('%Y-%m-%d (%a)'), block, start, end, free))
+            
+            scrollbar = ttk.Scrollbar(window, orient='vertical', command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            tree.pack(side='left', fill='both', expand=True)
+            scrollbar.pack(side='right', fill='y')
+        
+        self.run_query('visitor', lambda: self.services.visitors.free_slots(start_date, prisoner_id), shown,
+                       "Error finding free slots", cancellable=False)
+    
+    def fetch_visitor_page(self, after=None, before=None, limit=PAGE_SIZE):
+        """Fetch one page of live visitors with their prisoner's name"""
+        return self.services.visitors.page(after, before, limit)
+    
     def refresh_visitor_list(self):
-        try:
-            cursor = self.connection.cursor()
-            query = """SELECT visitor_id, prisoner_id, first_name, last_name, 
-                      relationship, visit_date, visit_time FROM Visitor"""
-            cursor.execute(query)
-            
-            # Clear existing data
-            for row in self.visitor_tree.get_children():
-                self.visitor_tree.delete(row)
-            
-            # Add new data
-            for row in cursor.fetchall():
-                formatted_row = list(row)
-                # Format date
-                if formatted_row[5]:
-                    formatted_row[5] = formatted_row[5].strftime('%Y-%m-%d')
-                self.visitor_tree.insert('', 'end', values=formatted_row)
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Error loading visitors: {str(e)}")
+        self.visitor_pager.reset()
 
     # Staff CRUD Operations
     def add_staff(self):
         try:
-            cursor = self.connection.cursor()
-            
-            values = []
-            for field in ["first_name", "last_name", "gender", "dob", "role", "salary", "hire_date"]:
-                if field in ["dob", "hire_date"]:
-                    value = self.staff_entries[field].get_date()
-                elif field == "salary":
-                    value = float(self.staff_entries[field].get())
-                else:
-                    value = self.staff_entries[field].get()
-                    
-                values.append(value)
-            
-            query = """INSERT INTO Staff (first_name, last_name, gender, date_of_birth, 
-                      role, salary, hire_date) VALUES (%s, %s, %s, %s, %s, %s, %s)"""
+            record = self.get_staff_form()
             
-            cursor.execute(query, values)
-            self.connection.commit()
-            
-            messagebox.showinfo("Success", "Staff member added successfully!")
-            self.clear_staff_form()
-            self.refresh_staff_list()
+            def written(result):
+                messagebox.showinfo("Success", "Staff member added successfully!")
+                self.clear_staff_form()
+                patch_tree_row(self.staff_tree, result.key, result.rows)
+                self.update_lookup('staff', result.key, result.rows)
             
+            self.run_query('staff', lambda: self.services.staff.add(record), written,
+                           "Error adding staff", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error adding staff: {str(e)}")
     
@@ -921,31 +1628,21 @@ class PrisonerManagementSystem:
             return
         
         try:
-            cursor = self.connection.cursor()
             staff_id = self.staff_tree.item(selected_item)['values'][0]
+            version = self.form_version('staff', staff_id,
+                                        self.staff_tree.item(selected_item)['values'][8])
+            record = self.get_staff_form()
             
-            values = []
-            for field in ["first_name", "last_name", "gender", "dob", "role", "salary", "hire_date"]:
-                if field in ["dob", "hire_date"]:
-                    value = self.staff_entries[field].get_date()
-                elif field == "salary":
-                    value = float(self.staff_entries[field].get())
-                else:
-                    value = self.staff_entries[field].get()
-                    
-                values.append(value)
-            
-            values.append(staff_id)
-            
-            query = """UPDATE Staff SET first_name=%s, last_name=%s, gender=%s, date_of_birth=%s, 
-                      role=%s, salary=%s, hire_date=%s WHERE staff_id=%s"""
-            
-            cursor.execute(query, values)
-            self.connection.commit()
-            
-            messagebox.showinfo("Success", "Staff member updated successfully!")
-            self.refresh_staff_list()
+            def written(result):
+                messagebox.showinfo("Success", "Staff member updated successfully!")
+                patch_tree_row(self.staff_tree, staff_id, result.rows)
+                if result.rows:
+                    self.form_versions['staff'] = (staff_id, result.rows[0][8])
+                self.update_lookup('staff', staff_id, result.rows)
             
+            self.run_query('staff', lambda: self.services.staff.update(staff_id, record, version), written,
+                           "Error updating staff", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error updating staff: {str(e)}")
     
@@ -959,29 +1656,17 @@ class PrisonerManagementSystem:
             return
         
         try:
-            cursor = self.connection.cursor()
             staff_id = self.staff_tree.item(selected_item)['values'][0]
             
-            # Check if staff is referenced in incidents
-            cursor.execute("SELECT COUNT(*) FROM IncidentReport WHERE staff_id=%s", (staff_id,))
-            if cursor.fetchone()[0] > 0:
-                messagebox.showerror("Error", "Cannot delete staff member referenced in incidents!")
-                return
-            
-            # Check if staff is a doctor referenced in medical records
-            cursor.execute("SELECT COUNT(*) FROM MedicalRecord WHERE doctor_id=%s", (staff_id,))
-            if cursor.fetchone()[0] > 0:
-                messagebox.showerror("Error", "Cannot delete doctor referenced in medical records!")
-                return
-            
-            query = "DELETE FROM Staff WHERE staff_id=%s"
-            cursor.execute(query, (staff_id,))
-            self.connection.commit()
-            
-            messagebox.showinfo("Success", "Staff member deleted successfully!")
-            self.clear_staff_form()
-            self.refresh_staff_list()
+            def written(result):
+                messagebox.showinfo("Success", "Staff member deleted successfully!")
+                self.clear_staff_form()
+                patch_tree_row(self.staff_tree, staff_id, [])
+                self.update_lookup('staff', staff_id, [])
             
+            self.run_query('staff', lambda: self.services.staff.delete(staff_id), written,
+                           "Error deleting staff", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error deleting staff: {str(e)}")
     
@@ -1008,6 +1693,8 @@ class PrisonerManagementSystem:
         
         if staff_data[7]:
             self.staff_entries["hire_date"].set_date(datetime.strptime(staff_data[7], '%Y-%m-%d').date())
+        
+        self.form_versions['staff'] = (staff_data[0], staff_data[8])
     
     def clear_staff_form(self):
         for field, entry in self.staff_entries.items():
@@ -1018,58 +1705,43 @@ class PrisonerManagementSystem:
             else:
                 entry.delete(0, tk.END)
     
+    def get_staff_form(self):
+        """Read the staff form into a dict keyed by column name"""
+        return {
+            "first_name": self.staff_entries["first_name"].get(),
+            "last_name": self.staff_entries["last_name"].get(),
+            "gender": self.staff_entries["gender"].get(),
+            "date_of_birth": self.staff_entries["dob"].get_date(),
+            "role": self.staff_entries["role"].get(),
+            "salary": self.staff_entries["salary"].get(),
+            "hire_date": self.staff_entries["hire_date"].get_date()
+        }
+    
     def refresh_staff_list(self):
-        try:
-            cursor = self.connection.cursor()
-            query = """SELECT staff_id, first_name, last_name, gender, date_of_birth, 
-                      role, salary, hire_date FROM Staff"""
-            cursor.execute(query)
-            
+        def show(rows):
             # Clear existing data
-            for row in self.staff_tree.get_children():
-                self.staff_tree.delete(row)
+            self.staff_tree.delete(*self.staff_tree.get_children())
             
             # Add new data
-            for row in cursor.fetchall():
-                formatted_row = list(row)
-                # Format dates
-                for i in [4, 7]:  # date_of_birth and hire_date indices
-                    if formatted_row[i]:
-                        formatted_row[i] = formatted_row[i].strftime('%Y-%m-%d')
-                self.staff_tree.insert('', 'end', values=formatted_row)
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Error loading staff: {str(e)}")
+            for row in rows:
+                self.staff_tree.insert('', 'end', iid=str(row[0]), values=row)
+        
+        self.run_query('staff', lambda: self.services.staff.list(), show, "Error loading staff")
 
     # Incident CRUD Operations
     def add_incident(self):
         try:
-            cursor = self.connection.cursor()
-            
-            values = []
-            for field in ["prisoner_id", "staff_id", "incident_date", "incident_description"]:
-                if field == "incident_date":
-                    value = self.incident_entries[field].get_date()
-                elif field == "incident_description":
-                    value = self.incident_entries[field].get("1.0", tk.END).strip()
-                else:
-                    value = self.incident_entries[field].get()
-                
-                if field in ["prisoner_id", "staff_id"] and value:
-                    value = int(value)
-                    
-                values.append(value)
-            
-            query = """INSERT INTO IncidentReport (prisoner_id, staff_id, incident_date, 
-                      incident_description) VALUES (%s, %s, %s, %s)"""
-            
-            cursor.execute(query, values)
-            self.connection.commit()
+            record = self.get_incident_form()
             
-            messagebox.showinfo("Success", "Incident report added successfully!")
-            self.clear_incident_form()
-            self.refresh_incident_list()
+            def written(result):
+                messagebox.showinfo("Success", "Incident report added successfully!")
+                self.clear_incident_form()
+                self.incident_pager.patch(result.key, result.rows)
+                self.dashboard_changed()
             
+            self.run_query('incident', lambda: self.services.incidents.add(record), written,
+                           "Error adding incident", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error adding incident: {str(e)}")
     
@@ -1080,35 +1752,17 @@ class PrisonerManagementSystem:
             return
         
         try:
-            cursor = self.connection.cursor()
-            report_id = self.incident_tree.item(selected_item)['values'][0]  # use correct column name
-
-            values = []
-            for field in ["prisoner_id", "staff_id", "incident_date", "incident_description"]:
-                if field == "incident_date":
-                    value = self.incident_entries[field].get_date()
-                elif field == "incident_description":
-                    value = self.incident_entries[field].get("1.0", tk.END).strip()
-                else:
-                    value = self.incident_entries[field].get()
-
-                if field in ["prisoner_id", "staff_id"] and value:
-                    value = int(value)
-
-                values.append(value)
-
-            values.append(report_id)
-
-            query = """UPDATE IncidentReport SET prisoner_id=%s, staff_id=%s, 
-                    incident_date=%s, incident_description=%s WHERE report_id=%s"""
-
-            
-            cursor.execute(query, values)
-            self.connection.commit()
+            report_id = self.incident_tree.item(selected_item)['values'][0]
+            record = self.get_incident_form()
             
-            messagebox.showinfo("Success", "Incident report updated successfully!")
-            self.refresh_incident_list()
+            def written(result):
+                messagebox.showinfo("Success", "Incident report updated successfully!")
+                self.incident_pager.patch(report_id, result.rows)
+                self.dashboard_changed()
             
+            self.run_query('incident', lambda: self.services.incidents.update(report_id, record), written,
+                           "Error updating incident", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error updating incident: {str(e)}")
     
@@ -1122,17 +1776,17 @@ class PrisonerManagementSystem:
             return
         
         try:
-            cursor = self.connection.cursor()
             report_id = self.incident_tree.item(selected_item)['values'][0]
             
-            query = "DELETE FROM IncidentReport WHERE report_id=%s"
-            cursor.execute(query, (report_id,))
-            self.connection.commit()
-            
-            messagebox.showinfo("Success", "Incident report deleted successfully!")
-            self.clear_incident_form()
-            self.refresh_incident_list()
+            def written(result):
+                messagebox.showinfo("Success", "Incident report deleted successfully!")
+                self.clear_incident_form()
+                self.incident_pager.patch(report_id, [])
+                self.dashboard_changed()
             
+            self.run_query('incident', lambda: self.services.incidents.delete(report_id), written,
+                           "Error deleting incident", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error deleting incident: {str(e)}")
     
@@ -1147,12 +1801,12 @@ class PrisonerManagementSystem:
         self.clear_incident_form()
         
         # Set values in form
-        self.incident_entries["prisoner_id"].insert(0, incident_data[1])
-        self.incident_entries["staff_id"].insert(0, incident_data[2])
-        self.incident_entries["incident_description"].insert("1.0", incident_data[3])
+        self.incident_entries["prisoner_id"].set_key(incident_data[1])
+        self.incident_entries["staff_id"].set_key(incident_data[3])
+        self.incident_entries["incident_description"].insert("1.0", incident_data[5])
         
-        if incident_data[4]:
-            self.incident_entries["incident_date"].set_date(datetime.strptime(incident_data[4], '%Y-%m-%d').date())
+        if incident_data[6]:
+            self.incident_entries["incident_date"].set_date(datetime.strptime(incident_data[6], '%Y-%m-%d').date())
     
     def clear_incident_form(self):
         for field, entry in self.incident_entries.items():
@@ -1163,57 +1817,36 @@ class PrisonerManagementSystem:
             else:
                 entry.delete(0, tk.END)
     
+    def get_incident_form(self):
+        """Read the incident form into a dict keyed by column name"""
+        return {
+            "prisoner_id": self.incident_entries["prisoner_id"].get(),
+            "staff_id": self.incident_entries["staff_id"].get(),
+            "incident_date": self.incident_entries["incident_date"].get_date(),
+            "incident_description": self.incident_entries["incident_description"].get("1.0", tk.END).strip()
+        }
+    
+    def fetch_incident_page(self, after=None, before=None, limit=PAGE_SIZE):
+        """Fetch one page of incident reports with prisoner and staff names"""
+        return self.services.incidents.page(after, before, limit)
+    
     def refresh_incident_list(self):
-        try:
-            cursor = self.connection.cursor()
-            query = """SELECT report_id, prisoner_id, staff_id, incident_description, 
-                      incident_date FROM IncidentReport"""
-            cursor.execute(query)
-            
-            # Clear existing data
-            for row in self.incident_tree.get_children():
-                self.incident_tree.delete(row)
-            
-            # Add new data
-            for row in cursor.fetchall():
-                formatted_row = list(row)
-                # Format date
-                if formatted_row[4]:
-                    formatted_row[4] = formatted_row[4].strftime('%Y-%m-%d')
-                self.incident_tree.insert('', 'end', values=formatted_row)
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Error loading incidents: {str(e)}")
+        self.incident_pager.reset()
 
     # Medical Record CRUD Operations
     def add_medical(self):
         try:
-            cursor = self.connection.cursor()
-            
-            values = []
-            for field in ["prisoner_id", "doctor_id", "examination_date", "diagnosis", "treatment"]:
-                if field == "examination_date":
-                    value = self.medical_entries[field].get_date()
-                elif field in ["diagnosis", "treatment"]:
-                    value = self.medical_entries[field].get("1.0", tk.END).strip()
-                else:
-                    value = self.medical_entries[field].get()
-                
-                if field in ["prisoner_id", "doctor_id"] and value:
-                    value = int(value)
-                    
-                values.append(value)
+            record = self.get_medical_form()
             
-            query = """INSERT INTO MedicalRecord (prisoner_id, doctor_id, date_of_examination, 
-                      diagnosis, treatment) VALUES (%s, %s, %s, %s, %s)"""
-            
-            cursor.execute(query, values)
-            self.connection.commit()
-            
-            messagebox.showinfo("Success", "Medical record added successfully!")
-            self.clear_medical_form()
-            self.refresh_medical_list()
+            def written(result):
+                messagebox.showinfo("Success", "Medical record added successfully!")
+                self.clear_medical_form()
+                self.medical_pager.patch(result.key, result.rows)
+                self.dashboard_changed()
             
+            self.run_query('medical', lambda: self.services.medical.add(record), written,
+                           "Error adding medical record", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error adding medical record: {str(e)}")
     
@@ -1224,35 +1857,17 @@ class PrisonerManagementSystem:
             return
         
         try:
-            cursor = self.connection.cursor()
-            medical_id = self.medical_tree.item(selected_item)['values'][0]  # correct field name
-
-            values = []
-            for field in ["prisoner_id", "doctor_id", "examination_date", "diagnosis", "treatment"]:
-                        if field == "examination_date":
-                            value = self.medical_entries[field].get_date()
-                        elif field in ["diagnosis", "treatment"]:
-                            value = self.medical_entries[field].get("1.0", tk.END).strip()
-                        else:
-                            value = self.medical_entries[field].get()
-
-                        if field in ["prisoner_id", "doctor_id"] and value:
-                            value = int(value)
-
-                        values.append(value)
-
-            values.append(medical_id)
-
-            query = """UPDATE MedicalRecord SET prisoner_id=%s, doctor_id=%s, 
-                            date_of_examination=%s, diagnosis=%s, treatment=%s WHERE medical_id=%s"""
-
-            
-            cursor.execute(query, values)
-            self.connection.commit()
+            medical_id = self.medical_tree.item(selected_item)['values'][0]
+            record = self.get_medical_form()
             
-            messagebox.showinfo("Success", "Medical record updated successfully!")
-            self.refresh_medical_list()
+            def written(result):
+                messagebox.showinfo("Success", "Medical record updated successfully!")
+                self.medical_pager.patch(medical_id, result.rows)
+                self.dashboard_changed()
             
+            self.run_query('medical', lambda: self.services.medical.update(medical_id, record), written,
+                           "Error updating medical record", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error updating medical record: {str(e)}")
     
@@ -1266,17 +1881,17 @@ class PrisonerManagementSystem:
             return
         
         try:
-            cursor = self.connection.cursor()
             medical_id = self.medical_tree.item(selected_item)['values'][0]
             
-            query = "DELETE FROM MedicalRecord WHERE medical_id=%s"
-            cursor.execute(query, (medical_id,))
-            self.connection.commit()
-            
-            messagebox.showinfo("Success", "Medical record deleted successfully!")
-            self.clear_medical_form()
-            self.refresh_medical_list()
+            def written(result):
+                messagebox.showinfo("Success", "Medical record deleted successfully!")
+                self.clear_medical_form()
+                self.medical_pager.patch(medical_id, [])
+                self.dashboard_changed()
             
+            self.run_query('medical', lambda: self.services.medical.delete(medical_id), written,
+                           "Error deleting medical record", cancellable=False)
+        
         except Exception as e:
             messagebox.showerror("Error", f"Error deleting medical record: {str(e)}")
     
@@ -1291,14 +1906,14 @@ class PrisonerManagementSystem:
         self.clear_medical_form()
         
         # Set values in form
-        self.medical_entries["prisoner_id"].insert(0, medical_data[1])
-        self.medical_entries["diagnosis"].insert("1.0", medical_data[2])
-        self.medical_entries["treatment"].insert("1.0", medical_data[3])
+        self.medical_entries["prisoner_id"].set_key(medical_data[1])
+        self.medical_entries["diagnosis"].insert("1.0", medical_data[3])
+        self.medical_entries["treatment"].insert("1.0", medical_data[4])
         
-        if medical_data[4]:
-            self.medical_entries["examination_date"].set_date(datetime.strptime(medical_data[4], '%Y-%m-%d').date())
+        if medical_data[5]:
+            self.medical_entries["examination_date"].set_date(datetime.strptime(medical_data[5], '%Y-%m-%d').date())
         
-        self.medical_entries["doctor_id"].insert(0, medical_data[5])
+        self.medical_entries["doctor_id"].set_key(medical_data[6])
     
     def clear_medical_form(self):
         for field, entry in self.medical_entries.items():
@@ -1309,33 +1924,152 @@ class PrisonerManagementSystem:
             else:
                 entry.delete(0, tk.END)
     
+    def get_medical_form(self):
+        """Read the medical record form into a dict keyed by column name"""
+        return {
+            "prisoner_id": self.medical_entries["prisoner_id"].get(),
+            "doctor_id": self.medical_entries["doctor_id"].get(),
+            "date_of_examination": self.medical_entries["examination_date"].get_date(),
+            "diagnosis": self.medical_entries["diagnosis"].get("1.0", tk.END).strip(),
+            "treatment": self.medical_entries["treatment"].get("1.0", tk.END).strip()
+        }
+    
+    def fetch_medical_page(self, after=None, before=None, limit=PAGE_SIZE):
+        """Fetch one page of medical records with prisoner and doctor names"""
+        return self.services.medical.page(after, before, limit)
+    
     def refresh_medical_list(self):
-        try:
-            cursor = self.connection.cursor()
-            query = """SELECT medical_id, prisoner_id, diagnosis, treatment, 
-                      date_of_examination, doctor_id FROM MedicalRecord"""
-            cursor.execute(query)
-            
+        self.medical_pager.reset()
+
+    # Bulk import
+    def import_records(self, kind):
+        """Import a CSV/JSON file of prisoners or visitors in the background"""
+        path = filedialog.askopenfilename(
+            title=f"Import {kind}",
+            filetypes=[("CSV or JSON", "*.csv *.json *.jsonl"), ("All files", "*.*")])
+        if not path:
+            return
+        
+        key = 'prisoner' if kind == 'prisoners' else 'visitor'
+        allocate = kind == 'prisoners' and messagebox.askyesno(
+            "Import", "Assign free cells to incarcerated prisoners without a Cell ID?")
+        
+        def imported(result):
+            message = f"{result}."
+            if result.rejects:
+                shown = "\n".join(f"Line {number}: {error}" for number, error in result.rejects[:20])
+                message += f"\n\nRejected rows:\n{shown}"
+                if len(result.rejects) > 20:
+                    message += f"\n... and {len(result.rejects) - 20} more"
+            messagebox.showinfo("Import Finished", message)
+            
+            if kind == 'prisoners':
+                self.load_lookups('prisoner')
+            getattr(self, f"refresh_{key}_list")()
+            self.tab_loaded_at.pop('cell', None)
+            self.dashboard_changed()
+        
+        self.run_query(key, lambda: self.services.import_file(kind, path, allocate), imported,
+                       f"Error importing {kind}", cancellable=False)
+    
+    # Export
+    def export_records(self, key):
+        """Export a tab's table to CSV/Parquet in the background; the prisoner export
+        follows the current search"""
+        path = filedialog.asksaveasfilename(
+            title="Export",
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("Parquet", "*.parquet")])
+        if not path:
+            return
+        
+        conditions, params = self.prisoner_filter if key == 'prisoner' else ([], [])
+        
+        def exported(count):
+            messagebox.showinfo("Export Finished", f"Exported {count} rows to {path}")
+        
+        self.run_query(key, lambda: self.services.export(key, path, conditions, params),
+                       exported, "Error exporting", cancellable=False)
+    
+    # Dashboard
+    def refresh_dashboard_list(self, rebuild=False):
+        """Show the dashboard metrics, building them first if needed"""
+        def show(result):
+            snapshot, doctors = result
+            rows = {
+                'headcount': snapshot['headcount'],
+                'occupancy': [(block, occupied, capacity,
+                               f"{100 * occupied / capacity:.0f}%" if capacity else "")
+                              for block, occupied, capacity in snapshot['occupancy']],
+                'incidents': snapshot['incidents'],
+                'exams': [(f"{doctors[doctor_id][1]} {doctors[doctor_id][2]}" if doctor_id in doctors
+                           else doctor_id or "None", count)
+                          for doctor_id, count in snapshot['exams']],
+            }
+            for key, tree in self.dashboard_trees.items():
+                tree.delete(*tree.get_children())
+                for row in rows[key]:
+                    tree.insert('', 'end', values=row)
+            
+            if snapshot['built_at'] is not None:
+                built_at = datetime.fromtimestamp(snapshot['built_at']).strftime('%H:%M:%S')
+                self.dashboard_status_label.config(
+                    text=f"Last full rebuild at {built_at}; changes made here are applied as they happen")
+        
+        self.run_query('dashboard', lambda: self.services.dashboard_snapshot(rebuild), show,
+                       "Error loading dashboard")
+    
+    # Full-text search
+    def search_records(self):
+        self.search_text = self.search_query_entry.get().strip()
+        self.search_page = 0
+        self.refresh_search_list()
+    
+    def change_search_page(self, step):
+        if self.search_text and self.search_page + step >= 0:
+            self.search_page += step
+            self.refresh_search_list()
+    
+    def refresh_search_list(self):
+        if not self.search_text:
+            return
+        
+        text = self.search_text
+        page = self.search_page
+        
+        def show(hits):
             # Clear existing data
-            for row in self.medical_tree.get_children():
-                self.medical_tree.delete(row)
+            self.search_tree.delete(*self.search_tree.get_children())
             
             # Add new data
-            for row in cursor.fetchall():
-                formatted_row = list(row)
-                # Format date
-                if formatted_row[4]:
-                    formatted_row[4] = formatted_row[4].strftime('%Y-%m-%d')
-                self.medical_tree.insert('', 'end', values=formatted_row)
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Error loading medical records: {str(e)}")
+            for hit in hits:
+                self.search_tree.insert('', 'end', values=hit)
+            self.search_page_label.config(text=f"Page {page + 1}")
+        
+        self.run_query('search', lambda: self.services.search(text, page), show, "Error searching records")
 
-    def __del__(self):
-        """Close database connection when object is destroyed"""
-        if hasattr(self, 'connection') and self.connection.is_connected():
-            self.connection.close()
+    def shutdown(self):
+        """Finish running work, write out the audit queue and close the pool; safe to call twice"""
+        executor, self.executor = getattr(self, 'executor', None), None
+        if executor is not None:
+            # Let writes already running commit so their audit entries are queued
+            executor.shutdown(wait=True)
+        services, self.services = getattr(self, 'services', None), None
+        if services is not None:
+            services.close()
+        db, self.db = getattr(self, 'db', None), None
+        if db is not None:
+            db.close()
             print("Database connection closed")
+    
+    def close(self):
+        """Close the window once the database work is shut down"""
+        self.shutdown()
+        self.root.destroy()
+    
+    def __del__(self):
+        """Close database connections when object is destroyed"""
+        self.shutdown()
 
 # Main application
 if __name__ == "__main__":
@@ -0,0 +1,51 @@
+"""Optimistic concurrency for records several officers may edit at once
+
+Prisoner and Staff rows carry a row_version (migration 7) that every
+update increments. An update made from a form only applies WHERE
+row_version is still the one the form was loaded at. If another officer
+saved the row first, the update matches nothing and check_updated()
+raises StaleRecordError with the row as it now is, so the app can show
+what differs and let the officer choose. No lock is held while a form is
+open.
+"""
+import audit
+
+VERSIONED_TABLES = ("Prisoner", "Staff")
+
+
+class StaleRecordError(Exception):
+    """The row changed, or was deleted, since the form was loaded"""
+    def __init__(self, table, key, current, submitted, version):
+        self.table = table
+        self.key = key
+        # {column: value} as in the database now, or None if deleted
+        self.current = current
+        self.submitted = submitted
+        # row_version the row has now
+        self.version = version
+        if current is None:
+            message = f"{table} {key} was deleted by another user"
+        else:
+            message = f"{table} {key} was changed by another user since it was loaded"
+        super().__init__(message)
+
+    def differences(self):
+        """(column, their value, your value) for every column the two versions disagree on"""
+        theirs, yours = audit.changes(self.current, self.submitted)
+        return [(column, theirs.get(column), yours.get(column)) for column in yours]
+
+
+def check_updated(db, cursor, table, key, submitted):
+    """Raise StaleRecordError if the versioned UPDATE just run on cursor matched no row
+
+    submitted is the update's {column: value} image. Raising inside the
+    caller's transaction rolls back anything else it wrote.
+    """
+    if cursor.rowcount:
+        return
+    primary_key = audit.TABLES[table][0]
+    live = " AND deleted_at IS NULL" if table in audit.SOFT_DELETED_TABLES else ""
+    cursor.execute(f"SELECT row_version FROM {table} WHERE {primary_key}=%s" + live, (key,))
+    row = cursor.fetchone()
+    current = audit.read_row(db, cursor, table, key) if row is not None else None
+    raise StaleRecordError(table, key, current, submitted, row[0] if row is not None else None)
@@ -0,0 +1,49 @@
+"""Fixtures shared by the tests: a migrated SQLite database and the services over it
+
+Run with: python -m pytest -q
+"""
+import pytest
+
+import database
+import migrations
+from services import Services
+
+
+def prisoner(first_name="Ann", **changes):
+    """A prisoner form record, with the given columns changed"""
+    record = dict(first_name=first_name, last_name="Test", gender="Female", date_of_birth="1990-01-01",
+                  date_of_incarceration="2020-01-01", date_of_release="2030-01-01",
+                  crime_committed="Theft", status="Incarcerated", cell_id=None)
+    record.update(changes)
+    return record
+
+
+def visit(prisoner_id, visit_time="09:30", visit_date="2030-06-03", **changes):
+    """A visitor form record, with the given columns changed"""
+    record = dict(prisoner_id=prisoner_id, first_name="Bob", last_name="Test", relationship="Brother",
+                  visit_date=visit_date, visit_time=visit_time)
+    record.update(changes)
+    return record
+
+
+def add_cell(services, number="A1", capacity=2, block="A"):
+    return services.cells.add(dict(cell_number=number, capacity=capacity, block_number=block)).key
+
+
+def occupancy_of(db, cell_id):
+    return db.fetchone("SELECT current_occupancy FROM Cell WHERE cell_id=%s", (cell_id,))[0]
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = database.connect(f"sqlite:///{tmp_path / 'pms.db'}")
+    migrations.migrate(db)
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def services(db):
+    services = Services(db, user="test")
+    yield services
+    services.close()
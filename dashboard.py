@@ -0,0 +1,157 @@
+"""Facility KPIs kept in memory for the Dashboard tab
+
+Dashboard holds headcount by status, occupancy per block, incidents per
+week and medical exams per doctor. rebuild() recomputes them with one
+GROUP BY per metric; in between, the app's own writes apply deltas, so
+showing the dashboard costs O(number of metrics), not O(rows). Writes
+made outside the app are picked up by the next periodic rebuild. Every
+delta bumps a version, and a rebuild that saw the version change while
+it was reading is thrown away and read again, like TableCache does.
+"""
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+WEEKS_SHOWN = 12
+REBUILD_ATTEMPTS = 3
+
+
+def week_of(day):
+    """ISO week label such as 2026-W07 for a date or yyyy-mm-dd string"""
+    if isinstance(day, str):
+        day = datetime.strptime(day, '%Y-%m-%d').date()
+    year, week, weekday = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+class Dashboard:
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+        self.built_at = None
+        self.headcount = Counter()
+        # cell_id -> (block_number, current_occupancy, capacity), to apply cell deltas
+        self.cells = {}
+        # block_number -> [current_occupancy, capacity, cells]
+        self.blocks = {}
+        self.incidents_per_week = Counter()
+        self.exams_per_doctor = Counter()
+        # Bumped by every delta, so a rebuild can tell it raced one
+        self.version = 0
+
+    def rebuild(self, attempts=REBUILD_ATTEMPTS):
+        """Recompute every metric from the tables; False if writes kept racing the reads"""
+        for attempt in range(attempts):
+            if self._rebuild():
+                return True
+        return False
+
+    def _rebuild(self):
+        with self.lock:
+            version = self.version
+        headcount = Counter(dict(self.db.fetchall("""SELECT status, COUNT(*) FROM Prisoner
+                                                     WHERE deleted_at IS NULL GROUP BY status""")))
+        cells = {cell_id: (block, occupied or 0, capacity or 0) for cell_id, block, occupied, capacity in
+                 self.db.fetchall("SELECT cell_id, block_number, current_occupancy, capacity FROM Cell")}
+        incidents = Counter()
+        for day, count in self.db.fetchall("""SELECT incident_date, COUNT(*) FROM IncidentReport
+                                              WHERE incident_date IS NOT NULL GROUP BY incident_date"""):
+            incidents[week_of(day)] += count
+        exams = Counter(dict(self.db.fetchall("""SELECT doctor_id, COUNT(*) FROM MedicalRecord
+                                                 GROUP BY doctor_id""")))
+
+        with self.lock:
+            if version != self.version:
+                # A delta arrived while reading: it may or may not be in these counts
+                return False
+            self.headcount = headcount
+            self.cells = {}
+            self.blocks = {}
+            for cell_id, cell in cells.items():
+                self._set_cell(cell_id, cell)
+            self.incidents_per_week = incidents
+            self.exams_per_doctor = exams
+            self.built_at = time.time()
+        return True
+
+    def invalidate(self):
+        """Have the next read rebuild, e.g. after a bulk import"""
+        with self.lock:
+            self.version += 1
+            self.built_at = None
+
+    def is_built(self):
+        with self.lock:
+            return self.built_at is not None
+
+    def prisoner_changed(self, old_status, new_status):
+        with self.lock:
+            self.version += 1
+            _move(self.headcount, old_status, new_status)
+
+    def cell_rows(self, rows):
+        """Apply cells written, given as rows of the Cells tab"""
+        with self.lock:
+            self.version += 1
+            for cell_id, cell_number, capacity, occupied, block in rows:
+                self._set_cell(cell_id, (block, occupied or 0, capacity or 0))
+
+    def cell_removed(self, cell_id):
+        with self.lock:
+            self.version += 1
+            self._set_cell(cell_id, None)
+
+    def incident_changed(self, old_date, new_date):
+        with self.lock:
+            self.version += 1
+            _move(self.incidents_per_week,
+                  week_of(old_date) if old_date else None, week_of(new_date) if new_date else None)
+
+    def exam_changed(self, old_doctor, new_doctor):
+        with self.lock:
+            self.version += 1
+            _move(self.exams_per_doctor, old_doctor, new_doctor)
+
+    def snapshot(self):
+        """The metrics as sorted lists, ready to show"""
+        with self.lock:
+            this_monday = date.today() - timedelta(days=date.today().weekday())
+            weeks = [week_of(this_monday - timedelta(weeks=i)) for i in range(WEEKS_SHOWN)]
+            return {
+                'headcount': sorted(self.headcount.items(), key=lambda item: str(item[0])),
+                'occupancy': sorted(((block, occupied, capacity)
+                                     for block, (occupied, capacity, cells) in self.blocks.items()),
+                                    key=lambda item: str(item[0])),
+                'incidents': [(week, self.incidents_per_week[week]) for week in weeks],
+                'exams': self.exams_per_doctor.most_common(),
+                'built_at': self.built_at,
+            }
+
+    def _set_cell(self, cell_id, cell):
+        old = self.cells.pop(cell_id, None)
+        if old is not None:
+            totals = self.blocks[old[0]]
+            totals[0] -= old[1]
+            totals[1] -= old[2]
+            totals[2] -= 1
+            if totals[2] == 0:
+                del self.blocks[old[0]]
+        if cell is not None:
+            self.cells[cell_id] = cell
+            totals = self.blocks.setdefault(cell[0], [0, 0, 0])
+            totals[0] += cell[1]
+            totals[1] += cell[2]
+            totals[2] += 1
+
+
+def _move(counter, old_key, new_key):
+    """Move one count from old_key to new_key; either may be None"""
+    if old_key == new_key:
+        return
+    if old_key is not None:
+        counter[old_key] -= 1
+        if counter[old_key] <= 0:
+            del counter[old_key]
+    if new_key is not None:
+        counter[new_key] += 1
@@ -0,0 +1,186 @@
+"""Data access layer for the pms database
+
+Connections come from a bounded pool, are pinged (and reconnected) before
+use and every cursor is closed as soon as its block finishes. The same
+interface is offered on top of SQLite so the application logic can be run
+against a local file instead of a MySQL server.
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    from mysql.connector import pooling
+except ImportError:
+    pooling = None
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'pms',
+    'user': 'root',  # Change as needed
+    'password': 'Ali@1234'   # Change as needed
+}
+POOL_SIZE = 5
+
+# e.g. sqlite:///pms.db to run against a local SQLite file instead of MySQL
+DATABASE_URL = os.environ.get('PMS_DATABASE_URL')
+
+
+class Database:
+    """Common interface of the MySQL and SQLite back ends"""
+    dialect = None
+    # Appended to a SELECT that locks the rows it reads for the rest of the transaction.
+    # SQLite has no row locks; its writes are serialised per database anyway
+    for_update = ""
+
+    @contextmanager
+    def connection(self):
+        """Borrow a live connection from the pool"""
+        raise NotImplementedError
+
+    @contextmanager
+    def cursor(self):
+        """Open a cursor in its own transaction
+
+        The transaction is committed when the block finishes, rolled back if
+        it raises, and the cursor is closed either way.
+        """
+        with self.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                yield cursor
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def fetchall(self, query, params=()):
+        with self.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    def fetchone(self, query, params=()):
+        with self.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchone()
+
+    def execute(self, query, params=()):
+        """Run a single write and return the id of the inserted row, if any"""
+        with self.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.lastrowid
+
+    def close(self):
+        pass
+
+
+class MySQLDatabase(Database):
+    """Pooled mysql.connector connections with ping-before-use"""
+    dialect = 'mysql'
+    for_update = " FOR UPDATE"
+
+    def __init__(self, pool_size=POOL_SIZE, **config):
+        if pooling is None:
+            raise RuntimeError("mysql-connector-python is not installed")
+        self.pool = pooling.MySQLConnectionPool(pool_name='pms', pool_size=pool_size,
+                                                pool_reset_session=True, **config)
+        # The connector raises instead of waiting when the pool is exhausted,
+        # so callers queue up here for a free connection
+        self._available = threading.BoundedSemaphore(pool_size)
+
+    @contextmanager
+    def connection(self):
+        with self._available:
+            connection = self.pool.get_connection()
+            try:
+                # Idle connections get dropped by the server; reconnect transparently
+                connection.ping(reconnect=True, attempts=3, delay=1)
+                yield connection
+            finally:
+                # Returns the connection to the pool
+                connection.close()
+
+
+class _SQLiteCursor:
+    """Cursor wrapper accepting the %s placeholders used by mysql.connector"""
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        return self._cursor.execute(query.replace('%s', '?'), tuple(params))
+
+    def executemany(self, query, seq_of_params):
+        return self._cursor.executemany(query.replace('%s', '?'), seq_of_params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _SQLiteConnection:
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self):
+        return _SQLiteCursor(self._connection.cursor())
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class SQLiteDatabase(Database):
+    """SQLite stand-in for local runs, benchmarks and tests"""
+    dialect = 'sqlite'
+
+    def __init__(self, path=':memory:', pool_size=POOL_SIZE):
+        if path == ':memory:':
+            # A shared in-memory database lives as long as one connection is open
+            self._uri = f"file:pms-{id(self)}?mode=memory&cache=shared"
+        else:
+            self._uri = f"file:{path}"
+        self._idle = queue.LifoQueue()
+        self._available = threading.BoundedSemaphore(pool_size)
+        self._keepalive = self._connect()
+
+    def _connect(self):
+        connection = sqlite3.connect(self._uri, uri=True, timeout=30, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        connection.execute("PRAGMA foreign_keys = ON")
+        return _SQLiteConnection(connection)
+
+    @contextmanager
+    def connection(self):
+        with self._available:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._connect()
+            try:
+                yield connection
+            finally:
+                self._idle.put(connection)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._keepalive.close()
+
+
+def connect(url=DATABASE_URL, pool_size=POOL_SIZE):
+    """Open the database named by url, or the MySQL server in DB_CONFIG
+
+    SQLite urls follow the usual form: sqlite:///relative.db,
+    sqlite:////absolute/path.db, or sqlite:// for an in-memory database.
+    """
+    if url and url.startswith('sqlite://'):
+        path = url[len('sqlite://'):]
+        if path.startswith('/'):
+            path = path[1:]
+        return SQLiteDatabase(path or ':memory:', pool_size)
+    return MySQLDatabase(pool_size, **DB_CONFIG)
@@ -0,0 +1,257 @@
+"""Seedable synthetic data for load testing the six base tables
+
+generate() fills an (empty or existing) database with realistic rows at
+a chosen Scale. The same seed, scale and as_of date always give the same
+rows, so timings taken before and after a change compare like with like.
+
+Rows are streamed: they are buffered per table and written in batches,
+each batch in one transaction with parents before children, so foreign
+keys hold at every commit and memory stays flat however large the scale.
+Ids are given explicitly, continuing after the largest existing id.
+Cell occupancy is written consistent with the incarcerated prisoners.
+
+Usage: python datagen.py [--scale small|medium|large] [--seed N] [--as-of YYYY-MM-DD]
+                         [--cells N] [--prisoners-per-cell X] [--visits-per-year X]
+                         [--incidents-per-month X] [--batch-size N] [--url URL]
+"""
+import argparse
+import random
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import database
+import migrations
+import scheduling
+
+BATCH_SIZE = 5000
+# Fixed so that runs on different days produce the same dataset
+AS_OF = date(2026, 1, 1)
+
+Scale = namedtuple('Scale', [
+    'cells',                        # number of cells
+    'cells_per_block',
+    'prisoners_per_cell',           # average incarcerated prisoners per cell
+    'released_per_prisoner',        # former prisoners kept per incarcerated one
+    'staff',
+    'doctors',                      # the first staff members are doctors
+    'visits_per_prisoner_per_year',
+    'incidents_per_month',          # across the whole prison
+    'exams_per_prisoner_per_year',
+    'years',                        # history covered by visits, incidents and exams
+])
+
+SCALES = {
+    'small': Scale(cells=200, cells_per_block=50, prisoners_per_cell=2, released_per_prisoner=1,
+                   staff=100, doctors=10, visits_per_prisoner_per_year=12, incidents_per_month=20,
+                   exams_per_prisoner_per_year=2, years=3),
+    'medium': Scale(cells=20000, cells_per_block=200, prisoners_per_cell=2.5, released_per_prisoner=1,
+                    staff=2000, doctors=100, visits_per_prisoner_per_year=12, incidents_per_month=500,
+                    exams_per_prisoner_per_year=2, years=3),
+    'large': Scale(cells=250000, cells_per_block=500, prisoners_per_cell=2, released_per_prisoner=1,
+                   staff=20000, doctors=1000, visits_per_prisoner_per_year=6, incidents_per_month=5000,
+                   exams_per_prisoner_per_year=2, years=3),
+}
+
+FIRST_NAMES = ["James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "David",
+               "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas",
+               "Sarah", "Charles", "Karen", "Ahmed", "Fatima", "Ali", "Aisha", "Wei", "Mei", "Carlos",
+               "Maria", "Ivan", "Olga", "Kwame", "Amara", "Hiroshi", "Yuki", "Raj", "Priya"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez",
+              "Martinez", "Hernandez", "Lopez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore",
+              "Jackson", "Martin", "Lee", "Khan", "Hussain", "Chen", "Wang", "Silva", "Santos", "Petrov",
+              "Ivanova", "Mensah", "Okafor", "Tanaka", "Sato", "Patel", "Sharma", "Kim", "Nguyen"]
+GENDERS = ["Male"] * 9 + ["Female"] * 1
+CRIMES = ["Theft", "Burglary", "Armed robbery", "Assault", "Fraud", "Drug trafficking", "Drug possession",
+          "Homicide", "Arson", "Embezzlement", "Vandalism", "Kidnapping", "Forgery", "Money laundering"]
+ROLES = ["Guard"] * 6 + ["Warden", "Counselor", "Administrator", "Cook"]
+RELATIONSHIPS = ["Mother", "Father", "Spouse", "Brother", "Sister", "Son", "Daughter", "Friend", "Lawyer"]
+INCIDENTS = ["Fight in the yard", "Contraband found during cell search", "Refused to return to cell",
+             "Assault on a guard", "Damage to property", "Attempted escape", "Verbal threats to staff",
+             "Self-harm", "Possession of a weapon", "Disturbance in the dining hall"]
+DIAGNOSES = ["Hypertension", "Type 2 diabetes", "Asthma", "Influenza", "Depression", "Anxiety",
+             "Back pain", "Dental abscess", "Hepatitis C", "Fracture", "Skin infection", "Routine check-up"]
+TREATMENTS = ["Medication prescribed", "Rest and fluids", "Referred to specialist", "Counselling sessions",
+              "Physiotherapy", "Antibiotics", "Inhaler prescribed", "Dressing and follow-up", "No treatment needed"]
+VISIT_TIMES = [start for start, end in scheduling.SLOTS] + [
+    f"{start[:2]}:30" for start, end in scheduling.SLOTS]
+
+# Parents first, so a batch never refers to a row not written yet
+TABLE_ORDER = ["Cell", "Staff", "Prisoner", "Visitor", "IncidentReport", "MedicalRecord"]
+INSERTS = {
+    'Cell': """INSERT INTO Cell (cell_id, cell_number, capacity, current_occupancy, block_number)
+               VALUES (%s, %s, %s, %s, %s)""",
+    'Staff': """INSERT INTO Staff (staff_id, first_name, last_name, gender, date_of_birth, role,
+                salary, hire_date) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
+    'Prisoner': """INSERT INTO Prisoner (prisoner_id, first_name, last_name, gender, date_of_birth,
+                   date_of_incarceration, date_of_release, crime_committed, status, cell_id)
+                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+    'Visitor': """INSERT INTO Visitor (visitor_id, prisoner_id, first_name, last_name, relationship,
+                  visit_date, visit_time) VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+    'IncidentReport': """INSERT INTO IncidentReport (report_id, prisoner_id, staff_id, incident_description,
+                         incident_date) VALUES (%s, %s, %s, %s, %s)""",
+    'MedicalRecord': """INSERT INTO MedicalRecord (medical_id, prisoner_id, diagnosis, treatment,
+                        date_of_examination, doctor_id) VALUES (%s, %s, %s, %s, %s, %s)""",
+}
+PRIMARY_KEYS = {'Cell': "cell_id", 'Staff': "staff_id", 'Prisoner': "prisoner_id",
+                'Visitor': "visitor_id", 'IncidentReport': "report_id", 'MedicalRecord': "medical_id"}
+
+
+class BatchWriter:
+    """Buffers rows per table and writes all buffers, parents first, when one fills up"""
+    def __init__(self, db, batch_size=BATCH_SIZE, on_progress=None):
+        self.db = db
+        self.batch_size = batch_size
+        self.on_progress = on_progress
+        self.buffers = {table: [] for table in TABLE_ORDER}
+        self.written = dict.fromkeys(TABLE_ORDER, 0)
+
+    def add(self, table, row):
+        buffer = self.buffers[table]
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        with self.db.cursor() as cursor:
+            for table in TABLE_ORDER:
+                rows = self.buffers[table]
+                if rows:
+                    cursor.executemany(INSERTS[table], rows)
+                    self.written[table] += len(rows)
+                    self.buffers[table] = []
+        if self.on_progress is not None:
+            self.on_progress(dict(self.written))
+
+
+def next_ids(db):
+    """{table: first free id}, so generated rows can go into a database that has data"""
+    return {table: (db.fetchone(f"SELECT MAX({key}) FROM {table}")[0] or 0) + 1
+            for table, key in PRIMARY_KEYS.items()}
+
+
+def generate(db, scale=SCALES['small'], seed=0, as_of=AS_OF, batch_size=BATCH_SIZE, on_progress=None):
+    """Write a dataset of the given Scale; returns {table: rows written}"""
+    rng = random.Random(seed)
+    ids = next_ids(db)
+    writer = BatchWriter(db, batch_size, on_progress)
+    history_start = as_of - timedelta(days=int(365 * scale.years))
+
+    # Cells, each with its incarcerated prisoners counted up front
+    occupants = []
+    for i in range(scale.cells):
+        cell_id = ids['Cell'] + i
+        count = int(scale.prisoners_per_cell)
+        if rng.random() < scale.prisoners_per_cell - count:
+            count += 1
+        capacity = max(count + rng.randint(0, 2), 1)
+        block = f"Block {i // scale.cells_per_block + 1}"
+        writer.add('Cell', (cell_id, f"C{cell_id}", capacity, count, block))
+        occupants.append(count)
+
+    staff_ids = range(ids['Staff'], ids['Staff'] + scale.staff)
+    doctor_ids = staff_ids[:max(min(scale.doctors, scale.staff), 1)]
+    for staff_id in staff_ids:
+        role = "Doctor" if staff_id in doctor_ids else rng.choice(ROLES)
+        hire_date = as_of - timedelta(days=rng.randint(30, 25 * 365))
+        writer.add('Staff', (staff_id, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.choice(GENDERS),
+                             hire_date - timedelta(days=rng.randint(20 * 365, 45 * 365)), role,
+                             round(rng.uniform(30000, 120000), 2), hire_date))
+
+    prisoner_id = ids['Prisoner']
+    visitor_id = ids['Visitor']
+    medical_id = ids['MedicalRecord']
+
+    def add_prisoner(cell_id, incarcerated):
+        nonlocal prisoner_id, visitor_id, medical_id
+        sentence = timedelta(days=rng.randint(180, 20 * 365))
+        if incarcerated:
+            incarceration = as_of - timedelta(days=rng.randint(0, sentence.days - 1))
+            release = incarceration + sentence
+            status = "Incarcerated"
+        else:
+            release = as_of - timedelta(days=rng.randint(1, 2 * 365 * scale.years))
+            incarceration = release - sentence
+            status = rng.choice(["Released"] * 4 + ["Paroled"])
+        writer.add('Prisoner', (prisoner_id, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.choice(GENDERS),
+                                incarceration - timedelta(days=rng.randint(18 * 365, 60 * 365)), incarceration,
+                                release, rng.choice(CRIMES), status, cell_id))
+
+        # Visits and exams fall in the part of the sentence inside the history window
+        start = max(incarceration, history_start)
+        end = min(release, as_of)
+        days = (end - start).days
+        if days > 0:
+            for i in range(_count(rng, scale.visits_per_prisoner_per_year * days / 365)):
+                writer.add('Visitor', (visitor_id, prisoner_id, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+                                       rng.choice(RELATIONSHIPS), start + timedelta(days=rng.randrange(days)),
+                                       rng.choice(VISIT_TIMES)))
+                visitor_id += 1
+            for i in range(_count(rng, scale.exams_per_prisoner_per_year * days / 365)):
+                writer.add('MedicalRecord', (medical_id, prisoner_id, rng.choice(DIAGNOSES),
+                                             rng.choice(TREATMENTS), start + timedelta(days=rng.randrange(days)),
+                                             rng.choice(doctor_ids)))
+                medical_id += 1
+        prisoner_id += 1
+
+    for i, count in enumerate(occupants):
+        for j in range(count):
+            add_prisoner(ids['Cell'] + i, True)
+    incarcerated_ids = range(ids['Prisoner'], prisoner_id)
+    del occupants
+
+    # Former prisoners keep the cell they were last held in
+    for i in range(int(len(incarcerated_ids) * scale.released_per_prisoner)):
+        add_prisoner(ids['Cell'] + rng.randrange(scale.cells), False)
+
+    if incarcerated_ids:
+        history_days = max((as_of - history_start).days, 1)
+        for i in range(int(scale.incidents_per_month * 12 * scale.years)):
+            writer.add('IncidentReport', (ids['IncidentReport'] + i, rng.choice(incarcerated_ids),
+                                          rng.choice(staff_ids), rng.choice(INCIDENTS),
+                                          history_start + timedelta(days=rng.randrange(history_days))))
+
+    writer.flush()
+    return writer.written
+
+
+def _count(rng, expected):
+    """A whole number of events averaging expected"""
+    count = int(expected)
+    return count + (1 if rng.random() < expected - count else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a pms database with synthetic data")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--as-of', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+                        default=AS_OF, help="date the data is generated as of")
+    parser.add_argument('--cells', type=int, help="override the scale's number of cells")
+    parser.add_argument('--prisoners-per-cell', type=float)
+    parser.add_argument('--visits-per-year', type=float, help="visits per prisoner per year")
+    parser.add_argument('--incidents-per-month', type=float)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--url', default=database.DATABASE_URL, help="database url, MySQL by default")
+    args = parser.parse_args()
+
+    scale = SCALES[args.scale]
+    overrides = {'cells': args.cells, 'prisoners_per_cell': args.prisoners_per_cell,
+                 'visits_per_prisoner_per_year': args.visits_per_year,
+                 'incidents_per_month': args.incidents_per_month}
+    scale = scale._replace(**{field: value for field, value in overrides.items() if value is not None})
+
+    def progress(written):
+        print("\r" + ", ".join(f"{table} {count}" for table, count in written.items()), end="", flush=True)
+
+    db = database.connect(args.url)
+    try:
+        migrations.migrate(db)
+        written = generate(db, scale, args.seed, args.as_of, args.batch_size, progress)
+        print()
+        print(f"Generated {sum(written.values())} rows with seed {args.seed}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Run database work off the Tk main thread
+
+Work is submitted per tab to a small thread pool. Finished results are
+queued and handed to their callbacks from the Tk event loop, which polls
+the queue with root.after, so widgets are only ever touched on the main
+thread.
+"""
+import queue
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+WORKERS = 4
+POLL_MS = 30
+
+
+class QueryExecutor:
+    """Thread pool for database work with per-tab cancellation and loading state"""
+
+    def __init__(self, root, workers=WORKERS, poll_ms=POLL_MS, on_busy=None):
+        # on_busy(tab, busy) is called when a tab starts or stops waiting on work
+        self.root = root
+        self.poll_ms = poll_ms
+        self.on_busy = on_busy
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pms-query')
+        self.results = queue.Queue()
+        self.generations = {}
+        self.futures = {}
+        self.pending = {}
+        self.root.after(self.poll_ms, self._drain)
+
+    def submit(self, tab, work, on_success, on_error=None, cancellable=True):
+        """Run work() on a worker and pass its result to on_success on the Tk thread
+
+        Writes should pass cancellable=False so their result is always shown.
+        """
+        generation = self.generations.get(tab, 0) if cancellable else None
+        self._set_pending(tab, 1)
+        future = self.pool.submit(work)
+        if cancellable:
+            self.futures.setdefault(tab, set()).add(future)
+        future.add_done_callback(
+            lambda f: self.results.put((tab, generation, f, on_success, on_error)))
+        return future
+
+    def cancel(self, tab):
+        """Drop the results of cancellable work for tab, skipping it if not started yet
+
+        Returns True if there was outstanding work to cancel.
+        """
+        self.generations[tab] = self.generations.get(tab, 0) + 1
+        futures = self.futures.pop(tab, set())
+        for future in futures:
+            future.cancel()
+        return bool(futures)
+
+    def is_busy(self, tab):
+        return self.pending.get(tab, 0) > 0
+
+    def shutdown(self, wait=False):
+        """Drop work not yet started; with wait, let running work finish first"""
+        self.pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _set_pending(self, tab, delta):
+        was_busy = self.is_busy(tab)
+        self.pending[tab] = self.pending.get(tab, 0) + delta
+        if self.on_busy is not None and was_busy != self.is_busy(tab):
+            self.on_busy(tab, self.is_busy(tab))
+
+    def _drain(self):
+        while True:
+            try:
+                tab, generation, future, on_success, on_error = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            self._set_pending(tab, -1)
+            self.futures.get(tab, set()).discard(future)
+            if future.cancelled():
+                continue
+            if generation is not None and generation != self.generations.get(tab, 0):
+                continue
+
+            try:
+                error = future.exception()
+                if error is None:
+                    on_success(future.result())
+                elif on_error is not None:
+                    on_error(error)
+                else:
+                    raise error
+            except Exception:
+                self.root.report_callback_exception(*sys.exc_info())
+
+        self.root.after(self.poll_ms, self._drain)
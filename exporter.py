@@ -0,0 +1,168 @@
+"""Streaming export of the pms tables to CSV or Parquet
+
+Rows are read through an unbuffered cursor in fetchmany chunks and written
+out chunk by chunk, so memory use does not grow with the table. Parquet
+output needs pyarrow; CSV works everywhere.
+
+Usage: python exporter.py TABLE FILE [--url URL]
+"""
+import argparse
+import csv
+import os
+
+import database
+import scheduling
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+CHUNK_SIZE = 5000
+
+# Table key -> (table, primary key, [(column, type)])
+EXPORTS = {
+    'prisoner': ("Prisoner", "prisoner_id", [
+        ("prisoner_id", "int"), ("first_name", "str"), ("last_name", "str"), ("gender", "str"),
+        ("date_of_birth", "date"), ("date_of_incarceration", "date"), ("date_of_release", "date"),
+        ("crime_committed", "str"), ("status", "str"), ("cell_id", "int")]),
+    'cell': ("Cell", "cell_id", [
+        ("cell_id", "int"), ("cell_number", "str"), ("capacity", "int"),
+        ("current_occupancy", "int"), ("block_number", "str")]),
+    'visitor': ("Visitor", "visitor_id", [
+        ("visitor_id", "int"), ("prisoner_id", "int"), ("first_name", "str"), ("last_name", "str"),
+        ("relationship", "str"), ("visit_date", "date"), ("visit_time", "time")]),
+    'staff': ("Staff", "staff_id", [
+        ("staff_id", "int"), ("first_name", "str"), ("last_name", "str"), ("gender", "str"),
+        ("date_of_birth", "date"), ("role", "str"), ("salary", "float"), ("hire_date", "date")]),
+    'incident': ("IncidentReport", "report_id", [
+        ("report_id", "int"), ("prisoner_id", "int"), ("staff_id", "int"),
+        ("incident_date", "date"), ("incident_description", "str")]),
+    'medical': ("MedicalRecord", "medical_id", [
+        ("medical_id", "int"), ("prisoner_id", "int"), ("doctor_id", "int"),
+        ("date_of_examination", "date"), ("diagnosis", "str"), ("treatment", "str")]),
+}
+
+
+# Soft-deleted rows are left out of exports
+LIVE_ROWS = {
+    'prisoner': "deleted_at IS NULL",
+    'visitor': "deleted_at IS NULL",
+}
+
+
+def export_table(db, key, path, conditions=(), params=(), chunk_size=CHUNK_SIZE, on_progress=None):
+    """Write the rows of one table, optionally filtered, to a .csv or .parquet file
+
+    conditions/params are a WHERE clause as built by search.prisoner_filter.
+    on_progress(rows written) is called after each chunk. Returns the row count.
+    """
+    table, primary_key, columns = EXPORTS[key]
+    query = f"SELECT {', '.join(name for name, kind in columns)} FROM {table}"
+    conditions = list(conditions)
+    if key in LIVE_ROWS:
+        conditions.append(LIVE_ROWS[key])
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {primary_key}"
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        writer = CSVWriter(path, columns)
+    elif extension == '.parquet':
+        writer = ParquetWriter(path, columns)
+    else:
+        raise ValueError(f"Unsupported export type: {extension}")
+
+    times = [i for i, (name, kind) in enumerate(columns) if kind == "time"]
+    written = 0
+    try:
+        with db.cursor() as cursor:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                if times:
+                    rows = [_with_times(row, times) for row in rows]
+                writer.write(rows)
+                written += len(rows)
+                if on_progress is not None:
+                    on_progress(written)
+    finally:
+        writer.close()
+    return written
+
+
+def hh_mm(value):
+    """A visit time as the HH:MM text the forms store, whether read from MySQL or SQLite"""
+    if value is None or value == "":
+        return value
+    m = scheduling.minutes(value)
+    return f"{m // 60:02d}:{m % 60:02d}"
+
+
+def _with_times(row, times):
+    # MySQL returns TIME columns as timedelta
+    row = list(row)
+    for i in times:
+        row[i] = hh_mm(row[i])
+    return row
+
+
+class CSVWriter:
+    def __init__(self, path, columns):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, kind in columns])
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """Writes each chunk as a row group with a schema fixed up front"""
+    def __init__(self, path, columns):
+        if pyarrow is None:
+            raise RuntimeError("Parquet export needs pyarrow to be installed")
+        types = {"int": pyarrow.int64(), "str": pyarrow.string(), "time": pyarrow.string(),
+                 "date": pyarrow.date32(), "float": pyarrow.float64()}
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        arrays = []
+        for i, field in enumerate(self.schema):
+            values = [row[i] for row in rows]
+            if field.type == pyarrow.float64():
+                # MySQL returns DECIMAL columns as Decimal
+                values = [float(value) if value is not None else None for value in values]
+            arrays.append(pyarrow.array(values, type=field.type))
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a table to CSV or Parquet")
+    parser.add_argument('table', choices=sorted(EXPORTS))
+    parser.add_argument('path', help="output file ending in .csv or .parquet")
+    parser.add_argument('--url', default=database.DATABASE_URL, help="database url, MySQL by default")
+    args = parser.parse_args()
+
+    db = database.connect(args.url)
+    try:
+        count = export_table(db, args.table, args.path,
+                             on_progress=lambda n: print(f"{n} rows", end='\r', flush=True))
+    finally:
+        db.close()
+    print(f"Exported {count} rows to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
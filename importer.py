@@ -0,0 +1,202 @@
+"""Bulk import of prisoners and visitors from CSV or JSON files
+
+Files are read as a stream and written in batches with executemany, one
+transaction per batch. Rows are validated with the same rules as the
+forms (see records.py); rows that fail validation or are refused by the
+database are reported back instead of aborting the import. Imported
+prisoners take their beds in the same transaction as the insert, so a
+batch that would overfill a cell is refused like any other bad row.
+Imported visits from today on are checked against their visiting room's
+capacity the same way (see scheduling.check_booked_rows); past visits are
+history and are imported as they are.
+With --allocate, incarcerated prisoners without a cell_id are given the
+emptiest free cells (see allocation.py). Each batch writes an IMPORT
+entry to the audit log in its own transaction (see audit.record_bulk).
+
+CSV files need a header row with the column names from records.py. JSON
+files are either an array of objects or one object per line (.jsonl).
+
+Usage: python importer.py {prisoners,visitors} FILE [--batch-size N] [--allocate]
+                          [--rejects FILE] [--url URL]
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+
+import allocation
+import audit
+import database
+import occupancy
+import records
+import scheduling
+
+BATCH_SIZE = 1000
+
+# kind -> (table, columns, clean, after_insert(db, cursor, rows) or None)
+TABLES = {
+    'prisoners': ("Prisoner", records.PRISONER_COLUMNS, records.clean_prisoner,
+                  occupancy.place_prisoner_rows),
+    'visitors': ("Visitor", records.VISITOR_COLUMNS, records.clean_visitor, scheduling.check_booked_rows),
+}
+
+
+class ImportResult:
+    def __init__(self):
+        self.inserted = 0
+        # (line or record number, error message)
+        self.rejects = []
+        # Days of the visits imported, whose room bookings changed
+        self.visit_dates = set()
+
+    def __str__(self):
+        return f"{self.inserted} rows imported, {len(self.rejects)} rejected"
+
+
+def read_records(path):
+    """Yield (line number, record dict) from a CSV, JSON or JSON Lines file"""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if extension == '.csv':
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+        elif extension in ('.jsonl', '.ndjson'):
+            for number, line in enumerate(f, start=1):
+                if line.strip():
+                    yield number, json.loads(line)
+        elif extension == '.json':
+            # A JSON array has to be parsed whole; use .jsonl for very large files
+            for number, record in enumerate(json.load(f), start=1):
+                yield number, record
+        else:
+            raise ValueError(f"Unsupported file type: {extension}")
+
+
+def import_file(db, kind, path, batch_size=BATCH_SIZE, on_progress=None, allocator=None, user=None):
+    """Import a prisoners or visitors file into db and return an ImportResult
+
+    on_progress(result) is called after each batch. Given a CellAllocator,
+    prisoners that need a bed and have no cell_id are assigned one. The
+    audit entries are made as user, the login name by default.
+    """
+    table, columns, clean, after_insert = TABLES[kind]
+    query = (f"INSERT INTO {table} ({', '.join(columns)}) "
+             f"VALUES ({', '.join(['%s'] * len(columns))})")
+    result = ImportResult()
+    source = os.path.basename(path)
+
+    def after_batch(cursor, batch):
+        if after_insert is not None:
+            after_insert(db, cursor, [values for number, values in batch])
+        first, last = batch[0][0], batch[-1][0]
+        audit.record_bulk(cursor, table, f"{source}:{first}-{last}",
+                          {"file": source, "first": first, "last": last, "rows": len(batch)}, user)
+
+    numbered_records = read_records(path)
+    while True:
+        chunk = list(itertools.islice(numbered_records, batch_size))
+        if not chunk:
+            break
+
+        batch = []
+        for number, record in chunk:
+            try:
+                batch.append((number, clean(record)))
+            except (ValueError, AttributeError) as e:
+                result.rejects.append((number, str(e)))
+
+        if allocator is not None and kind == 'prisoners':
+            batch = assign_cells(allocator, batch, result)
+        if batch:
+            rejected = len(result.rejects)
+            write_batch(db, query, batch, result, after_batch)
+            if kind == 'visitors':
+                refused = {number for number, error in result.rejects[rejected:]}
+                result.visit_dates.update(values[4] for number, values in batch if number not in refused)
+            if allocator is not None and len(result.rejects) > rejected:
+                # Some reserved beds were not taken after all
+                allocator.invalidate()
+        if on_progress is not None:
+            on_progress(result)
+
+    return result
+
+
+def assign_cells(allocator, batch, result):
+    """Give the prisoners in a batch that need a bed but have no cell the emptiest cells
+
+    Returns the batch without the rows that could not be given a cell.
+    """
+    def needs_cell(values):
+        return values[8] is None and values[7] == occupancy.OCCUPYING_STATUS
+
+    homeless = [values for number, values in batch if needs_cell(values)]
+    if not homeless:
+        return batch
+    try:
+        cells = allocator.allocate(len(homeless))
+    except occupancy.CellFullError as e:
+        result.rejects.extend((number, str(e)) for number, values in batch if needs_cell(values))
+        return [(number, values) for number, values in batch if not needs_cell(values)]
+    for values, cell_id in zip(homeless, cells):
+        values[8] = cell_id
+    return batch
+
+
+def write_batch(db, query, batch, result, after_batch=None):
+    """Insert a batch in one transaction, or row by row to find the rejects if that fails
+
+    after_batch(cursor, batch) runs in the same transaction as the inserts,
+    with the (number, values) pairs inserted.
+    """
+    rows = [values for number, values in batch]
+    try:
+        with db.cursor() as cursor:
+            cursor.executemany(query, rows)
+            if after_batch is not None:
+                after_batch(cursor, batch)
+        result.inserted += len(batch)
+    except Exception:
+        for number, values in batch:
+            try:
+                with db.cursor() as cursor:
+                    cursor.execute(query, values)
+                    if after_batch is not None:
+                        after_batch(cursor, [(number, values)])
+                result.inserted += 1
+            except Exception as e:
+                result.rejects.append((number, str(e)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import prisoners or visitors")
+    parser.add_argument('kind', choices=sorted(TABLES))
+    parser.add_argument('path')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--allocate', action='store_true',
+                        help="assign free cells to incarcerated prisoners without a cell_id")
+    parser.add_argument('--rejects', help="write rejected rows to this CSV file")
+    parser.add_argument('--url', default=database.DATABASE_URL, help="database url, MySQL by default")
+    args = parser.parse_args()
+
+    db = database.connect(args.url)
+    try:
+        allocator = allocation.CellAllocator(db) if args.allocate else None
+        result = import_file(db, args.kind, args.path, args.batch_size,
+                             on_progress=lambda r: print(r, end='\r', flush=True),
+                             allocator=allocator)
+    finally:
+        db.close()
+
+    print(result)
+    if args.rejects and result.rejects:
+        with open(args.rejects, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["line", "error"])
+            writer.writerows(result.rejects)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""Versioned schema migrations for the pms database
+
+Each migration is (version, description, statements). Statements are SQL
+strings, or a dict of dialect -> statements where MySQL and SQLite need
+different DDL. Applied versions are recorded in schema_migrations, so
+running the migrations again only applies the new ones.
+
+Version 0 creates the six base tables with their keys, so an empty MySQL
+or SQLite database can be brought up to the current schema from scratch.
+Its CREATE TABLE IF NOT EXISTS leaves databases made before it untouched.
+
+Usage: python migrations.py [database url] [--to VERSION] [--status]
+"""
+import argparse
+
+import database
+import scheduling
+
+# The tables as the app was first built on, before any later migration
+BASE_SCHEMA = {
+    'mysql': [
+        """CREATE TABLE IF NOT EXISTS Cell (
+           cell_id INT AUTO_INCREMENT PRIMARY KEY,
+           cell_number VARCHAR(10) NOT NULL UNIQUE,
+           capacity INT NOT NULL,
+           current_occupancy INT DEFAULT 0,
+           block_number VARCHAR(10) NOT NULL)""",
+        """CREATE TABLE IF NOT EXISTS Prisoner (
+           prisoner_id INT AUTO_INCREMENT PRIMARY KEY,
+           first_name VARCHAR(50) NOT NULL,
+           last_name VARCHAR(50) NOT NULL,
+           gender ENUM('Male', 'Female', 'Other') NOT NULL,
+           date_of_birth DATE NOT NULL,
+           date_of_incarceration DATE NOT NULL,
+           date_of_release DATE,
+           crime_committed TEXT NOT NULL,
+           status ENUM('Incarcerated', 'Released', 'Paroled') NOT NULL,
+           cell_id INT,
+           FOREIGN KEY (cell_id) REFERENCES Cell(cell_id))""",
+        """CREATE TABLE IF NOT EXISTS Staff (
+           staff_id INT AUTO_INCREMENT PRIMARY KEY,
+           first_name VARCHAR(50) NOT NULL,
+           last_name VARCHAR(50) NOT NULL,
+           gender ENUM('Male', 'Female', 'Other') NOT NULL,
+           date_of_birth DATE NOT NULL,
+           role VARCHAR(50) NOT NULL,
+           salary DECIMAL(10, 2) NOT NULL,
+           hire_date DATE NOT NULL)""",
+        """CREATE TABLE IF NOT EXISTS Visitor (
+           visitor_id INT AUTO_INCREMENT PRIMARY KEY,
+           prisoner_id INT,
+           first_name VARCHAR(50) NOT NULL,
+           last_name VARCHAR(50) NOT NULL,
+           relationship VARCHAR(50) NOT NULL,
+           visit_date DATE NOT NULL,
+           visit_time TIME NOT NULL,
+           FOREIGN KEY (prisoner_id) REFERENCES Prisoner(prisoner_id))""",
+        """CREATE TABLE IF NOT EXISTS IncidentReport (
+           report_id INT AUTO_INCREMENT PRIMARY KEY,
+           prisoner_id INT,
+           staff_id INT,
+           incident_description TEXT NOT NULL,
+           incident_date DATE NOT NULL,
+           FOREIGN KEY (prisoner_id) REFERENCES Prisoner(prisoner_id),
+           FOREIGN KEY (staff_id) REFERENCES Staff(staff_id))""",
+        """CREATE TABLE IF NOT EXISTS MedicalRecord (
+           medical_id INT AUTO_INCREMENT PRIMARY KEY,
+           prisoner_id INT,
+           diagnosis TEXT NOT NULL,
+           treatment TEXT NOT NULL,
+           date_of_examination DATE NOT NULL,
+           doctor_id INT,
+           FOREIGN KEY (prisoner_id) REFERENCES Prisoner(prisoner_id),
+           FOREIGN KEY (doctor_id) REFERENCES Staff(staff_id))""",
+    ],
+    # INTEGER PRIMARY KEY is SQLite's auto-increment; ENUMs become CHECKs
+    'sqlite': [
+        """CREATE TABLE IF NOT EXISTS Cell (
+           cell_id INTEGER PRIMARY KEY,
+           cell_number VARCHAR(10) NOT NULL UNIQUE,
+           capacity INT NOT NULL,
+           current_occupancy INT DEFAULT 0,
+           block_number VARCHAR(10) NOT NULL)""",
+        """CREATE TABLE IF NOT EXISTS Prisoner (
+           prisoner_id INTEGER PRIMARY KEY,
+           first_name VARCHAR(50) NOT NULL,
+           last_name VARCHAR(50) NOT NULL,
+           gender VARCHAR(10) NOT NULL CHECK (gender IN ('Male', 'Female', 'Other')),
+           date_of_birth DATE NOT NULL,
+           date_of_incarceration DATE NOT NULL,
+           date_of_release DATE,
+           crime_committed TEXT NOT NULL,
+           status VARCHAR(20) NOT NULL CHECK (status IN ('Incarcerated', 'Released', 'Paroled')),
+           cell_id INT REFERENCES Cell(cell_id))""",
+        """CREATE TABLE IF NOT EXISTS Staff (
+           staff_id INTEGER PRIMARY KEY,
+           first_name VARCHAR(50) NOT NULL,
+           last_name VARCHAR(50) NOT NULL,
+           gender VARCHAR(10) NOT NULL CHECK (gender IN ('Male', 'Female', 'Other')),
+           date_of_birth DATE NOT NULL,
+           role VARCHAR(50) NOT NULL,
+           salary DECIMAL(10, 2) NOT NULL,
+           hire_date DATE NOT NULL)""",
+        """CREATE TABLE IF NOT EXISTS Visitor (
+           visitor_id INTEGER PRIMARY KEY,
+           prisoner_id INT REFERENCES Prisoner(prisoner_id),
+           first_name VARCHAR(50) NOT NULL,
+           last_name VARCHAR(50) NOT NULL,
+           relationship VARCHAR(50) NOT NULL,
+           visit_date DATE NOT NULL,
+           visit_time TIME NOT NULL)""",
+        """CREATE TABLE IF NOT EXISTS IncidentReport (
+           report_id INTEGER PRIMARY KEY,
+           prisoner_id INT REFERENCES Prisoner(prisoner_id),
+           staff_id INT REFERENCES Staff(staff_id),
+           incident_description TEXT NOT NULL,
+           incident_date DATE NOT NULL)""",
+        """CREATE TABLE IF NOT EXISTS MedicalRecord (
+           medical_id INTEGER PRIMARY KEY,
+           prisoner_id INT REFERENCES Prisoner(prisoner_id),
+           diagnosis TEXT NOT NULL,
+           treatment TEXT NOT NULL,
+           date_of_examination DATE NOT NULL,
+           doctor_id INT REFERENCES Staff(staff_id))""",
+    ],
+}
+
+MIGRATIONS = [
+    (0, "Base tables with primary and foreign keys", BASE_SCHEMA),
+    (1, "Indexes for the prisoner search bar", [
+        "CREATE INDEX idx_prisoner_status_cell ON Prisoner (status, cell_id)",
+        "CREATE INDEX idx_prisoner_name ON Prisoner (last_name, first_name)",
+        "CREATE INDEX idx_prisoner_first_name ON Prisoner (first_name)",
+        "CREATE INDEX idx_prisoner_incarceration ON Prisoner (date_of_incarceration)",
+    ]),
+    (2, "FULLTEXT indexes for record search", {
+        'mysql': [
+            "CREATE FULLTEXT INDEX ft_prisoner_crime ON Prisoner (crime_committed)",
+            "CREATE FULLTEXT INDEX ft_incident_description ON IncidentReport (incident_description)",
+            "CREATE FULLTEXT INDEX ft_medical_text ON MedicalRecord (diagnosis, treatment)",
+        ],
+        # SQLite searches through search.InvertedIndexSearch instead
+        'sqlite': [],
+    }),
+    # The list joins themselves go through primary keys; these cover the
+    # child-side lookups by prisoner and staff member
+    (3, "Foreign key indexes for the joined Visitor, Incident and Medical lists", [
+        "CREATE INDEX idx_visitor_prisoner ON Visitor (prisoner_id, visit_date)",
+        "CREATE INDEX idx_incident_prisoner ON IncidentReport (prisoner_id, incident_date)",
+        "CREATE INDEX idx_incident_staff ON IncidentReport (staff_id)",
+        "CREATE INDEX idx_medical_prisoner ON MedicalRecord (prisoner_id, date_of_examination)",
+        "CREATE INDEX idx_medical_doctor ON MedicalRecord (doctor_id)",
+    ]),
+    # One visiting room per block, starting at scheduling.DEFAULT_ROOM_CAPACITY places
+    (4, "Visiting rooms and the visit schedule index", [
+        """CREATE TABLE VisitingRoom (
+           block_number VARCHAR(20) PRIMARY KEY,
+           capacity INT NOT NULL)""",
+        f"""INSERT INTO VisitingRoom (block_number, capacity)
+           SELECT DISTINCT block_number, {scheduling.DEFAULT_ROOM_CAPACITY} FROM Cell
+           WHERE block_number IS NOT NULL""",
+        "CREATE INDEX idx_visitor_schedule ON Visitor (visit_date, visit_time)",
+    ]),
+    (5, "Index for due releases and the release forecast", [
+        "CREATE INDEX idx_prisoner_release ON Prisoner (status, date_of_release)",
+    ]),
+    # Written only by audit.AuditWriter, never updated or deleted
+    (6, "Audit log of writes made through the app", {
+        'mysql': [
+            """CREATE TABLE AuditLog (
+               audit_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+               changed_at DATETIME NOT NULL,
+               changed_by VARCHAR(100),
+               table_name VARCHAR(64) NOT NULL,
+               row_id VARCHAR(64) NOT NULL,
+               action VARCHAR(10) NOT NULL,
+               before_image TEXT,
+               after_image TEXT)""",
+            "CREATE INDEX idx_audit_row ON AuditLog (table_name, row_id, audit_id)",
+        ],
+        'sqlite': [
+            """CREATE TABLE AuditLog (
+               audit_id INTEGER PRIMARY KEY AUTOINCREMENT,
+               changed_at TIMESTAMP NOT NULL,
+               changed_by VARCHAR(100),
+               table_name VARCHAR(64) NOT NULL,
+               row_id VARCHAR(64) NOT NULL,
+               action VARCHAR(10) NOT NULL,
+               before_image TEXT,
+               after_image TEXT)""",
+            "CREATE INDEX idx_audit_row ON AuditLog (table_name, row_id, audit_id)",
+        ],
+    }),
+    # Checked by the app's updates, see concurrency.py
+    (7, "Row versions for records edited concurrently", [
+        "ALTER TABLE Prisoner ADD COLUMN row_version INT NOT NULL DEFAULT 0",
+        "ALTER TABLE Staff ADD COLUMN row_version INT NOT NULL DEFAULT 0",
+    ]),
+    # Filled by archive.py; the History views read the hot and archived rows together
+    (8, "Soft delete and archive tables for prisoners and visits", [
+        "ALTER TABLE Prisoner ADD COLUMN deleted_at DATETIME NULL",
+        "ALTER TABLE Visitor ADD COLUMN deleted_at DATETIME NULL",
+        "CREATE INDEX idx_prisoner_deleted ON Prisoner (deleted_at)",
+        "CREATE INDEX idx_visitor_deleted ON Visitor (deleted_at)",
+        """CREATE TABLE PrisonerArchive (
+           prisoner_id INT PRIMARY KEY,
+           first_name VARCHAR(100),
+           last_name VARCHAR(100),
+           gender VARCHAR(10),
+           date_of_birth DATE,
+           date_of_incarceration DATE,
+           date_of_release DATE,
+           crime_committed TEXT,
+           status VARCHAR(20),
+           cell_id INT,
+           row_version INT NOT NULL DEFAULT 0,
+           deleted_at DATETIME NULL,
+           archived_at DATETIME NOT NULL)""",
+        "CREATE INDEX idx_prisoner_archive_name ON PrisonerArchive (last_name, first_name)",
+        """CREATE TABLE VisitorArchive (
+           visitor_id INT PRIMARY KEY,
+           prisoner_id INT,
+           first_name VARCHAR(100),
+           last_name VARCHAR(100),
+           relationship VARCHAR(100),
+           visit_date DATE,
+           visit_time TIME,
+           deleted_at DATETIME NULL,
+           archived_at DATETIME NOT NULL)""",
+        "CREATE INDEX idx_visitor_archive_prisoner ON VisitorArchive (prisoner_id, visit_date)",
+        """CREATE VIEW PrisonerHistory AS
+           SELECT prisoner_id, first_name, last_name, gender, date_of_birth, date_of_incarceration,
+                  date_of_release, crime_committed, status, cell_id, deleted_at, NULL AS archived_at
+           FROM Prisoner
+           UNION ALL
+           SELECT prisoner_id, first_name, last_name, gender, date_of_birth, date_of_incarceration,
+                  date_of_release, crime_committed, status, cell_id, deleted_at, archived_at
+           FROM PrisonerArchive""",
+        """CREATE VIEW VisitorHistory AS
+           SELECT visitor_id, prisoner_id, first_name, last_name, relationship, visit_date, visit_time,
+                  deleted_at, NULL AS archived_at
+           FROM Visitor
+           UNION ALL
+           SELECT visitor_id, prisoner_id, first_name, last_name, relationship, visit_date, visit_time,
+                  deleted_at, archived_at
+           FROM VisitorArchive""",
+    ]),
+]
+
+
+def applied_versions(db):
+    """Return the set of migration versions already applied to db"""
+    with db.cursor() as cursor:
+        cursor.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                          version INT PRIMARY KEY,
+                          description VARCHAR(255) NOT NULL,
+                          applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
+    return {row[0] for row in db.fetchall("SELECT version FROM schema_migrations")}
+
+
+def schema_version(db):
+    """The highest migration version applied to db, or None for an empty database"""
+    return max(applied_versions(db), default=None)
+
+
+def migrate(db, migrations=MIGRATIONS, target=None):
+    """Apply every migration not applied yet, in version order, up to target if given
+
+    Returns the versions that were applied. MySQL commits DDL implicitly, so a
+    migration that fails halfway has to be finished or undone by hand.
+    """
+    applied = applied_versions(db)
+    newly_applied = []
+    for version, description, statements in sorted(migrations, key=lambda m: m[0]):
+        if version in applied or (target is not None and version > target):
+            continue
+        if isinstance(statements, dict):
+            statements = statements.get(db.dialect, [])
+
+        with db.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                           (version, description))
+        newly_applied.append(version)
+    return newly_applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or upgrade the pms database schema")
+    parser.add_argument('url', nargs='?', default=database.DATABASE_URL, help="database url, MySQL by default")
+    parser.add_argument('--to', type=int, metavar='VERSION', help="stop after this migration")
+    parser.add_argument('--status', action='store_true', help="only list the migrations and whether applied")
+    args = parser.parse_args()
+
+    db = database.connect(args.url)
+    try:
+        if args.status:
+            applied = applied_versions(db)
+            for version, description, statements in sorted(MIGRATIONS, key=lambda m: m[0]):
+                print(f"{version:3d}  {'applied' if version in applied else 'pending':8s} {description}")
+            return
+        versions = migrate(db, target=args.to)
+        if versions:
+            print("Applied migrations: " + ", ".join(str(v) for v in versions))
+        else:
+            print("Database schema is up to date")
+        print(f"Schema version: {schema_version(db)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
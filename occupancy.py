@@ -0,0 +1,123 @@
+"""Cell.current_occupancy bookkeeping
+
+A prisoner takes a bed when they are assigned a cell and their status is
+Incarcerated. Every placement, transfer, release and delete adjusts the
+counts of the cells involved inside the caller's transaction, locking the
+target cell first so two officers cannot fill the last bed at once.
+reconcile() recomputes all counts from the Prisoner table in one statement.
+
+Usage: python occupancy.py [database url]   (runs reconcile)
+"""
+import sys
+from collections import Counter
+
+import database
+
+OCCUPYING_STATUS = "Incarcerated"
+
+
+class CellFullError(Exception):
+    pass
+
+
+def bed_of(cell_id, status):
+    """The cell whose bed a prisoner with this cell_id and status takes, if any"""
+    if cell_id is not None and status == OCCUPYING_STATUS:
+        return cell_id
+    return None
+
+
+def current_bed(db, cursor, prisoner_id):
+    """Lock a prisoner row and return the cell whose bed it takes; None once deleted"""
+    cursor.execute("SELECT cell_id, status FROM Prisoner WHERE prisoner_id=%s AND deleted_at IS NULL" +
+                   db.for_update, (prisoner_id,))
+    row = cursor.fetchone()
+    return bed_of(*row) if row else None
+
+
+def lock_cell(db, cursor, cell_id):
+    """Lock a cell row and return (capacity, current_occupancy)"""
+    cursor.execute("SELECT capacity, current_occupancy FROM Cell WHERE cell_id=%s" + db.for_update,
+                   (cell_id,))
+    row = cursor.fetchone()
+    if row is None:
+        raise ValueError(f"Cell {cell_id} does not exist")
+    return row
+
+
+def move(db, cursor, old_cell, new_cell):
+    """Move one bed from old_cell to new_cell (either may be None)
+
+    Raises CellFullError if new_cell has no free bed. Returns the cells whose
+    counts changed.
+    """
+    if old_cell == new_cell:
+        return []
+    changed = []
+    if new_cell is not None:
+        place_many(db, cursor, {new_cell: 1})
+        changed.append(new_cell)
+    if old_cell is not None:
+        cursor.execute("""UPDATE Cell SET current_occupancy =
+                          CASE WHEN current_occupancy > 0 THEN current_occupancy - 1 ELSE 0 END
+                          WHERE cell_id=%s""", (old_cell,))
+        changed.append(old_cell)
+    return changed
+
+
+def place_many(db, cursor, beds_per_cell):
+    """Take beds in several cells at once, e.g. for a bulk intake
+
+    beds_per_cell maps cell_id -> number of new occupants. Cells are locked
+    in id order so concurrent intakes cannot deadlock.
+    """
+    for cell_id in sorted(beds_per_cell):
+        count = beds_per_cell[cell_id]
+        capacity, occupied = lock_cell(db, cursor, cell_id)
+        if occupied + count > capacity:
+            raise CellFullError(f"Cell {cell_id} is full ({occupied} of {capacity} beds taken)")
+        # The guard also covers SQLite, where the SELECT above takes no lock
+        cursor.execute("""UPDATE Cell SET current_occupancy = current_occupancy + %s
+                          WHERE cell_id=%s AND current_occupancy + %s <= capacity""",
+                       (count, cell_id, count))
+        if cursor.rowcount != 1:
+            raise CellFullError(f"Cell {cell_id} is full")
+
+
+def release_many(db, cursor, beds_per_cell):
+    """Give back beds in several cells at once, e.g. for a day's releases"""
+    cursor.executemany("""UPDATE Cell SET current_occupancy =
+                          CASE WHEN current_occupancy > %s THEN current_occupancy - %s ELSE 0 END
+                          WHERE cell_id=%s""",
+                       [(count, count, cell_id) for cell_id, count in sorted(beds_per_cell.items())])
+
+
+def place_prisoner_rows(db, cursor, rows):
+    """Take beds for newly inserted prisoners given as records.PRISONER_COLUMNS rows"""
+    beds = Counter(bed_of(row[8], row[7]) for row in rows)
+    beds.pop(None, None)
+    if beds:
+        place_many(db, cursor, beds)
+
+
+def reconcile(db):
+    """Recompute every cell's occupancy from the Prisoner table; returns cells over capacity"""
+    with db.cursor() as cursor:
+        cursor.execute("""UPDATE Cell SET current_occupancy =
+                          (SELECT COUNT(*) FROM Prisoner
+                           WHERE Prisoner.cell_id = Cell.cell_id AND Prisoner.status = %s
+                           AND Prisoner.deleted_at IS NULL)""",
+                       (OCCUPYING_STATUS,))
+    return db.fetchall("""SELECT cell_id, capacity, current_occupancy FROM Cell
+                          WHERE current_occupancy > capacity ORDER BY cell_id""")
+
+
+if __name__ == "__main__":
+    db = database.connect(sys.argv[1] if len(sys.argv) > 1 else database.DATABASE_URL)
+    try:
+        over = reconcile(db)
+    finally:
+        db.close()
+    print("Occupancy recomputed")
+    for cell_id, capacity, occupied in over:
+        print(f"Cell {cell_id} is over capacity: {occupied} of {capacity}")
@@ -0,0 +1,48 @@
+"""Everything about one prisoner, read in a single round trip
+
+load_profile() fetches the prisoner, their cell, visits, incidents and
+medical records with one UNION ALL query. Each branch is a lookup on a
+prisoner_id index (see migration 3), so the cost follows the size of
+the prisoner's history, not of the tables.
+"""
+from collections import namedtuple
+
+Profile = namedtuple('Profile', 'prisoner cell visits incidents medical')
+
+# Every branch returns (kind, record id, date, a, b, c, d)
+QUERY = """
+SELECT 'prisoner', p.prisoner_id, p.date_of_incarceration, p.first_name, p.last_name,
+       p.status, p.crime_committed
+FROM Prisoner p WHERE p.prisoner_id = %s AND p.deleted_at IS NULL
+UNION ALL
+SELECT 'cell', c.cell_id, NULL, c.cell_number, c.block_number, NULL, NULL
+FROM Prisoner p JOIN Cell c ON c.cell_id = p.cell_id WHERE p.prisoner_id = %s AND p.deleted_at IS NULL
+UNION ALL
+SELECT 'visit', v.visitor_id, v.visit_date, v.first_name, v.last_name,
+       v.relationship, v.visit_time
+FROM Visitor v WHERE v.prisoner_id = %s AND v.deleted_at IS NULL
+UNION ALL
+SELECT 'incident', i.report_id, i.incident_date, s.first_name, s.last_name,
+       i.incident_description, NULL
+FROM IncidentReport i LEFT JOIN Staff s ON s.staff_id = i.staff_id WHERE i.prisoner_id = %s
+UNION ALL
+SELECT 'medical', m.medical_id, m.date_of_examination, d.first_name, d.last_name,
+       m.diagnosis, m.treatment
+FROM MedicalRecord m LEFT JOIN Staff d ON d.staff_id = m.doctor_id WHERE m.prisoner_id = %s
+ORDER BY 1, 3 DESC, 2 DESC
+"""
+
+
+def load_profile(db, prisoner_id):
+    """Return the Profile of a prisoner, or None if there is no such prisoner
+
+    Every record is (record id, date, a, b, c, d) as laid out in QUERY.
+    """
+    sections = {'prisoner': [], 'cell': [], 'visit': [], 'incident': [], 'medical': []}
+    for row in db.fetchall(QUERY, (prisoner_id,) * 5):
+        sections[row[0]].append(tuple(row[1:]))
+    if not sections['prisoner']:
+        return None
+    return Profile(sections['prisoner'][0],
+                   sections['cell'][0] if sections['cell'] else None,
+                   sections['visit'], sections['incident'], sections['medical'])
@@ -0,0 +1,154 @@
+"""Column lists and validation rules shared by the forms, services.py and the bulk importer
+
+Each clean_* function takes a dict keyed by column name, with values as
+typed by a user or read from a file, and returns the values in column
+order ready for an INSERT. Bad input raises ValueError.
+"""
+from datetime import date, datetime
+
+GENDERS = ["Male", "Female", "Other"]
+PRISONER_STATUSES = ["Incarcerated", "Released", "Paroled"]
+
+PRISONER_COLUMNS = ["first_name", "last_name", "gender", "date_of_birth", "date_of_incarceration",
+                    "date_of_release", "crime_committed", "status", "cell_id"]
+VISITOR_COLUMNS = ["prisoner_id", "first_name", "last_name", "relationship", "visit_date", "visit_time"]
+CELL_COLUMNS = ["cell_number", "capacity", "block_number"]
+STAFF_COLUMNS = ["first_name", "last_name", "gender", "date_of_birth", "role", "salary", "hire_date"]
+INCIDENT_COLUMNS = ["prisoner_id", "staff_id", "incident_date", "incident_description"]
+MEDICAL_COLUMNS = ["prisoner_id", "doctor_id", "date_of_examination", "diagnosis", "treatment"]
+
+
+def clean_prisoner(record):
+    return [
+        _required_text(record, "first_name"),
+        _required_text(record, "last_name"),
+        _choice(record, "gender", GENDERS),
+        _date(record, "date_of_birth", required=True),
+        _date(record, "date_of_incarceration", required=True),
+        _date(record, "date_of_release"),
+        _text(record, "crime_committed"),
+        _choice(record, "status", PRISONER_STATUSES),
+        _integer(record, "cell_id"),
+    ]
+
+
+def clean_visitor(record):
+    return [
+        _integer(record, "prisoner_id", required=True),
+        _required_text(record, "first_name"),
+        _required_text(record, "last_name"),
+        _text(record, "relationship"),
+        _date(record, "visit_date", required=True),
+        _time(record, "visit_time"),
+    ]
+
+
+def clean_cell(record):
+    return [
+        _required_text(record, "cell_number"),
+        _integer(record, "capacity", required=True),
+        _required_text(record, "block_number"),
+    ]
+
+
+def clean_staff(record):
+    return [
+        _required_text(record, "first_name"),
+        _required_text(record, "last_name"),
+        _choice(record, "gender", GENDERS),
+        _date(record, "date_of_birth", required=True),
+        _required_text(record, "role"),
+        _number(record, "salary", required=True),
+        _date(record, "hire_date", required=True),
+    ]
+
+
+def clean_incident(record):
+    return [
+        _integer(record, "prisoner_id", required=True),
+        _integer(record, "staff_id"),
+        _date(record, "incident_date", required=True),
+        _text(record, "incident_description"),
+    ]
+
+
+def clean_medical(record):
+    return [
+        _integer(record, "prisoner_id", required=True),
+        _integer(record, "doctor_id"),
+        _date(record, "date_of_examination", required=True),
+        _text(record, "diagnosis"),
+        _text(record, "treatment"),
+    ]
+
+
+def _text(record, column):
+    value = record.get(column)
+    return str(value).strip() if value is not None else ""
+
+
+def _required_text(record, column):
+    value = _text(record, column)
+    if not value:
+        raise ValueError(f"{column} is required")
+    return value
+
+
+def _choice(record, column, choices):
+    value = _text(record, column)
+    if value not in choices:
+        raise ValueError(f"{column} must be one of {', '.join(choices)}")
+    return value
+
+
+def _integer(record, column, required=False):
+    value = record.get(column)
+    if value is None or str(value).strip() == "":
+        if required:
+            raise ValueError(f"{column} is required")
+        return None
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{column} must be a whole number")
+
+
+def _number(record, column, required=False):
+    value = record.get(column)
+    if value is None or str(value).strip() == "":
+        if required:
+            raise ValueError(f"{column} is required")
+        return None
+    try:
+        return float(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{column} must be a number")
+
+
+def _date(record, column, required=False):
+    value = record.get(column)
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if value is None or str(value).strip() == "":
+        if required:
+            raise ValueError(f"{column} is required")
+        return None
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f"{column} must be a date in yyyy-mm-dd form")
+
+
+def _time(record, column):
+    # Kept as zero-padded HH:MM so times compare correctly as text too
+    value = _text(record, column)
+    if not value:
+        return ""
+    for pattern in ('%H:%M', '%H:%M:%S'):
+        try:
+            return datetime.strptime(value, pattern).strftime('%H:%M')
+        except ValueError:
+            pass
+    raise ValueError(f"{column} must be a time in hh:mm form")
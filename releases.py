@@ -0,0 +1,98 @@
+"""Due releases and the release forecast
+
+Incarcerated prisoners whose date_of_release has come are released in
+one batch: their status changes to Released and their beds are given
+back, in a single transaction. Both the batch and the 30/60/90-day
+forecast read a range of the (status, date_of_release) index added by
+migration 5. The app runs release_due() on a timer; this script does the
+same from cron.
+
+Usage: python releases.py [--date YYYY-MM-DD] [--dry-run] [--url URL]
+"""
+import argparse
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import database
+import occupancy
+
+RELEASED_STATUS = "Released"
+FORECAST_DAYS = (30, 60, 90)
+BATCH_SIZE = 1000
+
+
+def due_releases(db, on_date=None):
+    """Incarcerated prisoners due for release on or before on_date (today by default)
+
+    Returns (prisoner_id, first_name, last_name, date_of_release, cell_id) rows.
+    """
+    return db.fetchall("""SELECT prisoner_id, first_name, last_name, date_of_release, cell_id
+                          FROM Prisoner WHERE status=%s AND date_of_release <= %s AND deleted_at IS NULL
+                          ORDER BY date_of_release, prisoner_id""",
+                       (occupancy.OCCUPYING_STATUS, on_date or date.today()))
+
+
+def release_due(db, on_date=None):
+    """Release everyone due on or before on_date in one transaction
+
+    Returns the released (prisoner_id, cell_id) pairs. Each UPDATE only
+    matches prisoners still incarcerated; if any of them changed since they
+    were read, ValueError is raised and nothing is released.
+    """
+    with db.cursor() as cursor:
+        cursor.execute("""SELECT prisoner_id, cell_id FROM Prisoner
+                          WHERE status=%s AND date_of_release <= %s AND deleted_at IS NULL""" + db.for_update,
+                       (occupancy.OCCUPYING_STATUS, on_date or date.today()))
+        released = cursor.fetchall()
+
+        for start in range(0, len(released), BATCH_SIZE):
+            batch = [prisoner_id for prisoner_id, cell_id in released[start:start + BATCH_SIZE]]
+            cursor.execute(f"""UPDATE Prisoner SET status=%s, row_version = row_version + 1
+                               WHERE status=%s AND deleted_at IS NULL
+                               AND prisoner_id IN ({', '.join(['%s'] * len(batch))})""",
+                           [RELEASED_STATUS, occupancy.OCCUPYING_STATUS] + batch)
+            if cursor.rowcount != len(batch):
+                raise ValueError(f"{len(batch) - cursor.rowcount} prisoners changed while being released")
+
+        beds = Counter(cell_id for prisoner_id, cell_id in released if cell_id is not None)
+        if beds:
+            occupancy.release_many(db, cursor, beds)
+    return released
+
+
+def forecast(db, on_date=None, horizons=FORECAST_DAYS):
+    """[(days, releases due within that many days after on_date)] for each horizon"""
+    on_date = on_date or date.today()
+    cases = ", ".join("SUM(CASE WHEN date_of_release <= %s THEN 1 ELSE 0 END)" for days in horizons)
+    row = db.fetchone(f"""SELECT {cases} FROM Prisoner
+                          WHERE status=%s AND date_of_release > %s AND date_of_release <= %s
+                          AND deleted_at IS NULL""",
+                      [on_date + timedelta(days=days) for days in horizons] +
+                      [occupancy.OCCUPYING_STATUS, on_date, on_date + timedelta(days=max(horizons))])
+    return [(days, int(count or 0)) for days, count in zip(horizons, row)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Release prisoners whose release date has come")
+    parser.add_argument('--date', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+                        default=date.today(), help="release everyone due on or before this date")
+    parser.add_argument('--dry-run', action='store_true', help="only list who is due")
+    parser.add_argument('--url', default=database.DATABASE_URL, help="database url, MySQL by default")
+    args = parser.parse_args()
+
+    db = database.connect(args.url)
+    try:
+        if args.dry_run:
+            for prisoner_id, first_name, last_name, release_date, cell_id in due_releases(db, args.date):
+                print(f"{prisoner_id}\t{first_name} {last_name}\t{release_date}\tcell {cell_id}")
+        else:
+            released = release_due(db, args.date)
+            print(f"Released {len(released)} prisoners")
+        for days, count in forecast(db, args.date):
+            print(f"Due in the next {days} days: {count}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
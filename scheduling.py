@@ -0,0 +1,240 @@
+"""Visiting slots, room capacity per block and double-booking checks
+
+Visits take place in the fixed SLOTS of each day, in the visiting room of
+the prisoner's block. VisitingRoom (migration 4) holds each room's
+capacity; blocks without a row get DEFAULT_ROOM_CAPACITY. A visit_time is
+mapped to its slot by a bisect over the slot start times.
+
+check_booking() runs inside the write transaction: it locks the room row
+on MySQL and counts the slot's visits through the Visitor (visit_date,
+visit_time) index. Only visits from today on are booked; past ones are a
+record of what happened and are stored as given. VisitIndex keeps per-day, per-block slot counts in
+memory for availability over a date range, reading each day at most once.
+Bulk imports check their upcoming visits with check_booked_rows() after
+the insert, so a batch that overbooks a room is refused like any other
+bad row; visit history is imported unchecked.
+"""
+import bisect
+import threading
+from collections import Counter
+from datetime import date, time, timedelta
+
+SLOTS = [("09:00", "10:00"), ("10:00", "11:00"), ("11:00", "12:00"),
+         ("14:00", "15:00"), ("15:00", "16:00"), ("16:00", "17:00")]
+DEFAULT_ROOM_CAPACITY = 10
+MAX_CACHED_DAYS = 400
+
+
+class SlotFullError(Exception):
+    pass
+
+
+def minutes(value):
+    """Minutes after midnight of a visit time given as "HH:MM[:SS]", time or timedelta"""
+    if isinstance(value, timedelta):
+        # MySQL returns TIME columns as timedelta
+        return int(value.total_seconds()) // 60
+    if isinstance(value, time):
+        return value.hour * 60 + value.minute
+    hours, mins = str(value).strip().split(":")[:2]
+    return int(hours) * 60 + int(mins)
+
+
+_SLOT_STARTS = [minutes(start) for start, end in SLOTS]
+
+
+def slot_of(visit_time):
+    """Index in SLOTS of the slot a visit time falls in; ValueError outside visiting hours"""
+    m = minutes(visit_time)
+    i = bisect.bisect_right(_SLOT_STARTS, m) - 1
+    if i < 0 or m >= minutes(SLOTS[i][1]):
+        raise ValueError(f"{visit_time} is outside visiting hours")
+    return i
+
+
+def is_bookable(visit_date):
+    """Whether a visit on this day takes a place in the visiting room, i.e. is not in the past"""
+    return visit_date >= date.today()
+
+
+def prisoner_block(cursor, prisoner_id):
+    """Block of the prisoner's cell, whose visiting room a visit uses"""
+    cursor.execute("""SELECT c.block_number FROM Prisoner p JOIN Cell c ON c.cell_id = p.cell_id
+                      WHERE p.prisoner_id=%s AND p.deleted_at IS NULL""", (prisoner_id,))
+    row = cursor.fetchone()
+    if row is None or row[0] is None:
+        raise ValueError(f"Prisoner {prisoner_id} has no cell, so no visiting room")
+    return row[0]
+
+
+def room_capacities(db):
+    """{block_number: visiting room capacity} for every block with cells"""
+    capacities = {block: DEFAULT_ROOM_CAPACITY for (block,) in
+                  db.fetchall("SELECT DISTINCT block_number FROM Cell WHERE block_number IS NOT NULL")}
+    capacities.update(db.fetchall("SELECT block_number, capacity FROM VisitingRoom"))
+    return capacities
+
+
+def check_booking(db, cursor, prisoner_id, visit_date, visit_time, visitor_id=None):
+    """Make sure the room has space for a visit, in the caller's transaction
+
+    visitor_id is the visit being moved, when updating. Raises ValueError
+    for a time outside the slots and SlotFullError if the room is full.
+    Returns the block.
+    """
+    if not visit_time:
+        raise ValueError("A visit time is needed to book the visiting room")
+    block = prisoner_block(cursor, prisoner_id)
+    start, end = SLOTS[slot_of(visit_time)]
+
+    cursor.execute("SELECT capacity FROM VisitingRoom WHERE block_number=%s" + db.for_update, (block,))
+    row = cursor.fetchone()
+    capacity = row[0] if row else DEFAULT_ROOM_CAPACITY
+
+    query = """SELECT COUNT(*) FROM Visitor v
+               JOIN Prisoner p ON p.prisoner_id = v.prisoner_id
+               JOIN Cell c ON c.cell_id = p.cell_id
+               WHERE v.visit_date=%s AND v.visit_time >= %s AND v.visit_time < %s
+               AND c.block_number=%s AND v.deleted_at IS NULL AND p.deleted_at IS NULL"""
+    params = [visit_date, start, end, block]
+    if visitor_id is not None:
+        query += " AND v.visitor_id <> %s"
+        params.append(visitor_id)
+    cursor.execute(query, params)
+    if cursor.fetchone()[0] >= capacity:
+        raise SlotFullError(f"The block {block} visiting room is full from {start} to {end} on {visit_date}")
+    return block
+
+
+def check_booked_rows(db, cursor, rows):
+    """Refuse visits just inserted in the caller's transaction if they overbook a room
+
+    rows are records.VISITOR_COLUMNS rows; past visits among them are not
+    checked. Raises ValueError for a visit without a slot or a prisoner
+    without a cell, and SlotFullError if any room the rows were booked into
+    is now over capacity.
+    """
+    rows = [row for row in rows if is_bookable(row[4])]
+    if not rows:
+        return
+    prisoner_ids = sorted({row[0] for row in rows})
+    cursor.execute(f"""SELECT p.prisoner_id, c.block_number FROM Prisoner p JOIN Cell c ON c.cell_id = p.cell_id
+                       WHERE p.prisoner_id IN ({', '.join(['%s'] * len(prisoner_ids))})
+                       AND p.deleted_at IS NULL""", prisoner_ids)
+    blocks = dict(cursor.fetchall())
+
+    booked = set()
+    for row in rows:
+        if not row[5]:
+            raise ValueError("A visit time is needed to book the visiting room")
+        if blocks.get(row[0]) is None:
+            raise ValueError(f"Prisoner {row[0]} has no cell, so no visiting room")
+        booked.add((row[4], blocks[row[0]], slot_of(row[5])))
+
+    rooms = sorted({block for day, block, slot in booked})
+    cursor.execute(f"""SELECT block_number, capacity FROM VisitingRoom
+                       WHERE block_number IN ({', '.join(['%s'] * len(rooms))})""" + db.for_update, rooms)
+    capacities = dict(cursor.fetchall())
+
+    days = sorted({day for day, block, slot in booked})
+    cursor.execute(f"""SELECT v.visit_date, v.visit_time, c.block_number FROM Visitor v
+                       JOIN Prisoner p ON p.prisoner_id = v.prisoner_id
+                       JOIN Cell c ON c.cell_id = p.cell_id
+                       WHERE v.visit_date IN ({', '.join(['%s'] * len(days))})
+                       AND v.deleted_at IS NULL AND p.deleted_at IS NULL""", days)
+    counts = Counter()
+    for visit_date, visit_time, block in cursor.fetchall():
+        try:
+            counts[(visit_date, block, slot_of(visit_time))] += 1
+        except (ValueError, TypeError):
+            continue
+
+    for day, block, slot in sorted(booked):
+        if counts[(day, block, slot)] > capacities.get(block, DEFAULT_ROOM_CAPACITY):
+            start, end = SLOTS[slot]
+            raise SlotFullError(f"The block {block} visiting room is full from {start} to {end} on {day}")
+
+
+def _days(start_date, end_date):
+    day = start_date
+    while day <= end_date:
+        yield day
+        day += timedelta(days=1)
+
+
+class VisitIndex:
+    """Booked visits per (day, block, slot), loaded a date range at a time"""
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+        # (visit_date, block_number) -> visits per slot
+        self.counts = {}
+        self.days = set()
+        # Bumped by forget() and clear() so a load that raced a write is not kept
+        self.version = 0
+
+    def forget(self, *days):
+        """Drop days whose visits were written; they are read again when next needed"""
+        with self.lock:
+            self.version += 1
+            for day in days:
+                self.days.discard(day)
+            self.counts = {key: slots for key, slots in self.counts.items() if key[0] in self.days}
+
+    def clear(self):
+        with self.lock:
+            self.version += 1
+            self.days.clear()
+            self.counts.clear()
+
+    def free_slots(self, start_date, end_date, block=None):
+        """(date, block, slot start, slot end, free places) for every slot in a date range"""
+        capacities = room_capacities(self.db)
+        blocks = [block] if block is not None else sorted(capacities)
+
+        while True:
+            self._load(start_date, end_date)
+            with self.lock:
+                # A write may have dropped some of the days again meanwhile
+                if any(day not in self.days for day in _days(start_date, end_date)):
+                    continue
+                free = []
+                for day in _days(start_date, end_date):
+                    for room in blocks:
+                        booked = self.counts.get((day, room), [0] * len(SLOTS))
+                        capacity = capacities.get(room, DEFAULT_ROOM_CAPACITY)
+                        for (start, end), count in zip(SLOTS, booked):
+                            free.append((day, room, start, end, max(capacity - count, 0)))
+                return free
+
+    def _load(self, start_date, end_date):
+        with self.lock:
+            missing = [day for day in _days(start_date, end_date) if day not in self.days]
+            version = self.version
+        if not missing:
+            return
+
+        rows = self.db.fetchall("""SELECT v.visit_date, v.visit_time, c.block_number FROM Visitor v
+                                   JOIN Prisoner p ON p.prisoner_id = v.prisoner_id
+                                   JOIN Cell c ON c.cell_id = p.cell_id
+                                   WHERE v.visit_date BETWEEN %s AND %s
+                                   AND v.deleted_at IS NULL AND p.deleted_at IS NULL""",
+                                (missing[0], missing[-1]))
+        with self.lock:
+            if version != self.version:
+                # Visits were written while reading; the caller loads again
+                return
+            if len(self.days) + len(missing) > MAX_CACHED_DAYS:
+                self.days.clear()
+                self.counts.clear()
+            missing = set(missing) - self.days
+            for visit_date, visit_time, block in rows:
+                if visit_date not in missing:
+                    continue
+                try:
+                    slot = slot_of(visit_time)
+                except (ValueError, TypeError):
+                    # Visits recorded outside the slots take no room place
+                    continue
+                self.counts.setdefault((visit_date, block), [0] * len(SLOTS))[slot] += 1
+            self.days.update(missing)
@@ -0,0 +1,217 @@
+"""Search queries over the pms database
+
+Prisoner filters are turned into parameterized WHERE clauses that the
+indexes added in migrations.py can serve. Free-text search over crimes,
+incidents and medical records uses MySQL FULLTEXT indexes, or an
+in-memory inverted index on SQLite.
+"""
+import heapq
+import math
+import re
+import threading
+from collections import defaultdict, namedtuple
+
+
+def prisoner_filter(name=None, status=None, cell_id=None, incarcerated_from=None,
+                    incarcerated_to=None, crime=None, dialect=None):
+    """Build (conditions, params) for a prisoner search; empty arguments are ignored
+
+    name matches the start of the first or last name. On MySQL crime matches
+    crime_committed words starting with each word of crime, through the
+    ft_prisoner_crime FULLTEXT index; elsewhere it matches any part of
+    crime_committed.
+    """
+    conditions = []
+    params = []
+
+    if name:
+        # Prefix matches can use idx_prisoner_name and idx_prisoner_first_name
+        conditions.append("(last_name LIKE %s ESCAPE '!' OR first_name LIKE %s ESCAPE '!')")
+        pattern = escape_like(name) + '%'
+        params += [pattern, pattern]
+    if status:
+        conditions.append("status = %s")
+        params.append(status)
+    if cell_id is not None:
+        conditions.append("cell_id = %s")
+        params.append(cell_id)
+    if incarcerated_from:
+        conditions.append("date_of_incarceration >= %s")
+        params.append(incarcerated_from)
+    if incarcerated_to:
+        conditions.append("date_of_incarceration <= %s")
+        params.append(incarcerated_to)
+    if crime and dialect == 'mysql' and tokenize(crime):
+        # A LIKE '%...%' cannot use an index and would scan every prisoner
+        conditions.append("MATCH(crime_committed) AGAINST (%s IN BOOLEAN MODE)")
+        params.append(' '.join(f'+{token}*' for token in tokenize(crime)))
+    elif crime:
+        conditions.append("crime_committed LIKE %s ESCAPE '!'")
+        params.append('%' + escape_like(crime) + '%')
+
+    return conditions, params
+
+
+def escape_like(text):
+    """Escape LIKE wildcards (with ESCAPE '!') so user input is matched literally"""
+    return text.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+
+
+# Full-text search over the free-text columns. Each source is
+# (table, key column, text expression, FULLTEXT columns, condition for live rows).
+TEXT_SOURCES = [
+    ("Prisoner", "prisoner_id", "crime_committed", "crime_committed", "deleted_at IS NULL"),
+    ("IncidentReport", "report_id", "incident_description", "incident_description", None),
+    ("MedicalRecord", "medical_id", "CONCAT(diagnosis, ' / ', treatment)", "diagnosis, treatment", None),
+]
+RESULTS_PER_PAGE = 50
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+class SearchHit(namedtuple('SearchHit', 'source record_id prisoner_id score text')):
+    """One ranked full-text match"""
+
+
+def join_text(*texts):
+    """Combine several text columns the way the MySQL search shows them"""
+    return ' / '.join(text or '' for text in texts)
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall((text or '').lower()) if len(token) > 1]
+
+
+class MySQLTextSearch:
+    """Ranked search backed by the FULLTEXT indexes from migration 2"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def search(self, text, limit=RESULTS_PER_PAGE, offset=0):
+        selects = []
+        params = []
+        for table, key, expression, columns, live in TEXT_SOURCES:
+            match = f"MATCH({columns}) AGAINST (%s IN NATURAL LANGUAGE MODE)"
+            where = f"{match} AND {live}" if live else match
+            selects.append(f"""SELECT '{table}' AS source, {key} AS record_id, prisoner_id,
+                              {match} AS score, {expression} AS text
+                              FROM {table} WHERE {where}""")
+            params += [text, text]
+
+        query = " UNION ALL ".join(selects) + " ORDER BY score DESC LIMIT %s OFFSET %s"
+        rows = self.db.fetchall(query, params + [limit, offset])
+        return [SearchHit(*row) for row in rows]
+
+    # The server keeps FULLTEXT indexes up to date itself
+    def index(self, source, record_id, prisoner_id, text):
+        pass
+
+    def remove(self, source, record_id):
+        pass
+
+    def invalidate(self):
+        pass
+
+
+class InvertedIndexSearch:
+    """In-memory inverted index used where FULLTEXT indexes are not available
+
+    The index is built from the tables on the first search and then kept up
+    to date by index()/remove() calls from the application's write paths.
+    Ranking is tf-idf, normalised by document length.
+    """
+
+    def __init__(self, db, chunk_size=5000):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.built = False
+        self.lock = threading.RLock()
+
+    def build(self):
+        with self.lock:
+            self.postings.clear()
+            self.documents.clear()
+            for table, key, expression, columns, live in TEXT_SOURCES:
+                with self.db.cursor() as cursor:
+                    cursor.execute(f"SELECT {key}, prisoner_id, {columns} FROM {table}" +
+                                   (f" WHERE {live}" if live else ""))
+                    while True:
+                        rows = cursor.fetchmany(self.chunk_size)
+                        if not rows:
+                            break
+                        for record_id, prisoner_id, *texts in rows:
+                            self._add(table, record_id, prisoner_id, join_text(*texts))
+            self.built = True
+
+    def search(self, text, limit=RESULTS_PER_PAGE, offset=0):
+        with self.lock:
+            if not self.built:
+                self.build()
+
+            scores = defaultdict(float)
+            total = len(self.documents) or 1
+            for token in set(tokenize(text)):
+                postings = self.postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + total / len(postings))
+                for doc, count in postings.items():
+                    scores[doc] += count * idf
+
+            ranked = heapq.nlargest(offset + limit, scores.items(),
+                                    key=lambda item: item[1] / math.sqrt(self.documents[item[0]][2]))
+            hits = []
+            for (source, record_id), score in ranked[offset:]:
+                prisoner_id, doc_text, length = self.documents[(source, record_id)]
+                hits.append(SearchHit(source, record_id, prisoner_id,
+                                      round(score / math.sqrt(length), 4), doc_text))
+            return hits
+
+    def invalidate(self):
+        """Rebuild on the next search, e.g. after rows were written in bulk"""
+        with self.lock:
+            self.built = False
+            self.postings.clear()
+            self.documents.clear()
+
+    def index(self, source, record_id, prisoner_id, text):
+        with self.lock:
+            if self.built:
+                self._remove(source, record_id)
+                self._add(source, record_id, prisoner_id, text)
+
+    def remove(self, source, record_id):
+        with self.lock:
+            if self.built:
+                self._remove(source, record_id)
+
+    def _add(self, source, record_id, prisoner_id, text):
+        tokens = tokenize(text)
+        if not tokens:
+            return
+        doc = (source, record_id)
+        for token in tokens:
+            self.postings[token][doc] = self.postings[token].get(doc, 0) + 1
+        self.documents[doc] = (prisoner_id, text, len(tokens))
+
+    def _remove(self, source, record_id):
+        doc = (source, record_id)
+        entry = self.documents.pop(doc, None)
+        if entry is None:
+            return
+        for token in set(tokenize(entry[1])):
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.pop(doc, None)
+                if not postings:
+                    del self.postings[token]
+
+
+def open_text_search(db):
+    """Return the full-text search implementation suited to db"""
+    if db.dialect == 'mysql':
+        return MySQLTextSearch(db)
+    return InvertedIndexSearch(db)
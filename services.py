@@ -0,0 +1,635 @@
+"""Reads and writes behind the app's tabs, usable without a window
+
+Services holds one service per entity over a shared connection pool,
+together with the state the app keeps in memory: the Cell and Staff
+caches, the cell allocator, prisoner profiles, visit counts, dashboard
+metrics, the text search index and the audit writer. Services take plain
+input, a record dict keyed by column name as a form or an import file
+gives it (see records.py), and return plain rows as the lists show them:
+dates as yyyy-mm-dd and name pairs merged into one column.
+
+Each write runs its own checks, audit entry and cache upkeep and returns
+a Written with the rows a caller may want to redraw. The Tk app calls
+the services from its worker threads; benchmark.py and batch jobs call
+them directly:
+
+    services = Services(database.connect())
+    written = services.prisoners.add({"first_name": "Jane", ...})
+    services.close()
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import allocation
+import archive
+import audit
+import cache
+import concurrency
+import dashboard
+import exporter
+import importer
+import occupancy
+import prisoner_profile
+import records
+import releases
+import scheduling
+import search
+
+# Rows per page of the paged lists
+PAGE_SIZE = 200
+
+# key: the record written; rows: its row as listed, [] once deleted;
+# cells: {cell_id: rows} for cells whose occupancy the write changed
+Written = namedtuple('Written', 'key rows cells')
+
+
+def format_row(row, date_columns=()):
+    """Return a copy of a database row ready for a Treeview"""
+    formatted_row = list(row)
+    for i in date_columns:
+        if formatted_row[i]:
+            formatted_row[i] = formatted_row[i].strftime('%Y-%m-%d')
+    return formatted_row
+
+
+def merge_names(row, *positions):
+    """Replace the (first name, last name) column pair at each position with one full name"""
+    merged_row = list(row)
+    for i in sorted(positions, reverse=True):
+        merged_row[i:i + 2] = [" ".join(name for name in merged_row[i:i + 2] if name)]
+    return merged_row
+
+
+def keyset_page(db, query, primary_key, conditions=(), params=(),
+                after=None, before=None, limit=PAGE_SIZE, key=None):
+    """Run query for one page ordered by primary_key, or only the row with the given key if it meets conditions"""
+    conditions = list(conditions)
+    params = list(params)
+
+    if key is not None:
+        conditions.append(f"{primary_key} = %s")
+        return db.fetchall(query + " WHERE " + " AND ".join(conditions), params + [key])
+    if after is not None:
+        conditions.append(f"{primary_key} > %s")
+        params.append(after)
+        order = primary_key
+    elif before is not None:
+        conditions.append(f"{primary_key} < %s")
+        params.append(before)
+        order = f"{primary_key} DESC"
+    else:
+        order = primary_key
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {order} LIMIT %s"
+    rows = db.fetchall(query, params + [limit])
+
+    if before is not None:
+        rows.reverse()
+    return rows
+
+
+class Service:
+    """Base of the entity services; services is the Services they belong to"""
+    def __init__(self, services):
+        self.services = services
+        self.db = services.db
+
+    def read_existing(self, cursor, table, key):
+        """The row's audited columns, locked on MySQL; ValueError if it is gone"""
+        before = audit.read_row(self.db, cursor, table, key)
+        if before is None:
+            raise ValueError(f"{table} {key} no longer exists")
+        return before
+
+    def check_prisoner(self, cursor, prisoner_id):
+        """ValueError unless prisoner_id is a prisoner that is not deleted; locked on MySQL"""
+        cursor.execute("SELECT 1 FROM Prisoner WHERE prisoner_id=%s AND deleted_at IS NULL" +
+                       self.db.for_update, (prisoner_id,))
+        if cursor.fetchone() is None:
+            raise ValueError(f"Prisoner {prisoner_id} does not exist or was deleted")
+
+
+class PagedService(Service):
+    """A service whose list is paged on the primary key"""
+    QUERY = None
+    PRIMARY_KEY = None
+    # Conditions every listed row meets, e.g. not soft-deleted
+    CONDITIONS = ()
+
+    def page(self, after=None, before=None, limit=PAGE_SIZE, conditions=(), params=()):
+        """One page of the list in key order, narrowed by extra conditions"""
+        rows = keyset_page(self.db, self.QUERY, self.PRIMARY_KEY, list(self.CONDITIONS) + list(conditions),
+                           params, after, before, limit)
+        return self.format_rows(rows)
+
+    def get(self, key, conditions=(), params=()):
+        """The record with this key as listed, narrowed by extra conditions, in a list of at most one row"""
+        rows = keyset_page(self.db, self.QUERY, self.PRIMARY_KEY, list(self.CONDITIONS) + list(conditions),
+                           params, key=key)
+        return self.format_rows(rows)
+
+    def format_rows(self, rows):
+        return [format_row(row) for row in rows]
+
+
+class PrisonerService(PagedService):
+    QUERY = """SELECT prisoner_id, first_name, last_name, gender, date_of_birth,
+               date_of_incarceration, date_of_release, crime_committed, status, cell_id,
+               row_version FROM Prisoner"""
+    PRIMARY_KEY = "prisoner_id"
+    CONDITIONS = ("deleted_at IS NULL",)
+
+    def format_rows(self, rows):
+        """Format dates and add each prisoner's cell number from the cell cache, before the row version"""
+        cells = self.services.cell_cache.get_many(row[9] for row in rows)
+        formatted_rows = []
+        for row in rows:
+            formatted_row = format_row(row[:10], (4, 5, 6))
+            cell = cells.get(row[9])
+            formatted_row.append(cell[1] if cell else "")
+            formatted_row.append(row[10])
+            formatted_rows.append(formatted_row)
+        return formatted_rows
+
+    def add(self, record):
+        values = records.clean_prisoner(record)
+        query = """INSERT INTO Prisoner (first_name, last_name, gender, date_of_birth,
+                  date_of_incarceration, date_of_release, crime_committed, status, cell_id)
+                  VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"""
+
+        # The cell's bed is taken in the same transaction as the insert
+        with self.db.cursor() as cursor:
+            cursor.execute(query, values)
+            prisoner_id = cursor.lastrowid
+            changed_cells = occupancy.move(self.db, cursor, None, occupancy.bed_of(values[8], values[7]))
+        self.services.audit.record("Prisoner", prisoner_id, None, audit.image("Prisoner", values))
+        self.services.text_search.index("Prisoner", prisoner_id, prisoner_id, values[6])
+        self.services.dashboard.prisoner_changed(None, values[7])
+        return Written(prisoner_id, self.get(prisoner_id), self.services.cells.changed(changed_cells))
+
+    def update(self, prisoner_id, record, version):
+        """Save a prisoner loaded at row_version version; StaleRecordError if it changed since"""
+        values = records.clean_prisoner(record)
+        # Only applies if nobody saved the prisoner since the form was loaded
+        query = """UPDATE Prisoner SET first_name=%s, last_name=%s, gender=%s, date_of_birth=%s,
+                  date_of_incarceration=%s, date_of_release=%s, crime_committed=%s,
+                  status=%s, cell_id=%s, row_version=row_version+1
+                  WHERE prisoner_id=%s AND row_version=%s AND deleted_at IS NULL"""
+
+        # Transfers and releases move the bed in the same transaction
+        with self.db.cursor() as cursor:
+            before = audit.read_row(self.db, cursor, "Prisoner", prisoner_id)
+            if before is None:
+                raise ValueError("Prisoner was deleted")
+            old_bed = occupancy.current_bed(self.db, cursor, prisoner_id)
+            cursor.execute(query, values + [prisoner_id, version])
+            concurrency.check_updated(self.db, cursor, "Prisoner", prisoner_id, audit.image("Prisoner", values))
+            changed_cells = occupancy.move(self.db, cursor, old_bed, occupancy.bed_of(values[8], values[7]))
+        self.services.audit.record("Prisoner", prisoner_id, before, audit.image("Prisoner", values))
+        self.services.text_search.index("Prisoner", prisoner_id, prisoner_id, values[6])
+        self.services.profile_cache.invalidate(prisoner_id)
+        self.services.visit_index.clear()
+        self.services.dashboard.prisoner_changed(before["status"], values[7])
+        return Written(prisoner_id, self.get(prisoner_id), self.services.cells.changed(changed_cells))
+
+    def delete(self, prisoner_id):
+        # Soft delete; archive.py moves the row out of the table later
+        query = """UPDATE Prisoner SET deleted_at=%s, row_version=row_version+1
+                  WHERE prisoner_id=%s AND deleted_at IS NULL"""
+
+        with self.db.cursor() as cursor:
+            before = self.read_existing(cursor, "Prisoner", prisoner_id)
+            old_bed = occupancy.current_bed(self.db, cursor, prisoner_id)
+            cursor.execute(query, (datetime.now().replace(microsecond=0), prisoner_id))
+            if cursor.rowcount == 0:
+                raise ValueError("Prisoner was already deleted")
+            changed_cells = occupancy.move(self.db, cursor, old_bed, None)
+        self.services.audit.record("Prisoner", prisoner_id, before, None)
+        self.services.text_search.remove("Prisoner", prisoner_id)
+        self.services.profile_cache.invalidate(prisoner_id)
+        self.services.visit_index.clear()
+        self.services.dashboard.prisoner_changed(before["status"], None)
+        return Written(prisoner_id, [], self.services.cells.changed(changed_cells))
+
+    def suggest_cell(self, near_cell_id=None):
+        """The cell with the most free beds, in the block of near_cell_id if it has any; None if all are full"""
+        allocator = self.services.allocator
+        block = allocator.block_of(near_cell_id) if near_cell_id is not None else None
+        cell_id = allocator.best_cell(block)
+        if cell_id is None and block is not None:
+            cell_id = allocator.best_cell()
+        return cell_id
+
+    def profile(self, prisoner_id):
+        """The prisoner_profile.Profile of a prisoner, or None if there is no such prisoner"""
+        return self.services.profile_cache.get(prisoner_id)
+
+    def find_archived(self, name):
+        return archive.find_archived(self.db, name)
+
+    def due_releases(self, on_date=None):
+        """(prisoners due for release, release forecast), see releases.py"""
+        return releases.due_releases(self.db, on_date), releases.forecast(self.db, on_date)
+
+    def release_due(self):
+        """Release every prisoner whose release date has come
+
+        Returns ([(prisoner_id, cell_id)] released, {cell_id: rows} of the cells they left).
+        """
+        released = releases.release_due(self.db)
+        for prisoner_id, cell_id in released:
+            self.services.audit.record("Prisoner", prisoner_id, {"status": occupancy.OCCUPYING_STATUS},
+                                       {"status": releases.RELEASED_STATUS})
+            self.services.dashboard.prisoner_changed(occupancy.OCCUPYING_STATUS, releases.RELEASED_STATUS)
+        if released:
+            self.services.profile_cache.invalidate(*[prisoner_id for prisoner_id, cell_id in released])
+            self.services.visit_index.clear()
+        cell_ids = {cell_id for prisoner_id, cell_id in released if cell_id is not None}
+        return released, self.services.cells.changed(cell_ids)
+
+
+class CellService(Service):
+    def list(self):
+        """Every cell, through the cell cache"""
+        return [format_row(row) for row in self.services.cell_cache.all()]
+
+    def get(self, cell_id):
+        row = self.services.cell_cache.get(cell_id)
+        return [format_row(row)] if row else []
+
+    def changed(self, cell_ids):
+        """Re-read cells whose occupancy was just written and pass them to the allocator and
+        dashboard; returns {cell_id: rows}"""
+        if not cell_ids:
+            return {}
+        self.services.cell_cache.invalidate(*cell_ids)
+        cell_rows = {cell_id: self.get(cell_id) for cell_id in cell_ids}
+        for rows in cell_rows.values():
+            self.synced(rows)
+        return cell_rows
+
+    def synced(self, rows):
+        self.services.allocator.sync_rows(rows)
+        self.services.dashboard.cell_rows(rows)
+        return rows
+
+    def add(self, record):
+        values = records.clean_cell(record)
+        # A new cell is empty
+        query = """INSERT INTO Cell (cell_number, capacity, current_occupancy, block_number)
+                  VALUES (%s, %s, 0, %s)"""
+
+        cell_id = self.db.execute(query, values)
+        self.services.audit.record("Cell", cell_id, None, audit.image("Cell", [values[0], values[1], 0, values[2]]))
+        self.services.cell_cache.invalidate(cell_id)
+        return Written(cell_id, self.synced(self.get(cell_id)), {})
+
+    def update(self, cell_id, record):
+        values = records.clean_cell(record)
+        query = """UPDATE Cell SET cell_number=%s, capacity=%s,
+                  block_number=%s WHERE cell_id=%s"""
+
+        with self.db.cursor() as cursor:
+            before = self.read_existing(cursor, "Cell", cell_id)
+            capacity, occupied = occupancy.lock_cell(self.db, cursor, cell_id)
+            if values[1] is not None and values[1] < occupied:
+                raise occupancy.CellFullError(
+                    f"Cell has {occupied} occupants, capacity cannot be lowered to {values[1]}")
+            cursor.execute(query, values + [cell_id])
+        self.services.audit.record("Cell", cell_id, before, dict(zip(records.CELL_COLUMNS, values)))
+        self.services.cell_cache.invalidate(cell_id)
+        self.services.profile_cache.invalidate()
+        self.services.visit_index.clear()
+        return Written(cell_id, self.synced(self.get(cell_id)), {})
+
+    def delete(self, cell_id):
+        if self.db.fetchone("SELECT COUNT(*) FROM Prisoner WHERE cell_id=%s AND deleted_at IS NULL",
+                           (cell_id,))[0] > 0:
+            raise ValueError("Cannot delete cell with prisoners assigned!")
+
+        with self.db.cursor() as cursor:
+            before = self.read_existing(cursor, "Cell", cell_id)
+            # Deleted prisoners waiting for the archive still point at the cell
+            cursor.execute("UPDATE Prisoner SET cell_id=NULL WHERE cell_id=%s AND deleted_at IS NOT NULL",
+                           (cell_id,))
+            cursor.execute("DELETE FROM Cell WHERE cell_id=%s", (cell_id,))
+        self.services.audit.record("Cell", cell_id, before, None)
+        self.services.cell_cache.invalidate(cell_id)
+        self.services.profile_cache.invalidate()
+        self.services.allocator.remove(cell_id)
+        self.services.dashboard.cell_removed(cell_id)
+        return Written(cell_id, [], {})
+
+    def recount(self):
+        """Recompute every cell's occupancy from its prisoners
+
+        Returns ([(cell_id, capacity, occupied)] over capacity, every cell's row).
+        """
+        over = occupancy.reconcile(self.db)
+        self.services.allocator.invalidate()
+        self.services.cell_cache.invalidate()
+        self.services.dashboard.invalidate()
+        return over, self.list()
+
+
+class VisitorService(PagedService):
+    QUERY = """SELECT v.visitor_id, v.prisoner_id, p.first_name, p.last_name, v.first_name,
+               v.last_name, v.relationship, v.visit_date, v.visit_time
+               FROM Visitor v LEFT JOIN Prisoner p ON p.prisoner_id = v.prisoner_id"""
+    PRIMARY_KEY = "v.visitor_id"
+    CONDITIONS = ("v.deleted_at IS NULL",)
+
+    def format_rows(self, rows):
+        return [format_row(merge_names(row, 2), (6,)) for row in rows]
+
+    def add(self, record):
+        values = records.clean_visitor(record)
+        query = """INSERT INTO Visitor (prisoner_id, first_name, last_name,
+                  relationship, visit_date, visit_time)
+                  VALUES (%s, %s, %s, %s, %s, %s)"""
+
+        # The room check and the insert share a transaction so a slot cannot be overbooked
+        with self.db.cursor() as cursor:
+            self.check_prisoner(cursor, values[0])
+            if scheduling.is_bookable(values[4]):
+                scheduling.check_booking(self.db, cursor, values[0], values[4], values[5])
+            cursor.execute(query, values)
+            visitor_id = cursor.lastrowid
+        self.services.audit.record("Visitor", visitor_id, None, audit.image("Visitor", values))
+        self.services.visit_index.forget(values[4])
+        self.services.profile_cache.invalidate(values[0])
+        return Written(visitor_id, self.get(visitor_id), {})
+
+    def update(self, visitor_id, record):
+        values = records.clean_visitor(record)
+        query = """UPDATE Visitor SET prisoner_id=%s, first_name=%s, last_name=%s,
+                  relationship=%s, visit_date=%s, visit_time=%s WHERE visitor_id=%s"""
+
+        with self.db.cursor() as cursor:
+            before = self.read_existing(cursor, "Visitor", visitor_id)
+            self.check_prisoner(cursor, values[0])
+            # Only a visit moved to another prisoner, day or time needs a new place in the room
+            old, new = audit.changes(before, audit.image("Visitor", values))
+            if {"prisoner_id", "visit_date", "visit_time"} & set(new) and scheduling.is_bookable(values[4]):
+                scheduling.check_booking(self.db, cursor, values[0], values[4], values[5], visitor_id)
+            cursor.execute(query, values + [visitor_id])
+        self.services.audit.record("Visitor", visitor_id, before, audit.image("Visitor", values))
+        self.services.visit_index.forget(values[4], before["visit_date"])
+        self.services.profile_cache.invalidate(values[0], before["prisoner_id"])
+        return Written(visitor_id, self.get(visitor_id), {})
+
+    def delete(self, visitor_id):
+        # Soft delete; archive.py moves the row out of the table later
+        query = "UPDATE Visitor SET deleted_at=%s WHERE visitor_id=%s AND deleted_at IS NULL"
+
+        with self.db.cursor() as cursor:
+            before = self.read_existing(cursor, "Visitor", visitor_id)
+            cursor.execute(query, (datetime.now().replace(microsecond=0), visitor_id))
+            if cursor.rowcount == 0:
+                raise ValueError("Visitor was already deleted")
+        self.services.audit.record("Visitor", visitor_id, before, None)
+        self.services.visit_index.forget(before["visit_date"])
+        self.services.profile_cache.invalidate(before["prisoner_id"])
+        return Written(visitor_id, [], {})
+
+    def free_slots(self, start_date, prisoner_id=None, days=7):
+        """Free visiting room places for days from start_date, in the prisoner's block or in every block"""
+        block = None
+        if prisoner_id is not None:
+            with self.db.cursor() as cursor:
+                block = scheduling.prisoner_block(cursor, prisoner_id)
+        return self.services.visit_index.free_slots(start_date, start_date + timedelta(days=days - 1), block)
+
+
+class StaffService(Service):
+    def list(self):
+        """Every staff member, through the staff cache"""
+        return [format_row(row, (4, 7)) for row in self.services.staff_cache.all()]
+
+    def get(self, staff_id, fresh=False):
+        """The staff member as listed; fresh reads past the cache"""
+        if fresh:
+            self.services.staff_cache.invalidate(staff_id)
+        row = self.services.staff_cache.get(staff_id)
+        return [format_row(row, (4, 7))] if row else []
+
+    def add(self, record):
+        values = records.clean_staff(record)
+        query = """INSERT INTO Staff (first_name, last_name, gender, date_of_birth,
+                  role, salary, hire_date) VALUES (%s, %s, %s, %s, %s, %s, %s)"""
+
+        staff_id = self.db.execute(query, values)
+        self.services.audit.record("Staff", staff_id, None, audit.image("Staff", values))
+        self.services.staff_cache.invalidate(staff_id)
+        return Written(staff_id, self.get(staff_id), {})
+
+    def update(self, staff_id, record, version):
+        """Save a staff member loaded at row_version version; StaleRecordError if it changed since"""
+        values = records.clean_staff(record)
+        # Only applies if nobody saved the staff member since the form was loaded
+        query = """UPDATE Staff SET first_name=%s, last_name=%s, gender=%s, date_of_birth=%s,
+                  role=%s, salary=%s, hire_date=%s, row_version=row_version+1
+                  WHERE staff_id=%s AND row_version=%s"""
+
+        with self.db.cursor() as cursor:
+            before = audit.read_row(self.db, cursor, "Staff", staff_id)
+            cursor.execute(query, values + [staff_id, version])
+            concurrency.check_updated(self.db, cursor, "Staff", staff_id, audit.image("Staff", values))
+        self.services.audit.record("Staff", staff_id, before, audit.image("Staff", values))
+        self.services.staff_cache.invalidate(staff_id)
+        self.services.profile_cache.invalidate()
+        return Written(staff_id, self.get(staff_id), {})
+
+    def delete(self, staff_id):
+        if self.db.fetchone("SELECT COUNT(*) FROM IncidentReport WHERE staff_id=%s", (staff_id,))[0] > 0:
+            raise ValueError("Cannot delete staff member referenced in incidents!")
+        if self.db.fetchone("SELECT COUNT(*) FROM MedicalRecord WHERE doctor_id=%s", (staff_id,))[0] > 0:
+            raise ValueError("Cannot delete doctor referenced in medical records!")
+
+        with self.db.cursor() as cursor:
+            before = self.read_existing(cursor, "Staff", staff_id)
+            cursor.execute("DELETE FROM Staff WHERE staff_id=%s", (staff_id,))
+        self.services.audit.record("Staff", staff_id, before, None)
+        self.services.staff_cache.invalidate(staff_id)
+        self.services.profile_cache.invalidate()
+        return Written(staff_id, [], {})
+
+
+class IncidentService(PagedService):
+    QUERY = """SELECT i.report_id, i.prisoner_id, p.first_name, p.last_name, i.staff_id,
+               s.first_name, s.last_name, i.incident_description, i.incident_date
+               FROM IncidentReport i
+               LEFT JOIN Prisoner p ON p.prisoner_id = i.prisoner_id
+               LEFT JOIN Staff s ON s.staff_id = i.staff_id"""
+    PRIMARY_KEY = "i.report_id"
+
+    def format_rows(self, rows):
+        return [format_row(merge_names(row, 2, 5), (6,)) for row in rows]
+
+    def add(self, record):
+        values = records.clean_incident(record)
+        query = """INSERT INTO IncidentReport (prisoner_id, staff_id, incident_date,
+                  incident_description) VALUES (%s, %s, %s, %s)"""
+
+        with self.db.cursor() as cursor:
+            self.check_prisoner(cursor, values[0])
+            cursor.execute(query, values)
+            report_id = cursor.lastrowid
+        self.services.audit.record("IncidentReport", report_id, None, audit.image("IncidentReport", values))
+        self.services.profile_cache.invalidate(values[0])
+        self.services.text_search.index("IncidentReport", report_id, values[0], values[3])
+        self.services.dashboard.incident_changed(None, values[2])
+        return Written(report_id, self.get(report_id), {})
+
+    def update(self, report_id, record):
+        values = records.clean_incident(record)
+        query = """UPDATE IncidentReport SET prisoner_id=%s, staff_id=%s,
+                incident_date=%s, incident_description=%s WHERE report_id=%s"""
+
+        with self.db.cursor() as cursor:
+            before = self.read_existing(cursor, "IncidentReport", report_id)
+            self.check_prisoner(cursor, values[0])
+            cursor.execute(query, values + [report_id])
+        self.services.audit.record("IncidentReport", report_id, before, audit.image("IncidentReport", values))
+        self.services.profile_cache.invalidate(values[0], before["prisoner_id"])
+        self.services.text_search.index("IncidentReport", report_id, values[0], values[3])
+        self.services.dashboard.incident_changed(before["incident_date"], values[2])
+        return Written(report_id, self.get(report_id), {})
+
+    def delete(self, report_id):
+        with self.db.cursor() as cursor:
+            before = self.read_existing(cursor, "IncidentReport", report_id)
+            cursor.execute("DELETE FROM IncidentReport WHERE report_id=%s", (report_id,))
+        self.services.audit.record("IncidentReport", report_id, before, None)
+        self.services.profile_cache.invalidate(before["prisoner_id"])
+        self.services.text_search.remove("IncidentReport", report_id)
+        self.services.dashboard.incident_changed(before["incident_date"], None)
+        return Written(report_id, [], {})
+
+
+class MedicalService(PagedService):
+    QUERY = """SELECT m.medical_id, m.prisoner_id, p.first_name, p.last_name, m.diagnosis,
+               m.treatment, m.date_of_examination, m.doctor_id, d.first_name, d.last_name
+               FROM MedicalRecord m
+               LEFT JOIN Prisoner p ON p.prisoner_id = m.prisoner_id
+               LEFT JOIN Staff d ON d.staff_id = m.doctor_id"""
+    PRIMARY_KEY = "m.medical_id"
+
+    def format_rows(self, rows):
+        return [format_row(merge_names(row, 2, 8), (5,)) for row in rows]
+
+    def add(self, record):
+        values = records.clean_medical(record)
+        query = """INSERT INTO MedicalRecord (prisoner_id, doctor_id, date_of_examination,
+                  diagnosis, treatment) VALUES (%s, %s, %s, %s, %s)"""
+
+        with self.db.cursor() as cursor:
+            self.check_prisoner(cursor, values[0])
+            cursor.execute(query, values)
+            medical_id = cursor.lastrowid
+        self.services.audit.record("MedicalRecord", medical_id, None, audit.image("MedicalRecord", values))
+        self.services.profile_cache.invalidate(values[0])
+        self.services.text_search.index("MedicalRecord", medical_id, values[0],
+                                        search.join_text(values[3], values[4]))
+        self.services.dashboard.exam_changed(None, values[1])
+        return Written(medical_id, self.get(medical_id), {})
+
+    def update(self, medical_id, record):
+        values = records.clean_medical(record)
+        query = """UPDATE MedicalRecord SET prisoner_id=%s, doctor_id=%s,
+                date_of_examination=%s, diagnosis=%s, treatment=%s WHERE medical_id=%s"""
+
+        with self.db.cursor() as cursor:
+            before = self.read_existing(cursor, "MedicalRecord", medical_id)
+            self.check_prisoner(cursor, values[0])
+            cursor.execute(query, values + [medical_id])
+        self.services.audit.record("MedicalRecord", medical_id, before, audit.image("MedicalRecord", values))
+        self.services.profile_cache.invalidate(values[0], before["prisoner_id"])
+        self.services.text_search.index("MedicalRecord", medical_id, values[0],
+                                        search.join_text(values[3], values[4]))
+        self.services.dashboard.exam_changed(before["doctor_id"], values[1])
+        return Written(medical_id, self.get(medical_id), {})
+
+    def delete(self, medical_id):
+        with self.db.cursor() as cursor:
+            before = self.read_existing(cursor, "MedicalRecord", medical_id)
+            cursor.execute("DELETE FROM MedicalRecord WHERE medical_id=%s", (medical_id,))
+        self.services.audit.record("MedicalRecord", medical_id, before, None)
+        self.services.profile_cache.invalidate(before["prisoner_id"])
+        self.services.text_search.remove("MedicalRecord", medical_id)
+        self.services.dashboard.exam_changed(before["doctor_id"], None)
+        return Written(medical_id, [], {})
+
+
+class Services:
+    """The entity services and the in-memory state they share, over one database"""
+    def __init__(self, db, user=None):
+        self.db = db
+
+        # Who changed what, written in batches off the write path
+        self.audit = audit.AuditWriter(db, user=user)
+        self.text_search = search.open_text_search(db)
+        self.allocator = allocation.CellAllocator(db)
+
+        # Prisoner profiles, dropped whenever one of their records is written
+        self.profile_cache = cache.LoaderCache(
+            lambda prisoner_id: prisoner_profile.load_profile(db, prisoner_id), max_entries=500)
+
+        # KPIs for the Dashboard tab, kept up to date by the writes
+        self.dashboard = dashboard.Dashboard(db)
+
+        # Visits per day and slot, for the free slots view
+        self.visit_index = scheduling.VisitIndex(db)
+
+        # Lookup tables served from memory; the writes invalidate them
+        self.cell_cache = cache.TableCache(
+            db, "Cell", "cell_id", ["cell_id", "cell_number", "capacity", "current_occupancy", "block_number"])
+        self.staff_cache = cache.TableCache(
+            db, "Staff", "staff_id",
+            ["staff_id", "first_name", "last_name", "gender", "date_of_birth", "role", "salary", "hire_date",
+             "row_version"])
+
+        self.prisoners = PrisonerService(self)
+        self.cells = CellService(self)
+        self.visitors = VisitorService(self)
+        self.staff = StaffService(self)
+        self.incidents = IncidentService(self)
+        self.medical = MedicalService(self)
+
+    def dashboard_snapshot(self, rebuild=False):
+        """(Dashboard.snapshot(), {doctor_id: staff row}), building the metrics first if needed"""
+        if rebuild or not self.dashboard.is_built():
+            self.dashboard.rebuild()
+        snapshot = self.dashboard.snapshot()
+        doctors = self.staff_cache.get_many(doctor_id for doctor_id, count in snapshot['exams'])
+        return snapshot, doctors
+
+    def search(self, text, page=0):
+        """One page of full-text search hits"""
+        return self.text_search.search(text, limit=search.RESULTS_PER_PAGE,
+                                       offset=page * search.RESULTS_PER_PAGE)
+
+    def import_file(self, kind, path, allocate=False):
+        """Import a prisoners or visitors file, see importer.py, and drop everything it may have changed
+
+        With allocate, incarcerated prisoners without a cell are given free ones.
+        """
+        result = importer.import_file(self.db, kind, path, allocator=self.allocator if allocate else None,
+                                      user=self.audit.user)
+        self.text_search.invalidate()
+        self.allocator.invalidate()
+        self.cell_cache.invalidate()
+        self.profile_cache.invalidate()
+        self.visit_index.forget(*result.visit_dates)
+        self.dashboard.invalidate()
+        return result
+
+    def export(self, key, path, conditions=(), params=()):
+        """Export a table to CSV/Parquet, see exporter.py; returns the row count"""
+        return exporter.export_table(self.db, key, path, conditions, params)
+
+    def close(self):
+        """Write out the queued audit entries"""
+        self.audit.close()
@@ -0,0 +1,53 @@
+"""CellAllocator placement, reservations and upkeep from writes"""
+import pytest
+
+import allocation
+import occupancy
+from conftest import add_cell, prisoner
+
+
+def test_allocate_fills_the_emptiest_cells_first(db, services):
+    small = add_cell(services, "A1", capacity=1)
+    large = add_cell(services, "A2", capacity=3)
+    other = add_cell(services, "B1", capacity=2, block="B")
+    allocator = allocation.CellAllocator(db)
+
+    assert allocator.free_beds() == 6
+    assert allocator.free_beds("A") == 4
+    assert allocator.best_cell() == large
+    assert allocator.allocate(2, block="A") == [large, large]
+    # Ties go to the lower cell id
+    assert allocator.best_cell("A") == small
+    assert allocator.allocate(3) == [other, other, small]
+    assert allocator.free_beds() == 1
+
+
+def test_allocate_reserves_nothing_when_short(db, services):
+    add_cell(services, "A1", capacity=2)
+    add_cell(services, "B1", capacity=1, block="B")
+    allocator = allocation.CellAllocator(db)
+    with pytest.raises(occupancy.CellFullError, match="Only 2 free beds in block A, 3 needed"):
+        allocator.allocate(3, block="A")
+    assert allocator.free_beds() == 3
+
+    cells = allocator.allocate(3)
+    assert allocator.best_cell() is None
+    allocator.release(cells[:1])
+    assert allocator.best_cell() == cells[0]
+
+
+def test_suggest_cell_follows_the_writes(services):
+    near = add_cell(services, "A1", capacity=1)
+    spare = add_cell(services, "A2", capacity=1)
+    elsewhere = add_cell(services, "B1", capacity=1, block="B")
+    assert services.prisoners.suggest_cell(near) in (near, spare)
+
+    services.prisoners.add(prisoner("Ann", cell_id=near))
+    assert services.prisoners.suggest_cell(near) == spare
+    services.prisoners.add(prisoner("Bea", cell_id=spare))
+    assert services.prisoners.suggest_cell(near) == elsewhere
+    services.prisoners.add(prisoner("Cat", cell_id=elsewhere))
+    assert services.prisoners.suggest_cell(near) is None
+
+    services.cells.update(spare, dict(cell_number="A2", capacity=2, block_number="A"))
+    assert services.prisoners.suggest_cell(near) == spare
@@ -0,0 +1,72 @@
+from datetime import date
+
+import pytest
+
+import archive
+from conftest import add_cell, occupancy_of, prisoner, visit
+
+
+def test_soft_delete_then_archive(db, services):
+    cell = add_cell(services)
+    ann = services.prisoners.add(prisoner(cell_id=cell)).key
+    services.visitors.add(visit(ann))
+
+    services.prisoners.delete(ann)
+    assert occupancy_of(db, cell) == 0
+    assert services.prisoners.get(ann) == []
+    with pytest.raises(ValueError):
+        services.prisoners.delete(ann)
+
+    assert archive.run(db, date(2000, 1, 1), user="test") == (0, 1)
+    assert db.fetchone("SELECT COUNT(*) FROM Prisoner")[0] == 0
+    assert db.fetchone("SELECT COUNT(*) FROM VisitorArchive WHERE prisoner_id=%s", (ann,))[0] == 1
+    assert [row[0] for row in archive.find_archived(db, "Tes")] == [ann]
+    assert db.fetchone("""SELECT COUNT(*) FROM AuditLog WHERE action='ARCHIVE'
+                          AND table_name='Prisoner' AND row_id=%s""", (str(ann),))[0] == 1
+
+
+def test_deleted_visit_is_hidden_and_archived(db, services):
+    cell = add_cell(services)
+    ann = services.prisoners.add(prisoner(cell_id=cell)).key
+    bob = services.visitors.add(visit(ann)).key
+
+    services.visitors.delete(bob)
+    assert services.visitors.get(bob) == []
+    with pytest.raises(ValueError):
+        services.visitors.delete(bob)
+    assert archive.run(db, date(2000, 1, 1), user="test") == (1, 0)
+    assert db.fetchone("SELECT COUNT(*) FROM VisitorHistory WHERE visitor_id=%s", (bob,))[0] == 1
+
+
+def test_deleted_prisoner_cannot_be_edited_or_referenced(db, services):
+    cell = add_cell(services, capacity=2)
+    ann = services.prisoners.add(prisoner(cell_id=cell)).key
+    services.prisoners.add(prisoner("Cat", cell_id=cell))
+    services.prisoners.delete(ann)
+    assert occupancy_of(db, cell) == 1
+
+    with pytest.raises(ValueError, match="Prisoner was deleted"):
+        services.prisoners.update(ann, prisoner(status="Released", cell_id=cell), 1)
+    # The bed given back at delete time is not given back again
+    assert occupancy_of(db, cell) == 1
+
+    with pytest.raises(ValueError):
+        services.incidents.add(dict(prisoner_id=ann, incident_date="2024-01-01", incident_description="Fight"))
+    with pytest.raises(ValueError):
+        services.medical.add(dict(prisoner_id=ann, date_of_examination="2024-01-01", diagnosis="Flu"))
+    with pytest.raises(ValueError):
+        services.visitors.add(visit(ann))
+    assert db.fetchone("SELECT COUNT(*) FROM IncidentReport")[0] == 0
+    assert db.fetchone("SELECT COUNT(*) FROM MedicalRecord")[0] == 0
+
+
+def test_records_cannot_be_moved_to_a_deleted_prisoner(db, services):
+    ann = services.prisoners.add(prisoner()).key
+    cat = services.prisoners.add(prisoner("Cat")).key
+    report = dict(prisoner_id=ann, incident_date="2024-01-01", incident_description="Fight")
+    report_id = services.incidents.add(report).key
+    services.prisoners.delete(cat)
+
+    with pytest.raises(ValueError):
+        services.incidents.update(report_id, dict(report, prisoner_id=cat))
+    assert db.fetchone("SELECT prisoner_id FROM IncidentReport WHERE report_id=%s", (report_id,))[0] == ann
@@ -0,0 +1,60 @@
+"""Audit entries from the writes, and the AuditWriter queue behind them"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+import audit
+from conftest import prisoner
+
+
+class FlakyDb:
+    """Fails the first transactions, then passes them to db"""
+    def __init__(self, db, failures):
+        self.db = db
+        self.failures = failures
+
+    def cursor(self):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("server has gone away")
+        return self.db.cursor()
+
+
+def actions(db, table, key):
+    return [(action, before, after) for changed_at, changed_by, action, before, after
+            in audit.history(db, table, key)]
+
+
+def test_writes_are_recorded_with_the_changed_columns(db, services):
+    ann = services.prisoners.add(prisoner("Ann")).key
+    services.prisoners.update(ann, prisoner("Ann"), 0)
+    services.prisoners.update(ann, prisoner("Ann", crime_committed="Fraud"), 1)
+    services.prisoners.delete(ann)
+    services.audit.flush()
+
+    entries = actions(db, "Prisoner", ann)
+    assert [action for action, before, after in entries] == ["INSERT", "UPDATE", "DELETE"]
+    assert entries[0][2]["first_name"] == "Ann" and "cell_id" not in entries[0][2]
+    assert entries[1][1:] == ({"crime_committed": "Theft"}, {"crime_committed": "Fraud"})
+    assert entries[2][2] == {}
+    assert audit.history(db, "Prisoner", ann)[0][1] == "test"
+
+
+def test_changes_compares_values_as_stored():
+    before = {"salary": Decimal("100.00"), "hire_date": date(2020, 1, 2), "visit_time": timedelta(hours=9),
+              "role": "Guard", "note": None}
+    after = {"salary": 100.0, "hire_date": "2020-01-02", "visit_time": "09:00", "role": "Warden", "note": ""}
+    assert audit.changes(before, after) == ({"role": "Guard"}, {"role": "Warden"})
+    assert audit.changes(None, {"role": "Guard", "note": None}) == ({}, {"role": "Guard"})
+
+
+def test_writer_retries_a_failed_batch_and_drains_on_close(db, monkeypatch):
+    monkeypatch.setattr(audit, "RETRY_SECONDS", 0)
+    writer = audit.AuditWriter(FlakyDb(db, failures=2), user="clerk", batch_size=2)
+    for key in range(5):
+        writer.record("Cell", key, None, {"cell_number": f"A{key}"})
+    writer.close()
+
+    assert not writer.thread.is_alive()
+    assert isinstance(writer.last_error, ConnectionError)
+    assert db.fetchall("SELECT row_id, changed_by, action FROM AuditLog ORDER BY audit_id") == [
+        (str(key), "clerk", "INSERT") for key in range(5)]
@@ -0,0 +1,42 @@
+"""benchmark.py's scenarios as a pytest-benchmark suite
+
+Each scenario runs against a copy of the small datagen.py dataset, the
+same one benchmark.py uses. Compare runs with pytest-benchmark's own
+options, e.g.:
+
+    python -m pytest test_benchmark.py --benchmark-autosave
+    python -m pytest test_benchmark.py --benchmark-compare --benchmark-compare-fail=median:25%
+
+python -m pytest --benchmark-skip leaves them out of a normal test run.
+"""
+import os
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import database  # noqa: E402
+from benchmark import SCENARIOS, Context, prepare_dataset  # noqa: E402
+
+ROUNDS = 20
+SEED = 0
+
+
+@pytest.fixture(scope="module")
+def context():
+    path = prepare_dataset('small', SEED)
+    db = database.connect(f"sqlite:///{path}")
+    context = Context(db, SEED)
+    yield context
+    context.close()
+    db.close()
+    os.remove(path)
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS, ids=[scenario.name for scenario in SCENARIOS])
+def test_scenario(benchmark, context, scenario):
+    # One extra argument for the warm-up round
+    arguments = iter(scenario.setup(context, ROUNDS + 1) if scenario.setup else [None] * (ROUNDS + 1))
+    rows = benchmark.pedantic(scenario.run, setup=lambda: ((context, next(arguments)), {}),
+                              rounds=ROUNDS, warmup_rounds=1)
+    assert rows >= 0
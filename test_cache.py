@@ -0,0 +1,123 @@
+"""TableCache and LoaderCache expiry, LRU bound and write invalidation"""
+import pytest
+
+import cache
+from conftest import add_cell
+
+
+class CountingDb:
+    """Passes queries through to db, counting them; during(query) runs before each one"""
+    def __init__(self, db):
+        self.db = db
+        self.queries = 0
+        self.during = None
+
+    def fetchall(self, query, params=()):
+        self.queries += 1
+        if self.during is not None:
+            self.during()
+        return self.db.fetchall(query, params)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return clock
+
+
+def cell_cache(db, **options):
+    return cache.TableCache(db, "Cell", "cell_id", ["cell_id", "cell_number"], **options)
+
+
+def test_rows_are_read_once_until_they_expire(db, services, clock):
+    a1, a2 = add_cell(services, "A1"), add_cell(services, "A2")
+    counting = CountingDb(db)
+    cells = cell_cache(counting, ttl=60)
+
+    assert cells.all() == [(a1, "A1"), (a2, "A2")]
+    assert cells.get(a1) == (a1, "A1")
+    assert cells.get_many([a1, a2, None]) == {a1: (a1, "A1"), a2: (a2, "A2")}
+    assert counting.queries == 1
+
+    clock.now += 61
+    assert cells.get(a2) == (a2, "A2")
+    assert cells.all() == [(a1, "A1"), (a2, "A2")]
+    assert counting.queries == 3
+
+
+def test_invalidate_rereads_only_the_written_keys(db, services, clock):
+    a1, a2 = add_cell(services, "A1"), add_cell(services, "A2")
+    counting = CountingDb(db)
+    cells = cell_cache(counting)
+    cells.all()
+
+    db.execute("UPDATE Cell SET cell_number='A9' WHERE cell_id=%s", (a1,))
+    db.execute("DELETE FROM Cell WHERE cell_id=%s", (a2,))
+    assert cells.get(a1) == (a1, "A1")
+    cells.invalidate(a1, a2)
+    assert cells.all() == [(a1, "A9")]
+    assert cells.get(a2) is None
+    assert counting.queries == 3
+
+    cells.invalidate()
+    cells.all()
+    assert counting.queries == 4
+
+
+def test_least_recently_used_rows_are_dropped(db, services, clock):
+    a1, a2, a3 = add_cell(services, "A1"), add_cell(services, "A2"), add_cell(services, "A3")
+    counting = CountingDb(db)
+    cells = cell_cache(counting, max_entries=2)
+
+    # The table no longer fits, so all() reads it in full each time
+    assert len(cells.all()) == 3
+    assert len(cells.all()) == 3
+    assert counting.queries == 2
+
+    cells.get(a2)
+    cells.get(a3)
+    assert counting.queries == 2
+    cells.get(a1)
+    assert counting.queries == 3
+    cells.get(a3)
+    assert counting.queries == 3
+    cells.get(a2)
+    assert counting.queries == 4
+
+
+def test_a_read_that_races_a_write_is_not_cached(db, services, clock):
+    a1 = add_cell(services, "A1")
+    counting = CountingDb(db)
+    cells = cell_cache(counting)
+    counting.during = lambda: cells.invalidate(a1)
+    assert cells.get(a1) == (a1, "A1")
+    counting.during = None
+    cells.get(a1)
+    cells.get(a1)
+    assert counting.queries == 2
+
+
+def test_loader_cache_expires_and_invalidates(clock):
+    loads = []
+    values = cache.LoaderCache(lambda key: loads.append(key) or key * 2, ttl=60, max_entries=2)
+    assert [values.get(1), values.get(1), values.get(2)] == [2, 2, 4]
+    assert loads == [1, 2]
+
+    values.invalidate(1)
+    values.get(1)
+    values.get(3)
+    values.get(2)
+    assert loads == [1, 2, 1, 3, 2]
+
+    clock.now += 61
+    values.get(3)
+    assert loads == [1, 2, 1, 3, 2, 3]
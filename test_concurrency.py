@@ -0,0 +1,35 @@
+import pytest
+
+import concurrency
+from conftest import prisoner
+
+
+def staff(**changes):
+    record = dict(first_name="Eve", last_name="Guard", gender="Female", date_of_birth="1980-01-01",
+                  role="Guard", salary="30000", hire_date="2010-01-01")
+    record.update(changes)
+    return record
+
+
+def test_stale_edit_is_refused(db, services):
+    ann = services.prisoners.add(prisoner()).key
+    services.prisoners.update(ann, prisoner(crime_committed="Fraud"), 0)
+
+    with pytest.raises(concurrency.StaleRecordError) as error:
+        services.prisoners.update(ann, prisoner(crime_committed="Arson"), 0)
+    assert error.value.version == 1
+    assert ("crime_committed", "Fraud", "Arson") in error.value.differences()
+    assert db.fetchone("SELECT crime_committed FROM Prisoner WHERE prisoner_id=%s", (ann,))[0] == "Fraud"
+
+
+def test_stale_staff_edit_is_refused_and_the_current_version_wins(db, services):
+    eve = services.staff.add(staff()).key
+    services.staff.update(eve, staff(role="Warden"), 0)
+
+    with pytest.raises(concurrency.StaleRecordError) as error:
+        services.staff.update(eve, staff(salary="35000"), 0)
+    assert error.value.current["role"] == "Warden"
+
+    services.staff.update(eve, staff(role="Warden", salary="35000"), error.value.version)
+    row = db.fetchone("SELECT role, salary, row_version FROM Staff WHERE staff_id=%s", (eve,))
+    assert row == ("Warden", 35000, 2)
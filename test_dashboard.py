@@ -0,0 +1,58 @@
+from datetime import date
+
+import dashboard
+from conftest import add_cell, prisoner
+
+
+def test_writes_apply_deltas_without_a_rebuild(db, services):
+    cell = add_cell(services, capacity=3)
+    snapshot, doctors = services.dashboard_snapshot()
+    assert snapshot['headcount'] == []
+    built_at = snapshot['built_at']
+
+    ann = services.prisoners.add(prisoner(cell_id=cell)).key
+    services.prisoners.add(prisoner("Cat", status="Released"))
+    services.incidents.add(dict(prisoner_id=ann, incident_date=date.today(), incident_description="Fight"))
+    services.cells.add(dict(cell_number="B1", capacity=2, block_number="B"))
+
+    snapshot, doctors = services.dashboard_snapshot()
+    assert snapshot['built_at'] == built_at
+    assert snapshot['headcount'] == [("Incarcerated", 1), ("Released", 1)]
+    assert snapshot['occupancy'] == [("A", 1, 3), ("B", 0, 2)]
+    assert snapshot['incidents'][0] == (dashboard.week_of(date.today()), 1)
+
+    services.prisoners.delete(ann)
+    assert services.dashboard_snapshot()[0]['headcount'] == [("Released", 1)]
+    assert services.dashboard_snapshot(rebuild=True)[0]['headcount'] == [("Released", 1)]
+
+
+class RacingDatabase:
+    """Applies a delta, as a write on another thread would, during the first read of a rebuild"""
+    def __init__(self, db, board):
+        self.db = db
+        self.board = board
+        self.reads = 0
+
+    def fetchall(self, query, params=()):
+        self.reads += 1
+        if self.reads == 1:
+            self.db.execute("""INSERT INTO Prisoner (first_name, last_name, gender, date_of_birth,
+                               date_of_incarceration, crime_committed, status) VALUES ('Ann', 'Test',
+                               'Female', '1990-01-01', '2020-01-01', 'Theft', 'Incarcerated')""")
+            self.board.prisoner_changed(None, "Incarcerated")
+        return self.db.fetchall(query, params)
+
+
+def test_rebuild_discards_counts_read_during_a_delta(db):
+    board = dashboard.Dashboard(None)
+    board.db = RacingDatabase(db, board)
+
+    assert board.rebuild()
+    # The first read raced the write and was thrown away; the second read counted it once
+    assert board.db.reads == 8
+    assert board.snapshot()['headcount'] == [("Incarcerated", 1)]
+
+
+def test_week_of_labels_iso_weeks():
+    assert dashboard.week_of("2026-02-16") == "2026-W08"
+    assert dashboard.week_of(date(2021, 1, 3)) == "2020-W53"
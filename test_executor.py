@@ -0,0 +1,70 @@
+"""QueryExecutor results, cancellation and loading state"""
+import threading
+import time
+
+from executor import QueryExecutor
+
+
+class FakeRoot:
+    """The part of the Tk root the executor uses; poll() runs the scheduled drain"""
+    def __init__(self):
+        self.scheduled = []
+        self.errors = []
+
+    def after(self, ms, callback):
+        self.scheduled.append(callback)
+
+    def report_callback_exception(self, kind, error, traceback):
+        self.errors.append(error)
+
+    def poll(self):
+        callbacks, self.scheduled = self.scheduled, []
+        for callback in callbacks:
+            callback()
+
+
+def finish(executor, root, tab):
+    """Poll until the tab's work has all been handed back"""
+    deadline = time.monotonic() + 5
+    while executor.is_busy(tab) and time.monotonic() < deadline:
+        time.sleep(0.01)
+        root.poll()
+
+
+def test_results_and_errors_reach_their_callbacks_on_poll():
+    root = FakeRoot()
+    busy = []
+    executor = QueryExecutor(root, on_busy=lambda tab, is_busy: busy.append((tab, is_busy)))
+    results, errors = [], []
+    executor.submit('cells', lambda: 3, results.append, errors.append)
+    executor.submit('cells', lambda: 1 / 0, results.append, errors.append)
+    assert executor.is_busy('cells')
+    finish(executor, root, 'cells')
+    assert results == [3]
+    assert [type(error) for error in errors] == [ZeroDivisionError]
+    assert busy == [('cells', True), ('cells', False)]
+    assert not executor.is_busy('cells')
+
+    executor.submit('cells', lambda: 1 / 0, results.append)
+    finish(executor, root, 'cells')
+    assert [type(error) for error in root.errors] == [ZeroDivisionError]
+    executor.shutdown(wait=True)
+
+
+def test_cancel_drops_cancellable_results_but_not_writes():
+    root = FakeRoot()
+    executor = QueryExecutor(root, workers=1)
+    release = threading.Event()
+    results = []
+    executor.submit('staff', lambda: release.wait() and "old list", results.append)
+    queued = executor.submit('staff', lambda: "queued list", results.append)
+    executor.submit('staff', lambda: "written", results.append, cancellable=False)
+    assert executor.cancel('staff')
+    assert queued.cancelled()
+    executor.submit('staff', lambda: "new list", results.append)
+    release.set()
+    finish(executor, root, 'staff')
+    assert results == ["written", "new list"]
+    assert not executor.is_busy('staff')
+    assert not executor.cancel('staff')
+    executor.shutdown(wait=True)
@@ -0,0 +1,48 @@
+import csv
+from datetime import time, timedelta
+
+import pytest
+
+import exporter
+from conftest import add_cell, prisoner, visit
+
+
+def test_visit_times_are_written_as_hh_mm(db, services, tmp_path):
+    cell = add_cell(services)
+    ann = services.prisoners.add(prisoner(cell_id=cell)).key
+    services.visitors.add(visit(ann, "9:05"))
+    services.visitors.delete(services.visitors.add(visit(ann, "10:00")).key)
+
+    path = tmp_path / "visits.csv"
+    assert exporter.export_table(db, 'visitor', str(path)) == 1
+    with open(path, newline='') as f:
+        assert [row['visit_time'] for row in csv.DictReader(f)] == ["09:05"]
+
+
+def test_hh_mm_reads_mysql_and_sqlite_times():
+    assert exporter.hh_mm(timedelta(hours=9, minutes=5)) == "09:05"
+    assert exporter.hh_mm(time(14, 30)) == "14:30"
+    assert exporter.hh_mm("16:00") == "16:00"
+    assert exporter.hh_mm(None) is None
+
+
+def test_filtered_export_in_chunks(db, services, tmp_path):
+    for name in ("Ann", "Cat", "Dee"):
+        services.prisoners.add(prisoner(name, status="Released"))
+    progress = []
+
+    path = tmp_path / "prisoners.csv"
+    assert exporter.export_table(db, 'prisoner', str(path), ["first_name <> %s"], ["Cat"],
+                                 chunk_size=1, on_progress=progress.append) == 2
+    assert progress == [1, 2]
+
+
+def test_parquet_export(db, services, tmp_path):
+    pyarrow = pytest.importorskip("pyarrow.parquet")
+    cell = add_cell(services)
+    ann = services.prisoners.add(prisoner(cell_id=cell)).key
+    services.visitors.add(visit(ann, "09:30"))
+
+    path = tmp_path / "visits.parquet"
+    assert exporter.export_table(db, 'visitor', str(path)) == 1
+    assert pyarrow.read_table(path).column('visit_time').to_pylist() == ["09:30"]
@@ -0,0 +1,45 @@
+import csv
+
+import database
+import exporter
+import importer
+import migrations
+from conftest import add_cell, occupancy_of, prisoner
+
+
+def test_import_export_round_trip(db, services, tmp_path):
+    for name in ("Ann", "Cat", "Dee"):
+        services.prisoners.add(prisoner(name, status="Released"))
+    exported = tmp_path / "prisoners.csv"
+    assert exporter.export_table(db, 'prisoner', str(exported)) == 3
+
+    copy = database.connect(f"sqlite:///{tmp_path / 'copy.db'}")
+    try:
+        migrations.migrate(copy)
+        result = importer.import_file(copy, 'prisoners', str(exported), user="test")
+        assert (result.inserted, result.rejects) == (3, [])
+        reexported = tmp_path / "copy.csv"
+        assert exporter.export_table(copy, 'prisoner', str(reexported)) == 3
+    finally:
+        copy.close()
+
+    with open(exported, newline='') as original, open(reexported, newline='') as imported:
+        assert list(csv.DictReader(imported)) == list(csv.DictReader(original))
+
+
+def test_bad_rows_are_rejected_without_losing_the_batch(db, services, tmp_path):
+    cell = add_cell(services, capacity=1)
+    path = tmp_path / "prisoners.jsonl"
+    path.write_text("\n".join([
+        '{"first_name": "Ann", "last_name": "Test", "gender": "Female", "date_of_birth": "1990-01-01",'
+        f' "date_of_incarceration": "2020-01-01", "status": "Incarcerated", "cell_id": {cell}}}',
+        '{"first_name": "Cat", "last_name": "Test", "gender": "Female", "date_of_birth": "1990-01-01",'
+        f' "date_of_incarceration": "2020-01-01", "status": "Incarcerated", "cell_id": {cell}}}',
+        '{"first_name": "", "last_name": "Test"}',
+    ]))
+
+    result = importer.import_file(db, 'prisoners', str(path), user="test")
+    assert result.inserted == 1
+    assert [line for line, error in result.rejects] == [3, 2]
+    assert occupancy_of(db, cell) == 1
+    assert db.fetchone("SELECT COUNT(*) FROM AuditLog WHERE action='IMPORT'")[0] == 1
@@ -0,0 +1,25 @@
+import database
+import migrations
+
+
+def test_migrations_apply_once(tmp_path):
+    db = database.connect(f"sqlite:///{tmp_path / 'empty.db'}")
+    try:
+        assert migrations.schema_version(db) is None
+        assert migrations.migrate(db) == list(range(9))
+        assert migrations.schema_version(db) == 8
+        assert migrations.migrate(db) == []
+    finally:
+        db.close()
+
+
+def test_migrate_stops_at_target_and_resumes(tmp_path):
+    db = database.connect(f"sqlite:///{tmp_path / 'empty.db'}")
+    try:
+        assert migrations.migrate(db, target=4) == [0, 1, 2, 3, 4]
+        assert migrations.schema_version(db) == 4
+        assert migrations.migrate(db) == [5, 6, 7, 8]
+        # The History views of migration 8 read both the hot and the archive tables
+        assert db.fetchall("SELECT COUNT(*) FROM PrisonerHistory") == [(0,)]
+    finally:
+        db.close()
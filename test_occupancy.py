@@ -0,0 +1,40 @@
+import pytest
+
+import occupancy
+from conftest import add_cell, occupancy_of, prisoner
+
+
+def test_moves_keep_occupancy_and_refuse_full_cells(db, services):
+    small = add_cell(services, "A1", capacity=1)
+    other = add_cell(services, "A2", capacity=1)
+    ann = services.prisoners.add(prisoner(cell_id=small)).key
+    assert occupancy_of(db, small) == 1
+
+    with pytest.raises(occupancy.CellFullError):
+        services.prisoners.add(prisoner("Cat", cell_id=small))
+    assert db.fetchone("SELECT COUNT(*) FROM Prisoner")[0] == 1
+
+    services.prisoners.update(ann, prisoner(cell_id=other), 0)
+    assert (occupancy_of(db, small), occupancy_of(db, other)) == (0, 1)
+
+    services.prisoners.update(ann, prisoner(status="Released", cell_id=other), 1)
+    assert occupancy_of(db, other) == 0
+
+
+def test_capacity_cannot_drop_below_occupants(db, services):
+    cell = add_cell(services, capacity=2)
+    services.prisoners.add(prisoner(cell_id=cell))
+    services.prisoners.add(prisoner("Cat", cell_id=cell))
+
+    with pytest.raises(occupancy.CellFullError):
+        services.cells.update(cell, dict(cell_number="A1", capacity=1, block_number="A"))
+    assert db.fetchone("SELECT capacity FROM Cell WHERE cell_id=%s", (cell,))[0] == 2
+
+
+def test_reconcile_recounts_from_prisoners(db, services):
+    cell = add_cell(services, capacity=1)
+    services.prisoners.add(prisoner(cell_id=cell))
+    db.execute("UPDATE Cell SET current_occupancy=3 WHERE cell_id=%s", (cell,))
+
+    assert occupancy.reconcile(db) == []
+    assert occupancy_of(db, cell) == 1
@@ -0,0 +1,145 @@
+import pytest
+
+import search
+from conftest import prisoner
+
+pytest.importorskip("tkcalendar")
+import claud  # noqa: E402
+
+
+class FakeTree:
+    """The part of ttk.Treeview the list helpers use, without a display"""
+    def __init__(self):
+        self.rows = {}
+        self.order = []
+
+    def configure(self, **options):
+        pass
+
+    def get_children(self):
+        return tuple(self.order)
+
+    def exists(self, iid):
+        return iid in self.rows
+
+    def insert(self, parent, index, iid, values):
+        self.order.insert(len(self.order) if index == 'end' else index, iid)
+        self.rows[iid] = list(values)
+
+    def item(self, iid, values):
+        self.rows[iid] = list(values)
+
+    def delete(self, *iids):
+        for iid in iids:
+            self.order.remove(iid)
+            del self.rows[iid]
+
+    def yview(self):
+        return (0.0, 1.0)
+
+    def yview_moveto(self, fraction):
+        pass
+
+
+def run_now(work, on_success, on_failure, cancellable):
+    try:
+        rows = work()
+    except Exception as e:
+        on_failure(e)
+    else:
+        on_success(rows)
+
+
+def fetch_keys(count):
+    """fetch_page over rows (key, name) for keys 1..count"""
+    keys = list(range(1, count + 1))
+
+    def fetch_page(after=None, before=None, limit=None):
+        if before is not None:
+            return [(key, f"row {key}") for key in keys if key < before][-limit:]
+        return [(key, f"row {key}") for key in keys if after is None or key > after][:limit]
+    return fetch_page
+
+
+def keys_of(tree):
+    return [int(iid) for iid in tree.get_children()]
+
+
+def test_scrolling_pages_through_a_bounded_window():
+    tree = FakeTree()
+    pager = claud.KeysetPager(tree, fetch_keys(25), run_now, page_size=5, prefetch_rows=1, max_rows=10)
+    pager.reset()
+    assert keys_of(tree) == [1, 2, 3, 4, 5]
+    assert (pager.has_before, pager.has_after) == (False, True)
+
+    pager.on_scroll(0.0, 1.0)
+    pager.on_scroll(0.0, 1.0)
+    assert keys_of(tree) == list(range(6, 16))
+    assert (pager.has_before, pager.has_after) == (True, True)
+
+    pager.on_scroll(0.0, 0.5)
+    assert keys_of(tree) == list(range(1, 11))
+    assert (pager.has_before, pager.has_after) == (False, True)
+
+
+def test_last_page_ends_the_window_and_new_rows_are_appended():
+    tree = FakeTree()
+    pager = claud.KeysetPager(tree, fetch_keys(7), run_now, page_size=5, prefetch_rows=1)
+    pager.reset()
+    pager.patch(8, [(8, "row 8")])
+    assert keys_of(tree) == [1, 2, 3, 4, 5]
+
+    pager.on_scroll(0.0, 1.0)
+    assert keys_of(tree) == [1, 2, 3, 4, 5, 6, 7]
+    assert not pager.has_after
+    pager.patch(8, [(8, "row 8")])
+    pager.patch(3, [])
+    assert keys_of(tree) == [1, 2, 4, 5, 6, 7, 8]
+
+
+def test_a_page_from_before_a_reset_is_dropped():
+    calls = []
+    tree = FakeTree()
+    pager = claud.KeysetPager(tree, fetch_keys(25), lambda *call: calls.append(call), page_size=5)
+    pager.reset()
+    stale_rows = calls[0][0]()
+    pager.fetch_page = fetch_keys(3)
+    pager.reset()
+    calls[1][1](calls[1][0]())
+    calls[0][1](stale_rows)
+    assert keys_of(tree) == [1, 2, 3]
+
+
+def test_a_failed_page_can_be_fetched_again():
+    calls = []
+    pager = claud.KeysetPager(FakeTree(), fetch_keys(25), lambda *call: calls.append(call), page_size=5)
+    pager.reset()
+    calls[0][1](calls[0][0]())
+    calls.clear()
+    pager.on_scroll(0.0, 1.0)
+    pager.on_scroll(0.0, 1.0)
+    assert len(calls) == 1
+    calls[0][2](RuntimeError("lost connection"))
+    pager.on_scroll(0.0, 1.0)
+    assert len(calls) == 2
+
+
+def test_written_rows_leave_a_search_they_no_longer_match(db, services):
+    ann = services.prisoners.add(prisoner("Ann", last_name="Smith")).key
+    cat = services.prisoners.add(prisoner("Cat", last_name="Smithers")).key
+    conditions, params = search.prisoner_filter(name="Smith", status="Incarcerated")
+    tree = FakeTree()
+    pager = claud.KeysetPager(
+        tree, lambda **page: services.prisoners.page(conditions=conditions, params=params, **page), run_now)
+    pager.reset()
+    assert tree.get_children() == (str(ann), str(cat))
+
+    services.prisoners.update(ann, prisoner("Ann", last_name="Smith", status="Released"), 0)
+    pager.patch(ann, services.prisoners.get(ann, conditions, params))
+    dee = services.prisoners.add(prisoner("Dee", last_name="Jones")).key
+    pager.patch(dee, services.prisoners.get(dee, conditions, params))
+    assert tree.get_children() == (str(cat),)
+
+    services.prisoners.update(cat, prisoner("Cat", last_name="Smithers", crime_committed="Fraud"), 0)
+    pager.patch(cat, services.prisoners.get(cat, conditions, params))
+    assert tree.rows[str(cat)][7] == "Fraud"
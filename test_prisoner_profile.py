@@ -0,0 +1,43 @@
+"""Prisoner profiles and the cache the writes keep them fresh in"""
+import prisoner_profile
+from conftest import add_cell, prisoner, visit
+
+
+def test_profile_gathers_the_prisoner_history(db, services):
+    cell_id = add_cell(services, "A1", block="North")
+    ann = services.prisoners.add(prisoner("Ann", cell_id=cell_id)).key
+    other = services.prisoners.add(prisoner("Bea")).key
+    # Past visits, so no visiting room has to be booked
+    early = services.visitors.add(visit(ann, visit_date="2024-06-03")).key
+    late = services.visitors.add(visit(ann, visit_date="2024-06-04")).key
+    services.visitors.add(visit(other, visit_date="2024-06-03"))
+    report = services.incidents.add(dict(prisoner_id=ann, incident_date="2024-01-02",
+                                         incident_description="Fight")).key
+
+    profile = prisoner_profile.load_profile(db, ann)
+    assert profile.prisoner[2:] == ("Ann", "Test", "Incarcerated", "Theft")
+    assert profile.cell == (cell_id, None, "A1", "North", None, None)
+    assert [record[0] for record in profile.visits] == [late, early]
+    assert [(record[0], record[4]) for record in profile.incidents] == [(report, "Fight")]
+    assert profile.medical == []
+    assert prisoner_profile.load_profile(db, 999) is None
+
+
+def test_cached_profile_follows_the_writes(services):
+    ann = services.prisoners.add(prisoner("Ann")).key
+    bea = services.prisoners.add(prisoner("Bea")).key
+    assert services.prisoners.profile(ann).visits == []
+
+    visitor_id = services.visitors.add(visit(ann, visit_date="2024-06-03")).key
+    assert len(services.prisoners.profile(ann).visits) == 1
+    services.visitors.update(visitor_id, visit(bea, visit_date="2024-06-03"))
+    assert services.prisoners.profile(ann).visits == []
+    assert len(services.prisoners.profile(bea).visits) == 1
+
+    services.medical.add(dict(prisoner_id=ann, date_of_examination="2024-01-03", diagnosis="Flu"))
+    assert [record[4] for record in services.prisoners.profile(ann).medical] == ["Flu"]
+
+    services.prisoners.update(ann, prisoner("Ann", status="Released"), 0)
+    assert services.prisoners.profile(ann).prisoner[4] == "Released"
+    services.prisoners.delete(ann)
+    assert services.prisoners.profile(ann) is None
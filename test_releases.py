@@ -0,0 +1,48 @@
+"""The due release batch and the release forecast"""
+from datetime import date
+
+import audit
+import releases
+from conftest import add_cell, occupancy_of, prisoner
+
+TODAY = date(2030, 1, 10)
+
+
+def test_release_due_frees_the_beds_of_everyone_due(db, services):
+    cell_id = add_cell(services, capacity=3)
+    due = services.prisoners.add(prisoner("Ann", cell_id=cell_id, date_of_release="2030-01-10")).key
+    overdue = services.prisoners.add(prisoner("Bea", date_of_release="2030-01-01")).key
+    later = services.prisoners.add(prisoner("Cat", cell_id=cell_id, date_of_release="2030-01-11")).key
+    services.prisoners.add(prisoner("Dee", date_of_release="2029-01-01", status="Released"))
+    services.prisoners.delete(services.prisoners.add(prisoner("Eve", date_of_release="2029-01-01")).key)
+    assert occupancy_of(db, cell_id) == 2
+
+    assert [row[0] for row in releases.due_releases(db, TODAY)] == [overdue, due]
+    assert sorted(releases.release_due(db, TODAY)) == [(due, cell_id), (overdue, None)]
+    assert occupancy_of(db, cell_id) == 1
+    statuses = dict(db.fetchall("SELECT prisoner_id, status FROM Prisoner WHERE prisoner_id IN (%s, %s, %s)",
+                                (due, overdue, later)))
+    assert statuses == {due: "Released", overdue: "Released", later: "Incarcerated"}
+    assert releases.release_due(db, TODAY) == []
+
+
+def test_forecast_counts_releases_within_each_horizon(services, db):
+    for day in ("2030-01-10", "2030-01-11", "2030-02-09", "2030-02-10", "2030-04-10", "2030-04-11"):
+        services.prisoners.add(prisoner(date_of_release=day))
+    services.prisoners.add(prisoner(date_of_release="2030-01-20", status="Released"))
+    assert releases.forecast(db, TODAY) == [(30, 2), (60, 3), (90, 4)]
+
+
+def test_release_due_service_keeps_the_caches_in_step(db, services):
+    cell_id = add_cell(services)
+    ann = services.prisoners.add(prisoner("Ann", cell_id=cell_id, date_of_release="2020-01-02")).key
+    services.prisoners.profile(ann)
+    services.cells.list()
+
+    released, cells = services.prisoners.release_due()
+    assert released == [(ann, cell_id)]
+    assert cells[cell_id][0][3] == 0
+    assert services.prisoners.profile(ann).prisoner[4] == "Released"
+    services.audit.flush()
+    assert [entry[2:] for entry in audit.history(db, "Prisoner", ann)][-1] == (
+        "UPDATE", {"status": "Incarcerated"}, {"status": "Released"})
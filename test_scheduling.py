@@ -0,0 +1,71 @@
+import pytest
+
+import scheduling
+from conftest import add_cell, prisoner, visit
+
+
+def test_visiting_room_capacity(db, services):
+    cell = add_cell(services)
+    ann = services.prisoners.add(prisoner(cell_id=cell)).key
+    db.execute("INSERT INTO VisitingRoom (block_number, capacity) VALUES ('A', 1)")
+
+    services.visitors.add(visit(ann, "09:30"))
+    with pytest.raises(scheduling.SlotFullError):
+        services.visitors.add(visit(ann, "09:45"))
+    with pytest.raises(ValueError):
+        services.visitors.add(visit(ann, "12:30"))
+    services.visitors.add(visit(ann, "10:00"))
+    assert db.fetchone("SELECT COUNT(*) FROM Visitor")[0] == 2
+
+
+def test_slot_of_maps_times_to_slots():
+    assert scheduling.slot_of("09:00") == 0
+    assert scheduling.slot_of("11:59") == 2
+    assert scheduling.slot_of("14:00") == 3
+    for outside in ("08:59", "12:00", "17:00"):
+        with pytest.raises(ValueError):
+            scheduling.slot_of(outside)
+
+
+def test_editing_a_visit_only_rechecks_the_room_when_it_moves(db, services):
+    cell = add_cell(services)
+    ann = services.prisoners.add(prisoner(cell_id=cell)).key
+    db.execute("INSERT INTO VisitingRoom (block_number, capacity) VALUES ('A', 1)")
+    # Visits made before the slots existed: one out of hours, two sharing a full slot
+    for visit_time in ("08:00", "09:00", "09:15"):
+        db.execute("""INSERT INTO Visitor (prisoner_id, first_name, last_name, relationship,
+                      visit_date, visit_time) VALUES (%s, 'Bob', 'Tset', 'Brother', '2030-06-03', %s)""",
+                   (ann, visit_time))
+    early, full, _ = [row[0] for row in db.fetchall("SELECT visitor_id FROM Visitor ORDER BY visitor_id")]
+
+    services.visitors.update(early, visit(ann, "08:00"))
+    services.visitors.update(full, visit(ann, "09:00"))
+    assert db.fetchone("SELECT COUNT(*) FROM Visitor WHERE last_name='Test'")[0] == 2
+
+    with pytest.raises(scheduling.SlotFullError):
+        services.visitors.update(early, visit(ann, "09:30"))
+    with pytest.raises(ValueError):
+        services.visitors.update(full, visit(ann, "13:00"))
+
+
+def test_past_visits_are_recorded_without_a_booking(db, services):
+    ann = services.prisoners.add(prisoner(status="Released")).key
+
+    services.visitors.add(visit(ann, "08:00", "2020-06-03"))
+    with pytest.raises(ValueError):
+        services.visitors.add(visit(ann, "09:00"))
+
+
+def test_import_checks_only_upcoming_visits(db, services, tmp_path):
+    cell = add_cell(services)
+    ann = services.prisoners.add(prisoner(cell_id=cell)).key
+    db.execute("INSERT INTO VisitingRoom (block_number, capacity) VALUES ('A', 1)")
+    path = tmp_path / "visits.csv"
+    path.write_text("prisoner_id,first_name,last_name,relationship,visit_date,visit_time\n" +
+                    "".join(f"{ann},Bob,Test,Brother,{day},{visit_time}\n" for day, visit_time in [
+                        ("2020-06-03", "08:00"), ("2020-06-03", "09:00"), ("2020-06-03", "09:00"),
+                        ("2030-06-03", "09:00"), ("2030-06-03", "09:30"), ("2030-06-03", "07:00")]))
+
+    result = services.import_file('visitors', str(path))
+    assert result.inserted == 4
+    assert [line for line, error in result.rejects] == [6, 7]
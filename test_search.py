@@ -0,0 +1,70 @@
+from datetime import date
+
+import search
+from conftest import prisoner
+
+
+def test_prisoner_filter_on_sqlite(db, services):
+    services.prisoners.add(prisoner("Ann", last_name="Smith", crime_committed="Armed robbery"))
+    services.prisoners.add(prisoner("Cat", last_name="Smithers", crime_committed="Fraud", status="Released"))
+    services.prisoners.add(prisoner("Dee", last_name="Jones", crime_committed="Robbery 50%",
+                                    date_of_incarceration="2024-05-01"))
+
+    def names(**filters):
+        conditions, params = search.prisoner_filter(dialect='sqlite', **filters)
+        return [row[1] for row in services.prisoners.page(conditions=conditions, params=params)]
+
+    assert names(name="smith") == ["Ann", "Cat"]
+    assert names(name="Smith", status="Incarcerated") == ["Ann"]
+    assert names(crime="robb") == ["Ann", "Dee"]
+    assert names(crime="50%") == ["Dee"]
+    assert names(incarcerated_from=date(2024, 1, 1)) == ["Dee"]
+    assert names(name="100%_") == []
+
+
+def test_crime_uses_the_fulltext_index_on_mysql():
+    conditions, params = search.prisoner_filter(crime="armed rob", dialect='mysql')
+    assert conditions == ["MATCH(crime_committed) AGAINST (%s IN BOOLEAN MODE)"]
+    assert params == ["+armed* +rob*"]
+
+    # Boolean operators typed by the user are not passed through
+    conditions, params = search.prisoner_filter(crime='-"x" +fraud~', dialect='mysql')
+    assert params == ["+fraud*"]
+
+
+def hits(services, text, page=0):
+    return [(hit.source, hit.record_id) for hit in services.search(text, page)]
+
+
+def test_text_search_ranks_across_tables_and_follows_writes(services):
+    ann = services.prisoners.add(prisoner("Ann", crime_committed="Armed robbery")).key
+    cat = services.prisoners.add(prisoner("Cat", crime_committed="Fraud")).key
+    report = services.incidents.add(dict(prisoner_id=cat, incident_date="2024-01-02",
+                                         incident_description="Fight in the yard, robbery of a robbery")).key
+    exam = services.medical.add(dict(prisoner_id=ann, date_of_examination="2024-01-03",
+                                     diagnosis="Bruised hand", treatment="Rest")).key
+
+    assert hits(services, "robbery") == [("IncidentReport", report), ("Prisoner", ann)]
+    assert hits(services, "hand") == [("MedicalRecord", exam)]
+    assert services.search("rest")[0].text == "Bruised hand / Rest"
+    assert hits(services, "a") == []
+
+    services.prisoners.update(cat, prisoner("Cat", crime_committed="Armed fraud"), 0)
+    assert hits(services, "fraud") == [("Prisoner", cat)]
+    services.prisoners.delete(ann)
+    services.incidents.delete(report)
+    assert hits(services, "robbery") == []
+    assert hits(services, "armed") == [("Prisoner", cat)]
+
+
+def test_text_search_pages_and_rebuilds_after_invalidate(db, services, monkeypatch):
+    keys = [services.prisoners.add(prisoner(f"P{i}", crime_committed="Theft")).key for i in range(3)]
+    monkeypatch.setattr(search, "RESULTS_PER_PAGE", 2)
+    assert len(hits(services, "theft")) == 2
+    assert len(hits(services, "theft", page=1)) == 1
+
+    # Rows written behind the index's back show up once it is dropped
+    db.execute("UPDATE Prisoner SET crime_committed='Arson' WHERE prisoner_id=%s", (keys[0],))
+    assert hits(services, "arson") == []
+    services.text_search.invalidate()
+    assert hits(services, "arson") == [("Prisoner", keys[0])]
@@ -0,0 +1,43 @@
+"""PrefixIndex lookups behind the type-ahead id fields"""
+import typeahead
+from conftest import add_cell, prisoner
+
+
+def test_search_matches_either_name_or_the_id():
+    index = typeahead.PrefixIndex()
+    index.build([(1, "1 - Jane Doe", ["Jane", "Doe"]), (12, "12 - John Smith", ["John", "Smith"])])
+    assert index.search("jan") == [(1, "1 - Jane Doe")]
+    assert index.search("DOE j") == [(1, "1 - Jane Doe")]
+    assert index.search("1") == [(1, "1 - Jane Doe"), (12, "12 - John Smith")]
+    assert index.search("x") == []
+
+
+def test_each_record_is_listed_once_and_limited_to_top_k():
+    index = typeahead.PrefixIndex(top_k=2)
+    index.build([(key, f"{key} - Ann Ann", ["Ann", "Ann"]) for key in range(5)])
+    assert index.search("ann") == [(0, "0 - Ann Ann"), (1, "1 - Ann Ann")]
+    assert len(index.search("ann", limit=10)) == 5
+
+
+def test_add_replaces_and_remove_drops_a_record():
+    index = typeahead.PrefixIndex()
+    index.add(1, "1 - Jane Doe", ["Jane", "Doe"])
+    index.add(1, "1 - Jane Roe", ["Jane", "Roe"])
+    assert index.search("doe") == []
+    assert index.search("roe") == [(1, "1 - Jane Roe")]
+    assert index.label(1) == "1 - Jane Roe"
+    index.remove(1)
+    assert index.search("jane") == []
+    assert index.label(1) is None
+
+
+def test_load_skips_deleted_prisoners(db, services):
+    kept = services.prisoners.add(prisoner("Jane")).key
+    gone = services.prisoners.add(prisoner("Janet")).key
+    services.prisoners.delete(gone)
+    add_cell(services, "B7", block="North")
+    prisoners, cells = typeahead.PrefixIndex(), typeahead.PrefixIndex()
+    prisoners.load(db, 'prisoner')
+    cells.load(db, 'cell')
+    assert [key for key, label in prisoners.search("jane")] == [kept]
+    assert [label for key, label in cells.search("north")] == ["1 - B7 (Block North)"]
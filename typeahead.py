@@ -0,0 +1,125 @@
+"""In-memory prefix search behind the type-ahead foreign key fields
+
+PrefixIndex keeps a sorted list of (search key, id) pairs. Each record is
+filed under every rotation of its name ("jane doe", "doe jane") and its
+id, so a lookup is one bisect plus a scan of at most a few entries per
+match, with no query per keystroke. The app loads the indexes once in the
+background and keeps them warm from its own writes.
+"""
+import bisect
+import threading
+
+TOP_K = 20
+LOAD_CHUNK = 10000
+
+
+def person_record(row):
+    """(id, label, search terms) for a Prisoner or Staff row starting id, first name, last name"""
+    key, first_name, last_name = row[0], row[1], row[2]
+    return key, f"{key} - {first_name} {last_name}", [first_name, last_name]
+
+
+def cell_record(row):
+    """(id, label, search terms) for a Cell row as shown in the Cells tab"""
+    key, cell_number, block_number = row[0], row[1], row[4]
+    return key, f"{key} - {cell_number} (Block {block_number})", [cell_number, block_number]
+
+
+# kind -> (query, record function)
+LOOKUPS = {
+    'prisoner': ("SELECT prisoner_id, first_name, last_name FROM Prisoner WHERE deleted_at IS NULL",
+                 person_record),
+    'staff': ("SELECT staff_id, first_name, last_name FROM Staff", person_record),
+    'cell': ("SELECT cell_id, cell_number, capacity, current_occupancy, block_number FROM Cell",
+             cell_record),
+}
+
+
+def normalize(text):
+    return " ".join(str(text).lower().split())
+
+
+class PrefixIndex:
+    def __init__(self, top_k=TOP_K):
+        self.top_k = top_k
+        self.lock = threading.Lock()
+        # Sorted (search key, id) pairs
+        self.entries = []
+        # id -> (label, search keys)
+        self.labels = {}
+
+    def load(self, db, kind):
+        """Build the index for a LOOKUPS kind, streaming the rows from db"""
+        query, record = LOOKUPS[kind]
+        records = []
+        with db.cursor() as cursor:
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(LOAD_CHUNK)
+                if not rows:
+                    break
+                records.extend(record(row) for row in rows)
+        self.build(records)
+
+    def build(self, records):
+        """Replace the contents with (id, label, search terms) records"""
+        entries = []
+        labels = {}
+        for key, label, terms in records:
+            search_keys = self._search_keys(key, terms)
+            labels[key] = (label, search_keys)
+            entries.extend((search_key, key) for search_key in search_keys)
+        entries.sort()
+        with self.lock:
+            self.entries = entries
+            self.labels = labels
+
+    def add(self, key, label, terms):
+        """Add a record, or replace it after an update"""
+        with self.lock:
+            self._remove(key)
+            search_keys = self._search_keys(key, terms)
+            self.labels[key] = (label, search_keys)
+            for search_key in search_keys:
+                bisect.insort(self.entries, (search_key, key))
+
+    def remove(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def label(self, key):
+        with self.lock:
+            entry = self.labels.get(key)
+        return entry[0] if entry else None
+
+    def search(self, text, limit=None):
+        """Up to limit (id, label) pairs whose name or id starts with text"""
+        prefix = normalize(text)
+        limit = limit or self.top_k
+        found = []
+        with self.lock:
+            i = bisect.bisect_left(self.entries, (prefix,))
+            while i < len(self.entries) and len(found) < limit:
+                search_key, key = self.entries[i]
+                if not search_key.startswith(prefix):
+                    break
+                if key not in found:
+                    found.append(key)
+                i += 1
+            return [(key, self.labels[key][0]) for key in found]
+
+    def _search_keys(self, key, terms):
+        terms = [normalize(term) for term in terms if term]
+        search_keys = {str(key)}
+        for i in range(len(terms)):
+            search_keys.add(" ".join(terms[i:] + terms[:i]))
+        return sorted(search_keys)
+
+    def _remove(self, key):
+        entry = self.labels.pop(key, None)
+        if entry is None:
+            return
+        for search_key in entry[1]:
+            i = bisect.bisect_left(self.entries, (search_key, key))
+            if i < len(self.entries) and self.entries[i] == (search_key, key):
+                del self.entries[i]